@@ -6,6 +6,13 @@ from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_login import LoginManager
 import locale
+from services.db_engine import (
+    RoutingSession,
+    apply_engine_profile,
+    engine_options,
+    init_replica_routing,
+    replica_binds,
+)
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -21,7 +28,7 @@ class Base(DeclarativeBase):
     pass
 
 
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={"class_": RoutingSession})
 # create the app
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev_secret_key")
@@ -33,14 +40,17 @@ app.wsgi_app = ProxyFix(
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get(
     "DATABASE_URL", "sqlite:///finance_assistant.db"
 )
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
+# Pool, timeouts and pragmas depend on the database and deployment
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(
+    app.config["SQLALCHEMY_DATABASE_URI"]
+)
+# Read-only pages may be served from a streaming replica
+app.config["SQLALCHEMY_BINDS"] = replica_binds()
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
 # Initialize the app with the extension
 db.init_app(app)
+init_replica_routing(app, db)
 
 # Setup Login Manager
 login_manager = LoginManager()
@@ -90,6 +100,9 @@ def format_number(value):
 
 
 with app.app_context():
+    for engine in db.engines.values():
+        apply_engine_profile(engine)
+
     # Import models
     from models import (
         User,
@@ -98,10 +111,19 @@ with app.app_context():
         Category,
         Recommendation,
         SavingsGoal,
+        MerchantCategoryOverride,
+        SyncJob,
+        DailySpendingRollup,
+        MonthlySpendingSummary,
     )
 
-    # Create database tables
-    db.create_all()
+    # Keep spending rollups in step with ORM writes to transactions
+    import services.spending_rollup  # noqa: F401
+
+    # Create or upgrade the database schema
+    from services.migrations import upgrade as upgrade_schema
+
+    upgrade_schema()
 
     # Initialize categories
     from services.transaction_analyzer import init_categories
@@ -121,6 +143,11 @@ with app.app_context():
     app.register_blueprint(banks_bp)
     app.register_blueprint(savings_bp)
 
+    # Register CLI commands
+    from commands import register_commands
+
+    register_commands(app)
+
     # User loader for flask_login
     @login_manager.user_loader
     def load_user(user_id):
@@ -0,0 +1,97 @@
+"""
+Benchmark transaction categorization throughput.
+
+Compares the original per-call categorizer (init_categories, keyword scan and
+a Category lookup on every call) with the compiled KeywordCategorizer.
+
+Usage:
+    python benchmarks/bench_categorize.py [--rows 1k|100k|10m] [--seed 42]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app import app  # noqa: E402
+from models import Category  # noqa: E402
+from services.synthetic_data import (  # noqa: E402
+    generate_transactions,
+    parse_dataset_size,
+)
+from services.transaction_analyzer import (  # noqa: E402
+    CATEGORY_KEYWORDS,
+    categorize_transaction,
+    init_categories,
+)
+
+
+def legacy_categorize_transaction(description, merchant):
+    """Categorizer as it was before the compiled matcher"""
+    init_categories()
+    text = f"{description} {merchant}".lower()
+
+    income_keywords = ["зачисление", "перевод от"]
+    if any(keyword in text for keyword in income_keywords):
+        income_category = Category.query.filter_by(name="Доход").first()
+        if income_category:
+            return income_category.id
+
+    for category_name, keywords in CATEGORY_KEYWORDS.items():
+        if any(keyword.lower() in text for keyword in keywords):
+            category = Category.query.filter_by(name=category_name).first()
+            if category:
+                return category.id
+
+    other_category = Category.query.filter_by(name="Другое").first()
+    if other_category:
+        return other_category.id
+    return None
+
+
+def build_rows(count, seed):
+    rows = []
+    for chunk in generate_transactions(count, seed=seed):
+        rows.extend(zip(chunk["description"], chunk["merchant"]))
+    return rows
+
+
+def measure(func, rows):
+    start = time.perf_counter()
+    results = [func(description, merchant) for description, merchant in rows]
+    elapsed = time.perf_counter() - start
+    return results, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=parse_dataset_size, default="100k")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with app.app_context():
+        init_categories()
+        rows = build_rows(args.rows, args.seed)
+
+        legacy, legacy_elapsed = measure(legacy_categorize_transaction, rows)
+        compiled, compiled_elapsed = measure(categorize_transaction, rows)
+
+        changed = sum(1 for old, new in zip(legacy, compiled) if old != new)
+        print(f"rows:      {len(rows)}")
+        print(
+            f"legacy:    {legacy_elapsed:8.2f}s  "
+            f"{len(rows) / legacy_elapsed:12,.0f} tx/s"
+        )
+        print(
+            f"compiled:  {compiled_elapsed:8.2f}s  "
+            f"{len(rows) / compiled_elapsed:12,.0f} tx/s"
+        )
+        print(f"speedup:   {legacy_elapsed / compiled_elapsed:8.1f}x")
+        print(f"differing: {changed} rows")
+
+
+if __name__ == "__main__":
+    main()
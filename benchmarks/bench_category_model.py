@@ -0,0 +1,77 @@
+"""
+Benchmark the hashed n-gram category model.
+
+Trains on sample transactions labelled by the keyword matcher, saves and
+memory-maps the weights, then measures batch prediction throughput.
+
+Usage:
+    python benchmarks/bench_category_model.py [--train 50000] [--rows 1000000]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app import app  # noqa: E402,F401
+from services.category_model import CategoryModel, train_category_model  # noqa: E402
+from services.synthetic_data import (  # noqa: E402
+    generate_transactions,
+    parse_dataset_size,
+)
+from services.transaction_analyzer import (  # noqa: E402
+    OTHER_CATEGORY,
+    get_categorizer,
+    normalize_text,
+)
+
+
+def build_texts(count, seed):
+    texts = []
+    for chunk in generate_transactions(count, seed=seed):
+        texts.extend(
+            normalize_text(f"{description} {merchant}")
+            for description, merchant in zip(chunk["description"], chunk["merchant"])
+        )
+    return texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--train", type=parse_dataset_size, default=50_000)
+    parser.add_argument("--rows", type=parse_dataset_size, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    categorizer = get_categorizer()
+    train_texts = build_texts(args.train, args.seed)
+    train_labels = [categorizer.match(text) or OTHER_CATEGORY for text in train_texts]
+
+    start = time.perf_counter()
+    model = train_category_model(train_texts, train_labels, epochs=5)
+    print(f"train:    {time.perf_counter() - start:8.2f}s on {len(train_texts)} rows")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "category_model.npy")
+        model.save(path)
+        mapped = CategoryModel.load(path)
+
+        texts = build_texts(args.rows, args.seed + 1)
+        start = time.perf_counter()
+        names, confidences = mapped.predict(texts)
+        elapsed = time.perf_counter() - start
+
+    expected = [categorizer.match(text) or OTHER_CATEGORY for text in texts]
+    agreement = sum(1 for a, b in zip(names, expected) if a == b) / len(texts)
+    print(f"predict:  {elapsed:8.2f}s for {len(texts)} rows")
+    print(f"rate:     {len(texts) / elapsed * 60:12,.0f} descriptions/minute")
+    print(f"agrees with keywords: {agreement:.2%}")
+    print(f"mean confidence:      {confidences.mean():.3f}")
+
+
+if __name__ == "__main__":
+    main()
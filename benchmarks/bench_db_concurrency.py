@@ -0,0 +1,179 @@
+"""
+Benchmark dashboard read latency on SQLite while a sync writes.
+
+A writer process imports transactions in batches, each batch a transaction
+that also updates the spending rollup, like a bank sync. Meanwhile this
+process runs the dashboard's reads in a loop and records their latency.
+This runs twice, on separate database files: once with the previous engine
+setup (rollback journal, synchronous=FULL) and once with the SQLite profile
+from services.db_engine (WAL, synchronous=NORMAL, mmap, busy timeout).
+
+Usage:
+    python benchmarks/bench_db_concurrency.py [--rows 100000] [--batches 200]
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# The app itself is not used; models are bound to the engines created here
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine, func, insert, select  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from app import db  # noqa: E402
+from models import DailySpendingRollup, Transaction  # noqa: E402
+from services.db_engine import apply_engine_profile, engine_options  # noqa: E402
+from services.spending_rollup import (  # noqa: E402
+    apply_rollup_deltas,
+    rebuild_daily_rollup,
+    rebuild_monthly_summary,
+    rollup_deltas,
+)
+
+PROFILES = ["legacy", "tuned"]
+USERS = 20
+NOW = datetime(2024, 6, 30, 12)
+
+
+def make_engine(url, profile):
+    if profile == "legacy":
+        engine = create_engine(url, pool_recycle=300, pool_pre_ping=True)
+        with engine.connect() as connection:
+            connection.exec_driver_sql("PRAGMA journal_mode=DELETE")
+        return engine
+    engine = create_engine(url, **engine_options(url))
+    apply_engine_profile(engine)
+    return engine
+
+
+def make_rows(count, rng):
+    rows = []
+    for _ in range(count):
+        user_id = rng.randint(1, USERS)
+        rows.append(
+            {
+                "account_id": user_id,
+                "user_id": user_id,
+                "amount": round(rng.lognormvariate(6, 1), 2),
+                "currency": "RUB",
+                "description": f"Покупка {rng.randint(1, 500)}",
+                "transaction_date": NOW - timedelta(minutes=rng.randint(0, 525600)),
+                "merchant": "",
+                "category_id": rng.randint(1, 12),
+                "is_expense": rng.random() < 0.9,
+            }
+        )
+    return rows
+
+
+def prepare(url, profile, rows, seed):
+    engine = make_engine(url, profile)
+    db.metadata.create_all(engine)
+    rng = random.Random(seed)
+    with engine.begin() as connection:
+        for start in range(0, rows, 10_000):
+            batch = make_rows(min(10_000, rows - start), rng)
+            connection.execute(insert(Transaction.__table__), batch)
+        rebuild_daily_rollup(bind=connection)
+        rebuild_monthly_summary(bind=connection)
+    engine.dispose()
+
+
+def write(url, profile, batches, batch_size, pause, seed):
+    """The sync: one transaction per batch, rollup included"""
+    engine = make_engine(url, profile)
+    rng = random.Random(seed + 1)
+    for _ in range(batches):
+        rows = make_rows(batch_size, rng)
+        with engine.begin() as connection:
+            connection.execute(insert(Transaction.__table__), rows)
+            apply_rollup_deltas(rollup_deltas(rows), bind=connection)
+        time.sleep(pause)
+    engine.dispose()
+
+
+def dashboard_reads(connection, user_id):
+    """The dashboard's queries for one user"""
+    connection.execute(
+        select(Transaction.id, Transaction.amount, Transaction.description)
+        .where(Transaction.user_id == user_id)
+        .order_by(Transaction.transaction_date.desc())
+        .limit(5)
+    ).all()
+    connection.execute(
+        select(DailySpendingRollup.category_id, func.sum(DailySpendingRollup.total))
+        .where(DailySpendingRollup.user_id == user_id)
+        .where(DailySpendingRollup.is_expense == True)
+        .where(DailySpendingRollup.day >= (NOW - timedelta(days=30)).date())
+        .group_by(DailySpendingRollup.category_id)
+    ).all()
+
+
+def measure(url, profile, args):
+    engine = make_engine(url, profile)
+    context = multiprocessing.get_context("spawn")
+    writer = context.Process(
+        target=write,
+        args=(url, profile, args.batches, args.batch_size, args.pause_ms / 1000, 1),
+    )
+    latencies = []
+    errors = 0
+    rng = random.Random(2)
+    start = time.perf_counter()
+    writer.start()
+    while writer.is_alive():
+        began = time.perf_counter()
+        try:
+            with engine.connect() as connection:
+                dashboard_reads(connection, rng.randint(1, USERS))
+            latencies.append(time.perf_counter() - began)
+        except OperationalError:
+            errors += 1
+    writer.join()
+    elapsed = time.perf_counter() - start
+    engine.dispose()
+
+    latencies.sort()
+    quantile = lambda q: latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+    print(
+        f"  {profile:<8}{len(latencies):8d} reads{errors:6d} errors  "
+        f"p50 {quantile(0.5) * 1000:7.2f} ms  p95 {quantile(0.95) * 1000:7.2f} ms  "
+        f"p99 {quantile(0.99) * 1000:7.2f} ms  max {latencies[-1] * 1000:8.2f} ms  "
+        f"mean {statistics.mean(latencies) * 1000:6.2f} ms  "
+        f"sync {elapsed:5.1f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--batches", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--pause-ms", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(
+        f"{args.rows} stored transactions, sync of {args.batches} batches "
+        f"x {args.batch_size} rows"
+    )
+    for profile in PROFILES:
+        path = os.path.join(ROOT, "instance", f"bench_db_concurrency_{profile}.db")
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        url = f"sqlite:///{path}"
+        prepare(url, profile, args.rows, args.seed)
+        measure(url, profile, args)
+
+
+if __name__ == "__main__":
+    main()
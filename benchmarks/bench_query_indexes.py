@@ -0,0 +1,209 @@
+"""
+Benchmark the dashboard and transaction list queries before and after the
+query indexes (migrations 0004 and 0005).
+
+Loads a synthetic dataset into a database file without those indexes,
+prints each query's plan and median time, builds the indexes declared on
+the models and repeats. The dataset is kept between runs, so a 10m load is
+only paid once; point DATABASE_URL at PostgreSQL to measure it there.
+
+Usage:
+    python benchmarks/bench_query_indexes.py [--rows 10m] [--repeat 5]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault(
+    "DATABASE_URL",
+    f"sqlite:///{os.path.join(ROOT, 'instance', 'bench_query_indexes.db')}",
+)
+
+from sqlalchemy import desc, func, text  # noqa: E402
+from app import app, db  # noqa: E402
+from models import (  # noqa: E402
+    BankAccount,
+    Category,
+    DailySpendingRollup,
+    Transaction,
+)
+from services.migrations import Migrator  # noqa: E402
+from services.synthetic_data import (  # noqa: E402
+    SYNTHETIC_BANK_NAME,
+    generate_transactions,
+    load_into_database,
+    parse_dataset_size,
+)
+from services.transaction_analyzer import init_categories  # noqa: E402
+
+INDEXES = [
+    ("ix_bank_account_user_id", "bank_account"),
+    ("ix_transaction_user_date", "transaction"),
+    ("ix_transaction_account_date", "transaction"),
+    ("ix_transaction_user_category_date", "transaction"),
+    ("ix_transaction_expense_user_date", "transaction"),
+]
+
+
+def hot_queries(user_id, account_id, category_id, now):
+    """
+    The queries behind /dashboard and /transactions for one user
+
+    The rollup entries are what the dashboard runs now; the raw dashboard
+    queries are kept for comparison.
+    """
+    user_transactions = Transaction.query.filter_by(user_id=user_id)
+    return {
+        "dashboard latest": user_transactions.order_by(
+            Transaction.transaction_date.desc()
+        ).limit(5),
+        "dashboard categories 30d": (
+            db.session.query(Category.name, func.sum(Transaction.amount))
+            .join(Transaction, Transaction.category_id == Category.id)
+            .filter(Transaction.user_id == user_id)
+            .filter(Transaction.is_expense == True)
+            .filter(Transaction.transaction_date >= now - timedelta(days=30))
+            .group_by(Category.name)
+            .order_by(func.sum(Transaction.amount).desc())
+        ),
+        "dashboard daily 7d": (
+            db.session.query(
+                func.date(Transaction.transaction_date),
+                func.sum(Transaction.amount),
+            )
+            .filter(Transaction.user_id == user_id)
+            .filter(Transaction.is_expense == True)
+            .filter(Transaction.transaction_date >= now - timedelta(days=7))
+            .group_by(func.date(Transaction.transaction_date))
+            .order_by(func.date(Transaction.transaction_date))
+        ),
+        "rollup categories 30d": (
+            db.session.query(Category.name, func.sum(DailySpendingRollup.total))
+            .join(DailySpendingRollup, DailySpendingRollup.category_id == Category.id)
+            .filter(DailySpendingRollup.user_id == user_id)
+            .filter(DailySpendingRollup.is_expense == True)
+            .filter(DailySpendingRollup.day >= (now - timedelta(days=30)).date())
+            .group_by(Category.name)
+            .order_by(func.sum(DailySpendingRollup.total).desc())
+        ),
+        "rollup daily 7d": (
+            db.session.query(
+                DailySpendingRollup.day, func.sum(DailySpendingRollup.total)
+            )
+            .filter(DailySpendingRollup.user_id == user_id)
+            .filter(DailySpendingRollup.is_expense == True)
+            .filter(DailySpendingRollup.day >= (now - timedelta(days=7)).date())
+            .group_by(DailySpendingRollup.day)
+            .order_by(DailySpendingRollup.day)
+        ),
+        "list account, month": user_transactions.filter(
+            Transaction.account_id == account_id,
+            Transaction.transaction_date >= now - timedelta(days=30),
+        ).order_by(desc(Transaction.transaction_date)),
+        "list category": user_transactions.filter(
+            Transaction.category_id == category_id
+        ).order_by(desc(Transaction.transaction_date)),
+    }
+
+
+def explain(query):
+    sql = query.statement.compile(
+        dialect=db.engine.dialect, compile_kwargs={"literal_binds": True}
+    )
+    if db.engine.dialect.name == "sqlite":
+        rows = db.session.execute(text(f"EXPLAIN QUERY PLAN {sql}"))
+        return [row[3] for row in rows]
+    return list(db.session.execute(text(f"EXPLAIN {sql}")).scalars())
+
+
+def measure(queries, repeat):
+    for name, query in queries.items():
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows = query.all()
+            times.append(time.perf_counter() - start)
+        print(
+            f"  {name:<26}{statistics.median(times) * 1000:10.1f} ms "
+            f"({len(rows)} rows)"
+        )
+        for line in explain(query):
+            print(f"      {line}")
+
+
+def analyze():
+    db.session.execute(text("ANALYZE"))
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=parse_dataset_size, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with app.app_context():
+        print(f"database:     {db.engine.url.render_as_string(hide_password=True)}")
+        with db.engine.begin() as connection:
+            migrator = Migrator(connection)
+            for name, table_name in INDEXES:
+                migrator.drop_index(name, table_name)
+
+        stored = Transaction.query.count()
+        if stored < args.rows:
+            init_categories()
+            start = time.perf_counter()
+            chunks = generate_transactions(args.rows, seed=args.seed, users=args.users)
+            load_into_database(chunks, seed=args.seed, users=args.users)
+            print(f"load:         {time.perf_counter() - start:8.1f}s")
+        stored = Transaction.query.count()
+        print(f"transactions: {stored}")
+
+        # The busiest synthetic user, its busiest account and category
+        account_id, user_id = (
+            db.session.query(Transaction.account_id, BankAccount.user_id)
+            .join(BankAccount)
+            .filter(BankAccount.bank_name == SYNTHETIC_BANK_NAME)
+            .group_by(Transaction.account_id, BankAccount.user_id)
+            .order_by(func.count().desc())
+            .first()
+        )
+        category_id = (
+            db.session.query(Transaction.category_id)
+            .filter(Transaction.account_id == account_id)
+            .group_by(Transaction.category_id)
+            .order_by(func.count().desc())
+            .limit(1)
+            .scalar()
+        )
+        now = db.session.query(func.max(Transaction.transaction_date)).scalar()
+        queries = hot_queries(user_id, account_id, category_id, now)
+
+        analyze()
+        print("\nbefore:")
+        measure(queries, args.repeat)
+
+        names = {name for name, _ in INDEXES}
+        start = time.perf_counter()
+        with db.engine.begin() as connection:
+            for table in (BankAccount.__table__, Transaction.__table__):
+                for index in table.indexes:
+                    if index.name in names:
+                        index.create(connection, checkfirst=True)
+        print(f"\nindex build:  {time.perf_counter() - start:8.1f}s")
+        analyze()
+
+        print("\nafter:")
+        measure(queries, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
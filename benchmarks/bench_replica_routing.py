@@ -0,0 +1,145 @@
+"""
+Benchmark how read replica routing splits load between the databases.
+
+Replays a mix of page views (dashboard, transaction list) and category
+edits for synthetic users through the app and counts the statements and
+time spent on the primary and on the replica engine. The primary's share
+of the work should fall roughly with the share of reads; reads right after
+a user's own edit stay on the primary (REPLICA_STICKY_SECONDS) and are
+reported separately, since replaying requests back to back makes them far
+more frequent than with real users.
+
+REPLICA_DATABASE_URL defaults to DATABASE_URL, so both engines reach the
+same database; point it at a second PostgreSQL fed by streaming
+replication for a real primary/replica pair.
+
+Usage:
+    python benchmarks/bench_replica_routing.py [--requests 2000] [--write-share 0.1]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault(
+    "DATABASE_URL",
+    f"sqlite:///{os.path.join(ROOT, 'instance', 'bench_replica_routing.db')}",
+)
+os.environ.setdefault("REPLICA_DATABASE_URL", os.environ["DATABASE_URL"])
+os.environ.setdefault("REPLICA_STICKY_SECONDS", "2")
+
+from sqlalchemy import event, func, select  # noqa: E402
+from app import app, db  # noqa: E402
+from models import BankAccount, Category, Transaction  # noqa: E402
+from services.db_engine import REPLICA_BIND_KEY  # noqa: E402
+from services.synthetic_data import (  # noqa: E402
+    SYNTHETIC_BANK_NAME,
+    generate_transactions,
+    load_into_database,
+)
+from services.transaction_analyzer import init_categories  # noqa: E402
+
+READ_PAGES = ["/dashboard", "/transactions"]
+
+
+def count_statements(engine, counts, times, name):
+    def before(conn, cursor, statement, parameters, context, executemany):
+        context._bench_started = time.perf_counter()
+
+    def after(conn, cursor, statement, parameters, context, executemany):
+        counts[name] += 1
+        times[name] += time.perf_counter() - context._bench_started
+
+    event.listen(engine, "before_cursor_execute", before)
+    event.listen(engine, "after_cursor_execute", after)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--write-share", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with app.app_context():
+        primary = db.engines[None]
+        replica = db.engines[REPLICA_BIND_KEY]
+        print(f"primary: {primary.url.render_as_string(hide_password=True)}")
+        print(f"replica: {replica.url.render_as_string(hide_password=True)}")
+
+        init_categories()
+        stored = Transaction.query.count()
+        if stored < args.rows:
+            chunks = generate_transactions(args.rows, seed=args.seed, users=args.users)
+            load_into_database(chunks, seed=args.seed, users=args.users)
+        user_ids = list(
+            db.session.execute(
+                select(BankAccount.user_id)
+                .where(BankAccount.bank_name == SYNTHETIC_BANK_NAME)
+                .distinct()
+            ).scalars()
+        )
+        transaction_ids = dict(
+            db.session.execute(
+                select(Transaction.user_id, func.max(Transaction.id))
+                .where(Transaction.user_id.in_(user_ids))
+                .group_by(Transaction.user_id)
+            ).all()
+        )
+        category_ids = list(db.session.execute(select(Category.id)).scalars())
+        db.session.remove()
+
+    clients = {}
+    for user_id in user_ids:
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session["_user_id"] = str(user_id)
+        clients[user_id] = client
+
+    counts, times = Counter(), Counter()
+    count_statements(primary, counts, times, "primary")
+    count_statements(replica, counts, times, "replica")
+
+    rng = random.Random(args.seed)
+    requests = Counter()
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        user_id = rng.choice(user_ids)
+        client = clients[user_id]
+        if rng.random() < args.write_share:
+            client.post(
+                f"/transactions/{transaction_ids[user_id]}/update_category",
+                data={"category_id": rng.choice(category_ids)},
+            )
+            requests["write"] += 1
+        else:
+            served = counts["replica"]
+            client.get(rng.choice(READ_PAGES))
+            requests["read"] += 1
+            if counts["replica"] == served:
+                requests["pinned"] += 1
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"{requests['read']} reads ({requests['pinned']} kept on the primary "
+        f"after the user's write), {requests['write']} writes "
+        f"in {elapsed:.1f}s ({args.requests / elapsed:.0f} req/s)"
+    )
+    total_count = sum(counts.values()) or 1
+    total_time = sum(times.values()) or 1
+    for name in ("primary", "replica"):
+        print(
+            f"  {name:<8}{counts[name]:8d} statements ({counts[name] / total_count:5.1%})"
+            f"{times[name]:8.2f}s in the database ({times[name] / total_time:5.1%})"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark importing a large bank statement.
+
+Writes a synthetic dataset as a semicolon-separated, cp1251-encoded CSV
+statement like the ones Russian internet banks export, then imports it into
+one account through the same path as the upload form (streaming parse, batch
+categorization, bulk load). The import is run twice to show that re-importing inserts nothing.
+
+Usage:
+    python benchmarks/bench_statement_import.py [--rows 200000] [--seed 42]
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app import app, db  # noqa: E402
+from models import BankAccount, Transaction, User  # noqa: E402
+from services.statement_import import import_statement  # noqa: E402
+from services.synthetic_data import (  # noqa: E402
+    generate_transactions,
+    parse_dataset_size,
+)
+from services.transaction_analyzer import init_categories  # noqa: E402
+
+
+def make_statement(rows, seed):
+    """A bank CSV export of a synthetic dataset, all rows on one account"""
+    buffer = io.StringIO()
+    buffer.write("Дата операции;Сумма;Валюта;Описание;Контрагент;Номер операции\n")
+    for chunk in generate_transactions(rows, seed=seed):
+        amount = chunk["amount"].where(~chunk["is_expense"], -chunk["amount"])
+        pd.DataFrame(
+            {
+                "date": chunk["transaction_date"].dt.strftime("%d.%m.%Y %H:%M"),
+                "amount": amount.map("{:.2f}".format).str.replace(".", ","),
+                "currency": chunk["currency"],
+                "description": chunk["description"],
+                "merchant": chunk["merchant"],
+                "reference": chunk["external_id"],
+            }
+        ).to_csv(buffer, sep=";", header=False, index=False)
+    return buffer.getvalue().encode("cp1251")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=parse_dataset_size, default=200_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    data = make_statement(args.rows, args.seed)
+    print(f"statement:    {len(data) / 1e6:.1f} MB, {args.rows} rows")
+
+    with app.app_context():
+        db.create_all()
+        init_categories()
+        user = User(username="bench", email="bench@example.com", password_hash="-")
+        db.session.add(user)
+        db.session.flush()
+        account = BankAccount(
+            user_id=user.id,
+            bank_name="Выписка",
+            account_number="40817810000000000000",
+            account_type="Выписка",
+        )
+        db.session.add(account)
+        db.session.commit()
+
+        for run in ("first", "repeat"):
+            start = time.perf_counter()
+            stats = import_statement(account, io.BytesIO(data), "statement.csv")
+            db.session.commit()
+            elapsed = time.perf_counter() - start
+            print(
+                f"{run + ' import:':<14}{elapsed:8.2f}s "
+                f"({stats['rows'] / elapsed:,.0f} rows/s, "
+                f"{stats['imported']} new)"
+            )
+
+        print(f"stored:       {Transaction.query.count()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark the bank sync pipeline over HTTP against the mock bank server.
+
+Syncs the history of many accounts through the live Tinkoff adapter, so the
+pooled client, pagination, retries, categorization and ingestion are all
+exercised. The mock server runs in-process unless --url points at one started
+separately (python mock_bank_server.py), which keeps it off this process's GIL.
+
+Usage:
+    python benchmarks/bench_sync.py [--accounts 50] [--days 90] [--latency-ms 50]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app import app, db  # noqa: E402
+from models import BankAccount, Transaction, User  # noqa: E402
+from mock_bank_server import MockBank, make_server  # noqa: E402
+from services.bank_adapters import get_adapter  # noqa: E402
+from services.bank_api import sync_accounts_transactions  # noqa: E402
+from services.transaction_analyzer import init_categories  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--accounts", type=int, default=50)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--transactions-per-day", type=int, default=3)
+    parser.add_argument("--url", help="Base URL of an external mock bank server")
+    args = parser.parse_args()
+
+    mock = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        mock = MockBank(
+            latency_ms=args.latency_ms,
+            error_rate=args.error_rate,
+            page_size=args.page_size,
+            history_days=args.days,
+            transactions_per_day=args.transactions_per_day,
+        )
+        server = make_server(mock, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+
+    adapter = get_adapter("tinkoff")
+    adapter.live = True
+    adapter.base_url = f"{base_url}/tinkoff"
+
+    with app.app_context():
+        db.create_all()
+        init_categories()
+        user = User(username="bench", email="bench@example.com", password_hash="-")
+        db.session.add(user)
+        db.session.flush()
+        accounts = [
+            BankAccount(
+                user_id=user.id,
+                bank_name="tinkoff",
+                account_number=f"tinkoff-40817810{i:012d}",
+                account_type="Дебетовая карта",
+            )
+            for i in range(args.accounts)
+        ]
+        db.session.add_all(accounts)
+        db.session.commit()
+
+        start = time.perf_counter()
+        count = sync_accounts_transactions(
+            "tinkoff", "bench-token", accounts, args.days
+        )
+        elapsed = time.perf_counter() - start
+
+        print(f"accounts:     {args.accounts}")
+        print(f"transactions: {count} ({Transaction.query.count()} stored)")
+        print(f"elapsed:      {elapsed:8.2f}s")
+        print(f"throughput:   {count / elapsed:12,.0f} tx/s")
+        if mock:
+            print(f"requests:     {mock.requests} ({mock.errors} injected errors)")
+
+
+if __name__ == "__main__":
+    main()
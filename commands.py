@@ -0,0 +1,218 @@
+import logging
+import os
+import click
+from flask.cli import with_appcontext
+from app import db
+from models import Category, Transaction
+
+logger = logging.getLogger(__name__)
+
+
+@click.command("train-category-model")
+@click.option(
+    "--output",
+    default=lambda: os.environ.get(
+        "CATEGORY_MODEL_PATH", "instance/category_model.npy"
+    ),
+    help="Where to write the model weights (.npy).",
+)
+@click.option("--epochs", default=10, show_default=True)
+@click.option("--min-rows", default=100, show_default=True)
+@with_appcontext
+def train_category_model_command(output, epochs, min_rows):
+    """Train the category model from already-categorized transactions."""
+    from services.category_model import train_category_model
+    from services.transaction_analyzer import OTHER_CATEGORY, normalize_text
+
+    rows = (
+        db.session.query(Transaction.description, Transaction.merchant, Category.name)
+        .join(Category, Category.id == Transaction.category_id)
+        .filter(Category.name != OTHER_CATEGORY)
+        .execution_options(yield_per=10000)
+    )
+    texts = []
+    labels = []
+    for description, merchant, category_name in rows:
+        texts.append(normalize_text(f"{description or ''} {merchant or ''}"))
+        labels.append(category_name)
+
+    if len(texts) < min_rows:
+        raise click.ClickException(
+            f"Only {len(texts)} categorized transactions, need at least {min_rows}"
+        )
+
+    model = train_category_model(texts, labels, epochs=epochs)
+    model.save(output)
+    click.echo(
+        f"Trained on {len(texts)} transactions ({len(model.labels)} categories), "
+        f"saved to {output}"
+    )
+
+
+class DatasetSize(click.ParamType):
+    name = "size"
+
+    def convert(self, value, param, ctx):
+        from services.synthetic_data import parse_dataset_size
+
+        try:
+            return parse_dataset_size(value)
+        except ValueError as e:
+            self.fail(str(e), param, ctx)
+
+
+@click.command("generate-transactions")
+@click.option(
+    "--rows",
+    type=DatasetSize(),
+    default="100k",
+    show_default=True,
+    help="Number of transactions, or a dataset size: 1k, 100k, 10m.",
+)
+@click.option("--seed", default=42, show_default=True)
+@click.option("--users", default=100, show_default=True)
+@click.option("--accounts-per-user", default=2, show_default=True)
+@click.option("--days", default=365, show_default=True, help="Length of the history.")
+@click.option(
+    "--output",
+    default="db",
+    show_default=True,
+    help="'db' to load into the database, or a .csv or .parquet file.",
+)
+@with_appcontext
+def generate_transactions_command(rows, seed, users, accounts_per_user, days, output):
+    """Generate a reproducible synthetic transaction dataset."""
+    import time
+    from services.synthetic_data import export_transactions, generate_transactions
+
+    start = time.perf_counter()
+    chunks = generate_transactions(
+        rows, seed=seed, users=users, accounts_per_user=accounts_per_user, days=days
+    )
+    try:
+        total = export_transactions(
+            chunks,
+            output,
+            seed=seed,
+            users=users,
+            accounts_per_user=accounts_per_user,
+        )
+    except (RuntimeError, ValueError) as e:
+        raise click.ClickException(str(e))
+    click.echo(
+        f"Generated {total} transactions (seed {seed}) to {output} "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+
+
+@click.command("rebuild-spending-rollup")
+@click.option("--user-id", type=int, help="Only rebuild this user's rollup.")
+@with_appcontext
+def rebuild_spending_rollup_command(user_id):
+    """Recompute the daily rollup and monthly summary from the transactions."""
+    from services.db_engine import without_statement_timeout
+    from services.partitions import add_detached_to_rollups
+    from services.spending_rollup import rebuild_daily_rollup, rebuild_monthly_summary
+    from services.transaction_archive import add_archive_to_rollups
+
+    without_statement_timeout(db.session)
+    daily_rows = rebuild_daily_rollup(user_id=user_id)
+    monthly_rows = rebuild_monthly_summary(user_id=user_id)
+    detached = add_detached_to_rollups(user_id=user_id)
+    try:
+        archived = add_archive_to_rollups(user_id=user_id)
+    except RuntimeError as e:
+        db.session.rollback()
+        raise click.ClickException(str(e))
+    db.session.commit()
+    click.echo(
+        f"Rebuilt {daily_rows} daily rollup rows and {monthly_rows} monthly "
+        f"summary rows, {detached} detached and {archived} archived "
+        "transactions included"
+    )
+
+
+@click.command("db-upgrade")
+@click.option("--to", "target", type=int, help="Stop after this migration version.")
+@with_appcontext
+def db_upgrade_command(target):
+    """Apply pending schema migrations."""
+    from services.migrations import current_version, upgrade
+
+    applied = upgrade(target=target)
+    if applied:
+        click.echo(f"Applied migrations {', '.join(f'{v:04d}' for v in applied)}")
+    click.echo(f"Schema version {current_version():04d}")
+
+
+@click.command("db-version")
+@with_appcontext
+def db_version_command():
+    """Show applied and pending schema migrations."""
+    from services.migrations import applied_versions, load_migrations
+
+    with db.engine.begin() as connection:
+        applied = applied_versions(connection)
+    for migration in load_migrations():
+        state = "applied" if migration.version in applied else "pending"
+        click.echo(f"{migration.version:04d} {state:8} {migration.description}")
+
+
+@click.command("maintain-partitions")
+@with_appcontext
+def maintain_partitions_command():
+    """Create upcoming transaction partitions and detach expired ones."""
+    from services.partitions import list_partitions, maintain_partitions
+
+    if db.engine.dialect.name != "postgresql":
+        raise click.ClickException("Partitioning is only used on PostgreSQL")
+    created, detached = maintain_partitions()
+    for name in created:
+        click.echo(f"Created {name}")
+    for name in detached:
+        click.echo(f"Detached {name}")
+    with db.engine.connect() as connection:
+        partitions = list_partitions(connection)
+    if partitions:
+        click.echo(
+            f"{len(partitions)} monthly partitions, {partitions[0][1]:%Y-%m} "
+            f"to {partitions[-1][1]:%Y-%m}"
+        )
+
+
+@click.command("archive-transactions")
+@click.option(
+    "--older-than-months",
+    type=int,
+    default=lambda: int(os.environ.get("TRANSACTION_ARCHIVE_AFTER_MONTHS", 0)),
+    help="Archive transactions before the month start this many months ago.",
+)
+@click.option("--user-id", type=int, help="Only archive this user's transactions.")
+@with_appcontext
+def archive_transactions_command(older_than_months, user_id):
+    """Move old transactions to the Parquet archive."""
+    from services.transaction_archive import archive_transactions, archive_cutoff
+
+    if older_than_months <= 0:
+        raise click.ClickException(
+            "Set --older-than-months or TRANSACTION_ARCHIVE_AFTER_MONTHS"
+        )
+    try:
+        archived = archive_transactions(older_than_months, user_id=user_id)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    click.echo(
+        f"Archived {archived} transactions dated before "
+        f"{archive_cutoff(older_than_months):%Y-%m-%d}"
+    )
+
+
+def register_commands(app):
+    """Register CLI commands on the Flask app"""
+    app.cli.add_command(train_category_model_command)
+    app.cli.add_command(generate_transactions_command)
+    app.cli.add_command(rebuild_spending_rollup_command)
+    app.cli.add_command(db_upgrade_command)
+    app.cli.add_command(db_version_command)
+    app.cli.add_command(maintain_partitions_command)
+    app.cli.add_command(archive_transactions_command)
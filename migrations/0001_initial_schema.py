@@ -0,0 +1,14 @@
+"""Create missing tables from the models
+
+On a new database this creates the complete current schema, so the later
+migrations find their changes already in place. On a database created by
+db.create_all() before migrations existed it only adds tables that are new
+since then; the later migrations bring the existing tables up to date.
+"""
+
+from app import db
+import models  # noqa: F401  (registers the tables on db.metadata)
+
+
+def upgrade(migrator):
+    migrator.create_tables(db.metadata)
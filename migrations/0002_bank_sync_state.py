@@ -0,0 +1,20 @@
+"""Sync cursor, token refresh and scheduling columns on accounts and jobs"""
+
+from sqlalchemy import Column, DateTime, String
+
+
+def upgrade(migrator):
+    migrator.add_column("bank_account", Column("refresh_token", String(1000)))
+    migrator.add_column("bank_account", Column("token_expires_at", DateTime))
+    migrator.add_column("bank_account", Column("sync_cursor", String(255)))
+    migrator.add_column("bank_account", Column("sync_cursor_date", DateTime))
+    migrator.create_index(
+        "ix_bank_account_token_expires_at", "bank_account", ["token_expires_at"]
+    )
+    migrator.create_index(
+        "ix_bank_account_bank_last_sync", "bank_account", ["bank_name", "last_sync"]
+    )
+
+    migrator.add_column("sync_job", Column("refresh_token", String(1000)))
+    migrator.add_column("sync_job", Column("token_expires_at", DateTime))
+    migrator.add_column("sync_job", Column("run_after", DateTime))
@@ -0,0 +1,10 @@
+"""Content fingerprint for deduplicating transactions without an external id"""
+
+from sqlalchemy import Column, String
+
+
+def upgrade(migrator):
+    migrator.add_column("transaction", Column("fingerprint", String(40)))
+    migrator.create_index(
+        "ix_transaction_fingerprint", "transaction", ["fingerprint"], unique=True
+    )
@@ -0,0 +1,40 @@
+"""Indexes for the transaction list, dashboard and analysis queries
+
+Every one of those queries joins bank_account on user_id and filters
+transactions by account, date range, category and expense flag:
+
+- ix_transaction_account_date serves per-account listings newest first
+  and the account foreign key (cascade deletes, account filter);
+- ix_transaction_account_category_date serves the category filter and the
+  uncategorized list. Categories are shared by all users, so an index
+  leading with category_id would walk every user's rows of a category;
+- ix_transaction_expense_account_date only holds expenses and carries
+  category and amount, so the dashboard's 30-day category totals and
+  7-day daily totals never touch the table. Partial on PostgreSQL and
+  SQLite;
+- ix_bank_account_user_id resolves a user's accounts.
+"""
+
+from sqlalchemy import Boolean, column
+
+
+def upgrade(migrator):
+    migrator.create_index("ix_bank_account_user_id", "bank_account", ["user_id"])
+    migrator.create_index(
+        "ix_transaction_account_date",
+        "transaction",
+        ["account_id", "transaction_date DESC"],
+    )
+    migrator.create_index(
+        "ix_transaction_account_category_date",
+        "transaction",
+        ["account_id", "category_id", "transaction_date DESC"],
+    )
+    migrator.create_index(
+        "ix_transaction_expense_account_date",
+        "transaction",
+        ["account_id", "transaction_date", "category_id", "amount", "is_expense"],
+        # Same form as the queries' Transaction.is_expense == True; SQLite
+        # needs is_expense among the columns as well to skip the table
+        where=column("is_expense", Boolean) == True,
+    )
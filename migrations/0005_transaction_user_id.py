@@ -0,0 +1,44 @@
+"""Owner user_id on transactions, so per-user queries skip the account join
+
+Backfills the column from bank_account and moves the category and expense
+indexes from account_id to user_id: every page filters on the user, and
+the account listing keeps ix_transaction_account_date.
+"""
+
+from sqlalchemy import Boolean, Column, Integer, column
+
+
+def upgrade(migrator):
+    if migrator.add_column("transaction", Column("user_id", Integer)):
+        migrator.execute(
+            'UPDATE "transaction" SET user_id = ('
+            "SELECT bank_account.user_id FROM bank_account "
+            'WHERE bank_account.id = "transaction".account_id)'
+        )
+        if migrator.dialect == "postgresql":
+            # SQLite cannot add constraints to an existing column; there the
+            # column stays nullable and ingestion keeps it filled
+            migrator.execute(
+                'ALTER TABLE "transaction" ALTER COLUMN user_id SET NOT NULL'
+            )
+            migrator.execute(
+                'ALTER TABLE "transaction" ADD CONSTRAINT transaction_user_id_fkey '
+                'FOREIGN KEY (user_id) REFERENCES "user" (id)'
+            )
+
+    migrator.create_index(
+        "ix_transaction_user_date", "transaction", ["user_id", "transaction_date DESC"]
+    )
+    migrator.create_index(
+        "ix_transaction_user_category_date",
+        "transaction",
+        ["user_id", "category_id", "transaction_date DESC"],
+    )
+    migrator.create_index(
+        "ix_transaction_expense_user_date",
+        "transaction",
+        ["user_id", "transaction_date", "category_id", "amount", "is_expense"],
+        where=column("is_expense", Boolean) == True,
+    )
+    migrator.drop_index("ix_transaction_account_category_date", "transaction")
+    migrator.drop_index("ix_transaction_expense_account_date", "transaction")
@@ -0,0 +1,15 @@
+"""Daily spending rollup per user, day, category and direction
+
+Filled from the existing transactions; ingestion maintains it from then on.
+"""
+
+from app import db
+import models  # noqa: F401  (registers the tables on db.metadata)
+from services.spending_rollup import rebuild_daily_rollup
+
+
+def upgrade(migrator):
+    # 0001 may already have created the table on a pre-migration database,
+    # so always fill it rather than only when it is new
+    migrator.create_tables(db.metadata, "daily_spending_rollup")
+    rebuild_daily_rollup(migrator.connection)
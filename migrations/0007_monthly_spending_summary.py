@@ -0,0 +1,14 @@
+"""Monthly spending summary per user, month, category and direction
+
+Filled from the existing transactions; ingestion maintains it from then on.
+"""
+
+from app import db
+import models  # noqa: F401  (registers the tables on db.metadata)
+from services.spending_rollup import rebuild_monthly_summary
+
+
+def upgrade(migrator):
+    # Like 0006: the table may predate this migration, so always fill it
+    migrator.create_tables(db.metadata, "monthly_spending_summary")
+    rebuild_monthly_summary(migrator.connection)
@@ -0,0 +1,13 @@
+"""Partition transactions by month of transaction_date on PostgreSQL
+
+SQLite keeps the plain table. The conversion copies every row, so on a
+large database expect this migration to take a while and hold the table.
+"""
+
+from services.partitions import is_partitioned, partition_transaction_table
+
+
+def upgrade(migrator):
+    if migrator.dialect != "postgresql" or is_partitioned(migrator.connection):
+        return
+    partition_transaction_table(migrator.connection)
@@ -0,0 +1,17 @@
+"""Index accounts by staleness with never-synced ones first on PostgreSQL
+
+The scheduler orders by last_sync NULLS FIRST. PostgreSQL sorts NULLs
+last in ascending indexes, so the index has to say so to serve that sort;
+SQLite already puts NULLs first and does not accept NULLS in an index.
+"""
+
+
+def upgrade(migrator):
+    if migrator.dialect != "postgresql":
+        return
+    migrator.drop_index("ix_bank_account_bank_last_sync", "bank_account")
+    migrator.create_index(
+        "ix_bank_account_bank_last_sync",
+        "bank_account",
+        ["bank_name", "last_sync NULLS FIRST"],
+    )
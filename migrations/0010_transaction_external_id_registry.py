@@ -0,0 +1,13 @@
+"""Keep external ids unique across transaction partitions on PostgreSQL
+
+The partitioned table only enforces (external_id, transaction_date), so a
+bank record whose date changes after it was pending would import twice.
+"""
+
+from services.partitions import create_external_id_registry, is_partitioned
+
+
+def upgrade(migrator):
+    if migrator.dialect != "postgresql" or not is_partitioned(migrator.connection):
+        return
+    create_external_id_registry(migrator.connection)
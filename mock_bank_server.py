@@ -0,0 +1,285 @@
+"""
+Mock bank API for load and latency testing.
+
+Serves Tinkoff- and Sber-shaped APIs under /tinkoff and /sber:
+
+    POST /<bank>/auth                                  -> {"accessToken": ...,
+                                                           "refreshToken": ...,
+                                                           "expiresIn": ...}
+    POST /<bank>/auth/refresh {"refreshToken": ...}    -> same as /auth
+    GET  /<bank>/accounts                              -> {"accounts": [...]}
+    GET  /<bank>/accounts/<number>/transactions?from=&to=&pageToken=
+                                                       -> {"transactions": [...],
+                                                           "nextPageToken": ...}
+
+Transactions are generated deterministically from the seed, account and day,
+so repeated syncs see the same history. Point the app at it with:
+
+    BANK_API_MODE=live TINKOFF_API_URL=http://127.0.0.1:8900/tinkoff \
+    SBER_API_URL=http://127.0.0.1:8900/sber python main.py
+
+Usage:
+    python mock_bank_server.py [--latency-ms 50] [--error-rate 0.01] ...
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+MERCHANTS = [
+    "Пятёрочка",
+    "Магнит",
+    "OZON",
+    "Wildberries",
+    "Яндекс.Такси",
+    "Dodo Пицца",
+    "Перекрёсток",
+    "АЗС Газпром",
+    "Аптека 36.6",
+    "Starbucks",
+    "DNS",
+    "Спортмастер",
+]
+
+
+class MockBank:
+    """Configuration and deterministic data of the mock bank"""
+
+    def __init__(
+        self,
+        latency_ms=50.0,
+        latency_jitter_ms=0.0,
+        error_rate=0.0,
+        page_size=100,
+        history_days=365,
+        transactions_per_day=3,
+        accounts=2,
+        seed=0,
+        token_ttl=3600,
+    ):
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.error_rate = error_rate
+        self.page_size = page_size
+        self.history_days = history_days
+        self.transactions_per_day = transactions_per_day
+        self.accounts = accounts
+        self.seed = seed
+        self.token_ttl = token_ttl
+        # Fixed at startup so the history does not shift while the server runs
+        self.now = datetime.utcnow().replace(microsecond=0)
+        self.requests = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def get_accounts(self, bank):
+        return [
+            {
+                "accountNumber": f"{bank}-40817810{i:012d}",
+                "accountType": "Дебетовая карта" if i % 2 == 0 else "Кредитная карта",
+                "balance": round(
+                    random.Random(f"{self.seed}:{bank}:{i}").uniform(0, 300000), 2
+                ),
+                "currency": "RUB",
+            }
+            for i in range(self.accounts)
+        ]
+
+    def day_transactions(self, bank, account_number, day):
+        """All transactions of one account on one day, oldest first"""
+        rng = random.Random(f"{self.seed}:{account_number}:{day.isoformat()}")
+        transactions = []
+        for i in range(self.transactions_per_day):
+            date = datetime.combine(day, datetime.min.time()) + timedelta(
+                seconds=rng.randrange(86400)
+            )
+            is_expense = rng.random() < 0.8
+            amount = (
+                -round(rng.uniform(100, 5000), 2)
+                if is_expense
+                else round(rng.uniform(5000, 50000), 2)
+            )
+            merchant = rng.choice(MERCHANTS) if is_expense else ""
+            transactions.append(
+                {
+                    "id": f"{account_number}-{day.isoformat()}-{i}",
+                    "amount": amount,
+                    "currency": "RUB",
+                    "description": (
+                        f"Покупка {merchant}" if is_expense else "Зачисление средств"
+                    ),
+                    "date": date.isoformat(),
+                    "merchant": {"name": merchant} if bank == "tinkoff" else merchant,
+                }
+            )
+        transactions.sort(key=lambda tx: tx["date"])
+        return transactions
+
+    def get_transactions(self, bank, account_number, since, until, offset):
+        """One page of the account's transactions in [since, until)"""
+        since = max(since, self.now - timedelta(days=self.history_days))
+        until = min(until, self.now)
+
+        transactions = []
+        day = since.date()
+        while day <= until.date():
+            transactions.extend(
+                tx
+                for tx in self.day_transactions(bank, account_number, day)
+                if since <= datetime.fromisoformat(tx["date"]) < until
+            )
+            day += timedelta(days=1)
+
+        page = transactions[offset : offset + self.page_size]
+        next_offset = offset + self.page_size
+        return {
+            "transactions": page,
+            "nextPageToken": (
+                str(next_offset) if next_offset < len(transactions) else None
+            ),
+        }
+
+
+class MockBankHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like a real bank API
+    bank = None  # set by make_server
+
+    def send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_request(self, method):
+        mock = self.bank
+        with mock.lock:
+            mock.requests += 1
+        # Always consume the body so the kept-alive connection stays usable
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+
+        delay = mock.latency_ms + random.uniform(0, mock.latency_jitter_ms)
+        time.sleep(delay / 1000)
+
+        if random.random() < mock.error_rate:
+            with mock.lock:
+                mock.errors += 1
+            self.send_json(503, {"error": "Service unavailable"})
+            return
+
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        if not parts or parts[0] not in ("tinkoff", "sber"):
+            self.send_json(404, {"error": "Unknown bank"})
+            return
+        bank, route = parts[0], parts[1:]
+
+        if method == "POST" and route in (["auth"], ["auth", "refresh"]):
+            data = json.loads(body or b"{}")
+            if route == ["auth"]:
+                username = data.get("username")
+            else:
+                # Refresh tokens are "refresh-<bank>-<username>"
+                username = (data.get("refreshToken") or "").split("-", 2)[-1]
+            self.send_json(
+                200,
+                {
+                    "accessToken": f"mock-{bank}-{username}",
+                    "refreshToken": f"refresh-{bank}-{username}",
+                    "expiresIn": mock.token_ttl,
+                },
+            )
+            return
+
+        if not (self.headers.get("Authorization") or "").startswith("Bearer "):
+            self.send_json(401, {"error": "Unauthorized"})
+            return
+
+        if method == "GET" and route == ["accounts"]:
+            self.send_json(200, {"accounts": mock.get_accounts(bank)})
+        elif (
+            method == "GET"
+            and len(route) == 3
+            and route[0] == "accounts"
+            and route[2] == "transactions"
+        ):
+            query = parse_qs(url.query)
+            try:
+                since = datetime.fromisoformat(query["from"][0])
+                until = datetime.fromisoformat(query["to"][0])
+                offset = int(query.get("pageToken", ["0"])[0])
+            except (KeyError, ValueError):
+                self.send_json(400, {"error": "from and to are required"})
+                return
+            self.send_json(
+                200, mock.get_transactions(bank, route[1], since, until, offset)
+            )
+        else:
+            self.send_json(404, {"error": "Not found"})
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def log_message(self, *args):
+        pass
+
+
+def make_server(mock, host="127.0.0.1", port=8900):
+    """Create (but don't start) a threaded HTTP server for a MockBank"""
+    handler = type("BoundMockBankHandler", (MockBankHandler,), {"bank": mock})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--latency-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--history-days", type=int, default=365)
+    parser.add_argument("--transactions-per-day", type=int, default=3)
+    parser.add_argument("--accounts", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--token-ttl", type=int, default=3600)
+    args = parser.parse_args()
+
+    mock = MockBank(
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms,
+        error_rate=args.error_rate,
+        page_size=args.page_size,
+        history_days=args.history_days,
+        transactions_per_day=args.transactions_per_day,
+        accounts=args.accounts,
+        seed=args.seed,
+        token_ttl=args.token_ttl,
+    )
+    server = make_server(mock, args.host, args.port)
+    print(f"Mock bank listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"{mock.requests} requests, {mock.errors} injected errors")
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
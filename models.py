@@ -1,6 +1,7 @@
 from app import db
 from datetime import datetime
 from flask_login import UserMixin
+from sqlalchemy import event, select
 from werkzeug.security import generate_password_hash, check_password_hash
 
 
@@ -21,6 +22,12 @@ class User(UserMixin, db.Model):
     savings_goals = db.relationship(
         "SavingsGoal", backref="user", lazy=True, cascade="all, delete-orphan"
     )
+    merchant_overrides = db.relationship(
+        "MerchantCategoryOverride",
+        backref="user",
+        lazy=True,
+        cascade="all, delete-orphan",
+    )
 
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -34,14 +41,23 @@ class User(UserMixin, db.Model):
 
 class BankAccount(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("user.id"), nullable=False, index=True
+    )
     bank_name = db.Column(db.String(100), nullable=False)
     account_number = db.Column(db.String(100), nullable=False)
     account_type = db.Column(db.String(50), nullable=False)
     access_token = db.Column(db.String(1000))
+    refresh_token = db.Column(db.String(1000))
+    # None for tokens that do not expire; refreshed ahead of this time
+    token_expires_at = db.Column(db.DateTime, index=True)
     balance = db.Column(db.Float, default=0.0)
     currency = db.Column(db.String(3), default="RUB")
     last_sync = db.Column(db.DateTime)
+    # Incremental sync cursor: history up to sync_cursor_date is imported;
+    # sync_cursor holds the newest external id or a bank-provided token
+    sync_cursor = db.Column(db.String(255))
+    sync_cursor_date = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Relationships
@@ -49,6 +65,13 @@ class BankAccount(db.Model):
         "Transaction", backref="account", lazy=True, cascade="all, delete-orphan"
     )
 
+    # The sync scheduler walks each bank's accounts by staleness, never
+    # synced first; on PostgreSQL migration 0009 declares last_sync NULLS
+    # FIRST, SQLite sorts NULLs first anyway
+    __table_args__ = (
+        db.Index("ix_bank_account_bank_last_sync", "bank_name", "last_sync"),
+    )
+
     def __repr__(self):
         return f"<BankAccount {self.bank_name} {self.account_number}>"
 
@@ -56,7 +79,11 @@ class BankAccount(db.Model):
 class Transaction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     account_id = db.Column(db.Integer, db.ForeignKey("bank_account.id"), nullable=False)
+    # Owner of the account, copied so per-user queries skip the join
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
     external_id = db.Column(db.String(100), nullable=True, unique=True)
+    # Content hash for rows without an external id, see assign_fingerprints
+    fingerprint = db.Column(db.String(40), nullable=True, index=True, unique=True)
     amount = db.Column(db.Float, nullable=False)
     currency = db.Column(db.String(3), default="RUB")
     description = db.Column(db.String(255))
@@ -66,10 +93,96 @@ class Transaction(db.Model):
     is_expense = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Indexes for the transaction list, dashboard and analysis queries; kept
+    # in step with migrations 0004 and 0005
+    __table_args__ = (
+        db.Index("ix_transaction_user_date", user_id, transaction_date.desc()),
+        db.Index("ix_transaction_account_date", account_id, transaction_date.desc()),
+        db.Index(
+            "ix_transaction_user_category_date",
+            user_id,
+            category_id,
+            transaction_date.desc(),
+        ),
+        # Expense sums per category and per day read only this index. The
+        # condition must match the queries' "is_expense == True" for SQLite
+        # to use it, and SQLite only treats it as covering when is_expense
+        # is also a column.
+        db.Index(
+            "ix_transaction_expense_user_date",
+            user_id,
+            transaction_date,
+            category_id,
+            amount,
+            is_expense,
+            postgresql_where=is_expense == True,
+            sqlite_where=is_expense == True,
+        ),
+    )
+
     def __repr__(self):
         return f"<Transaction {self.amount} {self.currency} - {self.description}>"
 
 
+@event.listens_for(Transaction, "before_insert")
+def set_transaction_user(mapper, connection, target):
+    """Fill Transaction.user_id from the account when it is not set"""
+    if target.user_id is None:
+        target.user_id = connection.scalar(
+            select(BankAccount.user_id).where(BankAccount.id == target.account_id)
+        )
+
+
+class DailySpendingRollup(db.Model):
+    """
+    Per-day totals of a user's transactions by category and direction
+
+    Maintained by services.spending_rollup as transactions are written.
+    """
+
+    __tablename__ = "daily_spending_rollup"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    # 0 for uncategorized transactions
+    category_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    is_expense = db.Column(db.Boolean, primary_key=True)
+    total = db.Column(db.Float, nullable=False, default=0.0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<DailySpendingRollup {self.user_id} {self.day} {self.category_id}>"
+
+
+class MonthlySpendingSummary(db.Model):
+    """
+    Per-month statistics of a user's transactions by category and direction
+
+    Holds what analysis and recommendations need (totals, averages,
+    spread) without reading the transactions. Maintained by
+    services.spending_rollup as transactions are written.
+    """
+
+    __tablename__ = "monthly_spending_summary"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    # First day of the month
+    month = db.Column(db.Date, primary_key=True)
+    # 0 for uncategorized transactions
+    category_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    is_expense = db.Column(db.Boolean, primary_key=True)
+    total = db.Column(db.Float, nullable=False, default=0.0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    min_amount = db.Column(db.Float)
+    max_amount = db.Column(db.Float)
+    sum_squares = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return (
+            f"<MonthlySpendingSummary {self.user_id} {self.month} {self.category_id}>"
+        )
+
+
 class Category(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -82,6 +195,68 @@ class Category(db.Model):
         return f"<Category {self.name}>"
 
 
+class MerchantCategoryOverride(db.Model):
+    """Category a user has manually chosen for a merchant"""
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    merchant_key = db.Column(db.String(100), nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey("category.id"), nullable=False)
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+
+    __table_args__ = (db.UniqueConstraint("user_id", "merchant_key"),)
+
+    def __repr__(self):
+        return f"<MerchantCategoryOverride {self.merchant_key} -> {self.category_id}>"
+
+
+class SyncJob(db.Model):
+    """Bank sync queued by the web app and run by the worker process"""
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # connect, sync, archive
+    bank_name = db.Column(db.String(100), nullable=False)
+    account_id = db.Column(
+        db.Integer, db.ForeignKey("bank_account.id", ondelete="CASCADE"), index=True
+    )
+    access_token = db.Column(db.String(1000))
+    refresh_token = db.Column(db.String(1000))
+    token_expires_at = db.Column(db.DateTime)
+    # queued, running, succeeded, failed
+    status = db.Column(db.String(20), nullable=False, default="queued", index=True)
+    progress = db.Column(db.Integer, default=0)  # percent
+    transaction_count = db.Column(db.Integer, default=0)
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, default=0)
+    worker_id = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Not picked up before this time; spreads scheduled syncs out
+    run_after = db.Column(db.DateTime)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "bank_name": self.bank_name,
+            "account_id": self.account_id,
+            "status": self.status,
+            "progress": self.progress,
+            "transaction_count": self.transaction_count,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    def __repr__(self):
+        return f"<SyncJob {self.id} {self.kind} {self.status}>"
+
+
 class Recommendation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
@@ -1,18 +1,24 @@
 import logging
 import os
-from flask import Blueprint, render_template, request, flash, redirect, url_for
+from flask import (
+    Blueprint,
+    render_template,
+    request,
+    flash,
+    redirect,
+    url_for,
+    jsonify,
+)
 from flask_login import login_required, current_user
 from app import db
-from models import BankAccount, Transaction
-from services.bank_api import (
-    get_supported_banks,
-    connect_to_bank,
-    fetch_account_data,
-    fetch_transactions,
-    sync_account_data,
+from models import BankAccount, SyncJob
+from services.bank_api import get_supported_banks, connect_to_bank
+from services.job_queue import enqueue_job
+from services.statement_import import (
+    SUPPORTED_EXTENSIONS,
+    StatementFormatError,
+    import_statement,
 )
-from services.transaction_analyzer import categorize_transaction
-from datetime import datetime
 
 # Configure logger
 logger = logging.getLogger(__name__)
@@ -44,110 +50,24 @@ def connect_bank():
 
         try:
             # Attempt to connect to bank API
-            access_token = connect_to_bank(bank_name, credentials)
+            token = connect_to_bank(bank_name, credentials)
 
-            if not access_token:
+            if not token:
                 flash(
                     "Failed to connect to bank. Please check your credentials.",
                     "danger",
                 )
                 return redirect(url_for("banks.connect_bank"))
 
-            # Get account information
-            accounts_data = fetch_account_data(bank_name, access_token)
-
-            # Save each account
-            for account_data in accounts_data:
-                # Check if account already exists
-                existing_account = BankAccount.query.filter_by(
-                    user_id=current_user.id,
-                    bank_name=bank_name,
-                    account_number=account_data["account_number"],
-                ).first()
-
-                if existing_account:
-                    # Update existing account
-                    existing_account.balance = account_data["balance"]
-                    existing_account.currency = account_data["currency"]
-                    existing_account.access_token = access_token
-                    existing_account.last_sync = datetime.utcnow()
-                else:
-                    # Create new account
-                    new_account = BankAccount(
-                        user_id=current_user.id,
-                        bank_name=bank_name,
-                        account_number=account_data["account_number"],
-                        account_type=account_data["account_type"],
-                        balance=account_data["balance"],
-                        currency=account_data["currency"],
-                        access_token=access_token,
-                        last_sync=datetime.utcnow(),
-                    )
-                    db.session.add(new_account)
-
-            db.session.commit()
-
-            # For each account, fetch transactions
-            accounts = BankAccount.query.filter_by(
-                user_id=current_user.id, bank_name=bank_name
-            ).all()
-
-            transaction_count = 0
-            for account in accounts:
-                transactions = fetch_transactions(
-                    bank_name, access_token, account.account_number
-                )
-
-                for transaction_data in transactions:
-                    # Check if transaction already exists
-                    existing_transaction = Transaction.query.filter_by(
-                        external_id=transaction_data["external_id"]
-                    ).first()
-
-                    if not existing_transaction:
-                        # Categorize transaction
-                        category_id = categorize_transaction(
-                            transaction_data["description"],
-                            transaction_data.get("merchant", ""),
-                        )
-
-                        # Make sure we have a valid category_id
-                        if category_id is None:
-                            # Use the "Other" category if categorization fails
-                            from models import Category
-
-                            other_category = Category.query.filter_by(
-                                name="Другое"
-                            ).first()
-                            if other_category:
-                                category_id = other_category.id
-                            else:
-                                # If we somehow don't have an "Other" category, log error
-                                logger.error("Failed to find 'Other' category")
-                                continue
-
-                        # Create new transaction
-                        new_transaction = Transaction(
-                            account_id=account.id,
-                            external_id=transaction_data["external_id"],
-                            amount=transaction_data["amount"],
-                            currency=transaction_data["currency"],
-                            description=transaction_data["description"],
-                            transaction_date=transaction_data["date"],
-                            merchant=transaction_data.get("merchant", ""),
-                            category_id=category_id,
-                            is_expense=transaction_data["amount"] > 0,
-                        )
-                        db.session.add(new_transaction)
-                        transaction_count += 1
-
+            # Accounts and transactions are imported by the worker
+            job = enqueue_job(current_user.id, "connect", bank_name, token=token)
             db.session.commit()
 
             flash(
-                f"Successfully connected to {bank_name} and imported {transaction_count} new transactions.",
+                f"Connected to {bank_name}. Importing transactions in the background.",
                 "success",
             )
-            return redirect(url_for("banks.bank_accounts"))
+            return redirect(url_for("banks.bank_accounts", job=job.id))
 
         except Exception as e:
             flash(f"Error connecting to bank: {str(e)}", "danger")
@@ -156,6 +76,67 @@ def connect_bank():
     return render_template("connect_bank.html", banks=supported_banks)
 
 
+@banks_bp.route("/banks/import", methods=["GET", "POST"])
+@login_required
+def import_bank_statement():
+    accounts = BankAccount.query.filter_by(user_id=current_user.id).all()
+
+    if request.method == "POST":
+        statement = request.files.get("statement")
+        if not statement or not statement.filename:
+            flash("Please choose a statement file.", "danger")
+            return redirect(url_for("banks.import_bank_statement"))
+
+        account_id = request.form.get("account_id", type=int)
+        if account_id:
+            account = BankAccount.query.filter_by(
+                id=account_id, user_id=current_user.id
+            ).first_or_404()
+        else:
+            bank_name = (request.form.get("bank_name") or "").strip()
+            account_number = (request.form.get("account_number") or "").strip()
+            if not bank_name or not account_number:
+                flash("Enter the bank name and account number.", "danger")
+                return redirect(url_for("banks.import_bank_statement"))
+            account = BankAccount(
+                user_id=current_user.id,
+                bank_name=bank_name[:100],
+                account_number=account_number[:100],
+                account_type="Выписка",
+                currency=(request.form.get("currency") or "RUB")[:3],
+            )
+            db.session.add(account)
+            db.session.flush()
+
+        try:
+            stats = import_statement(account, statement.stream, statement.filename)
+            db.session.commit()
+        except StatementFormatError as e:
+            db.session.rollback()
+            flash(f"Could not read the statement: {str(e)}", "danger")
+            return redirect(url_for("banks.import_bank_statement"))
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error importing statement: {str(e)}", exc_info=True)
+            flash(f"Error importing statement: {str(e)}", "danger")
+            return redirect(url_for("banks.import_bank_statement"))
+
+        message = (
+            f"Imported {stats['imported']} new transactions "
+            f"from {stats['rows']} statement rows."
+        )
+        if stats["skipped"]:
+            message += f" {stats['skipped']} unreadable rows were skipped."
+        flash(message, "success")
+        return redirect(url_for("banks.bank_accounts"))
+
+    return render_template(
+        "import_statement.html",
+        accounts=accounts,
+        extensions=", ".join(SUPPORTED_EXTENSIONS),
+    )
+
+
 @banks_bp.route("/banks/<int:account_id>/sync")
 @login_required
 def sync_bank_account(account_id):
@@ -164,25 +145,18 @@ def sync_bank_account(account_id):
         id=account_id, user_id=current_user.id
     ).first_or_404()
 
-    try:
-        # Sync account data
-        new_balance, transaction_count = sync_account_data(
-            account.bank_name, account.access_token, account.account_number, account.id
-        )
+    job = enqueue_job(current_user.id, "sync", account.bank_name, account_id=account.id)
+    db.session.commit()
 
-        # Update account balance and sync time
-        account.balance = new_balance
-        account.last_sync = datetime.utcnow()
-        db.session.commit()
+    flash("Sync started. New transactions will appear shortly.", "info")
+    return redirect(url_for("banks.bank_accounts", job=job.id))
 
-        flash(
-            f"Successfully synced account. Found {transaction_count} new transactions.",
-            "success",
-        )
-    except Exception as e:
-        flash(f"Error syncing account: {str(e)}", "danger")
 
-    return redirect(url_for("banks.bank_accounts"))
+@banks_bp.route("/banks/jobs/<int:job_id>")
+@login_required
+def sync_job_status(job_id):
+    job = SyncJob.query.filter_by(id=job_id, user_id=current_user.id).first_or_404()
+    return jsonify(job.to_dict())
 
 
 @banks_bp.route("/banks/<int:account_id>/delete", methods=["POST"])
@@ -273,7 +247,10 @@ def generate_new_recommendations():
             # Fall back to rule-based recommendations
             from services.recommendation_engine import generate_recommendations
 
-            count = generate_recommendations(current_user.id)
+            count = generate_recommendations(
+                current_user.id,
+                include_archive=request.form.get("include_archive") == "1",
+            )
             flash(f"Сгенерировано {count} новых рекомендаций для вас.", "success")
     except Exception as e:
         logger.error(f"Error generating recommendations: {str(e)}", exc_info=True)
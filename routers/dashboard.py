@@ -1,15 +1,20 @@
 from flask import Blueprint, render_template, flash
 from flask_login import login_required, current_user
-from models import BankAccount, Transaction, Recommendation, Category, SavingsGoal
-from sqlalchemy import func
-from app import db
-from datetime import datetime, timedelta
+from models import BankAccount, Transaction, Recommendation, SavingsGoal
+from services.db_engine import replica_reads
+from services.spending_rollup import (
+    category_spending,
+    daily_spending,
+    recent_activity_start,
+)
+from datetime import datetime, time, timedelta
 
 dashboard_bp = Blueprint("dashboard", __name__)
 
 
 @dashboard_bp.route("/dashboard")
 @login_required
+@replica_reads
 def dashboard():
     # Get user's bank accounts
     accounts = BankAccount.query.filter_by(user_id=current_user.id).all()
@@ -17,14 +22,20 @@ def dashboard():
     # Get total balance across all accounts
     total_balance = sum(account.balance for account in accounts)
 
-    # Get latest transactions
-    latest_transactions = (
-        Transaction.query.join(BankAccount)
-        .filter(BankAccount.user_id == current_user.id)
-        .order_by(Transaction.transaction_date.desc())
-        .limit(5)
-        .all()
-    )
+    # Get latest transactions; bounding the date by the rollup's most recent
+    # days lets PostgreSQL skip all but the newest partitions
+    latest_transactions = []
+    latest_since = recent_activity_start(current_user.id, 5)
+    if latest_since is not None:
+        latest_transactions = (
+            Transaction.query.filter_by(user_id=current_user.id)
+            .filter(
+                Transaction.transaction_date >= datetime.combine(latest_since, time.min)
+            )
+            .order_by(Transaction.transaction_date.desc())
+            .limit(5)
+            .all()
+        )
 
     # Get recommendations
     recommendations = (
@@ -42,45 +53,21 @@ def dashboard():
         .all()
     )
 
-    # Get monthly spending by category (last 30 days)
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-
-    monthly_spending = (
-        db.session.query(Category.name, func.sum(Transaction.amount).label("total"))
-        .join(Transaction, Transaction.category_id == Category.id)
-        .join(BankAccount, BankAccount.id == Transaction.account_id)
-        .filter(BankAccount.user_id == current_user.id)
-        .filter(Transaction.is_expense == True)
-        .filter(Transaction.transaction_date >= thirty_days_ago)
-        .group_by(Category.name)
-        .order_by(func.sum(Transaction.amount).desc())
-        .all()
-    )
+    # Get monthly spending by category (last 30 days) from the daily rollup
+    thirty_days_ago = (datetime.utcnow() - timedelta(days=30)).date()
+    monthly_spending = category_spending(current_user.id, thirty_days_ago)
 
     # Format data for charts
     category_labels = [item[0] for item in monthly_spending]
     category_values = [float(item[1]) for item in monthly_spending]
 
     # Get daily spending (last 7 days)
-    seven_days_ago = datetime.utcnow() - timedelta(days=7)
-
-    daily_spending = (
-        db.session.query(
-            func.date(Transaction.transaction_date).label("date"),
-            func.sum(Transaction.amount).label("total"),
-        )
-        .join(BankAccount, BankAccount.id == Transaction.account_id)
-        .filter(BankAccount.user_id == current_user.id)
-        .filter(Transaction.is_expense == True)
-        .filter(Transaction.transaction_date >= seven_days_ago)
-        .group_by(func.date(Transaction.transaction_date))
-        .order_by(func.date(Transaction.transaction_date))
-        .all()
-    )
+    seven_days_ago = (datetime.utcnow() - timedelta(days=7)).date()
+    daily_totals = daily_spending(current_user.id, seven_days_ago)
 
     # Format data for charts
-    daily_labels = [item[0].strftime("%d-%m") for item in daily_spending]
-    daily_values = [float(item[1]) for item in daily_spending]
+    daily_labels = [item[0].strftime("%d-%m") for item in daily_totals]
+    daily_values = [float(item[1]) for item in daily_totals]
 
     return render_template(
         "dashboard.html",
@@ -1,28 +1,41 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify
 from flask_login import login_required, current_user
 from app import db
-from models import Transaction, BankAccount, Category
+from models import Transaction, BankAccount, MonthlySpendingSummary
 from sqlalchemy import desc
-from datetime import datetime, timedelta
-import pandas as pd
-from services.transaction_analyzer import analyze_transactions, categorize_transaction
+from datetime import datetime, time, timedelta
+from services.transaction_analyzer import (
+    analyze_spending,
+    analyze_transactions,
+    categorize_many,
+)
+from services.merchant_overrides import record_merchant_override
+from services.category_registry import get_categories, get_category_names
+from services.db_engine import replica_reads
+from services.spending_rollup import first_uncategorized_day, recent_activity_start
+from services.transaction_archive import transaction_history
+
+# Transactions per page of the list. Each page's query carries a
+# transaction_date bound taken from the daily rollup, so PostgreSQL reads
+# only the partitions that page needs.
+TRANSACTIONS_PER_PAGE = 50
 
 transactions_bp = Blueprint("transactions", __name__)
 
 
 @transactions_bp.route("/transactions")
 @login_required
+@replica_reads
 def transactions():
     # Get filter parameters
     account_id = request.args.get("account_id", type=int)
     category_id = request.args.get("category_id", type=int)
     date_from = request.args.get("date_from")
     date_to = request.args.get("date_to")
+    page = max(request.args.get("page", 1, type=int), 1)
 
     # Base query - get transactions from user's accounts
-    query = Transaction.query.join(BankAccount).filter(
-        BankAccount.user_id == current_user.id
-    )
+    query = Transaction.query.filter_by(user_id=current_user.id)
 
     # Apply filters
     if account_id:
@@ -41,12 +54,36 @@ def transactions():
         date_to = date_to + timedelta(days=1)
         query = query.filter(Transaction.transaction_date < date_to)
 
-    # Get sorted transactions
-    transactions = query.order_by(desc(Transaction.transaction_date)).all()
+    # The newest days holding all transactions up to this page and the one
+    # after it; the rollup has no account column, so account filters go
+    # without the bound
+    if not account_id:
+        since = recent_activity_start(
+            current_user.id,
+            page * TRANSACTIONS_PER_PAGE + 1,
+            category_id=category_id,
+            until=date_to.date() if date_to else None,
+        )
+        if since is not None and (not date_from or since > date_from.date()):
+            query = query.filter(
+                Transaction.transaction_date >= datetime.combine(since, time.min)
+            )
+
+    # Get sorted transactions, one more than a page to see if there are more
+    transactions = (
+        query.order_by(desc(Transaction.transaction_date), desc(Transaction.id))
+        .offset((page - 1) * TRANSACTIONS_PER_PAGE)
+        .limit(TRANSACTIONS_PER_PAGE + 1)
+        .all()
+    )
+    has_next = len(transactions) > TRANSACTIONS_PER_PAGE
+    transactions = transactions[:TRANSACTIONS_PER_PAGE]
+    # Filters kept by the pagination links
+    page_args = {key: value for key, value in request.args.items() if key != "page"}
 
     # Get user's accounts and categories for filtering
     accounts = BankAccount.query.filter_by(user_id=current_user.id).all()
-    categories = Category.query.all()
+    categories = get_categories()
 
     return render_template(
         "transactions.html",
@@ -57,32 +94,38 @@ def transactions():
         filter_category_id=category_id,
         filter_date_from=date_from,
         filter_date_to=date_to,
+        page=page,
+        has_next=has_next,
+        page_args=page_args,
     )
 
 
 @transactions_bp.route("/transactions/categorize", methods=["POST"])
 @login_required
 def categorize_transactions():
-    # Get uncategorized transactions
-    uncategorized = (
-        Transaction.query.join(BankAccount)
-        .filter(BankAccount.user_id == current_user.id)
-        .filter(Transaction.category_id == None)
-        .all()
-    )
+    # Get uncategorized transactions, from the oldest day the rollup has any
+    since = first_uncategorized_day(current_user.id)
+    uncategorized = []
+    if since is not None:
+        uncategorized = (
+            Transaction.query.filter_by(user_id=current_user.id)
+            .filter(Transaction.transaction_date >= datetime.combine(since, time.min))
+            .filter(Transaction.category_id == None)
+            .all()
+        )
 
     if not uncategorized:
         flash("No uncategorized transactions found.", "info")
         return redirect(url_for("transactions.transactions"))
 
     count = 0
-    # Categorize transactions
-    for transaction in uncategorized:
-        category_id = categorize_transaction(
-            transaction.description, transaction.merchant
-        )
-        if category_id:
-            transaction.category_id = category_id
+    # Categorize transactions in one batch
+    category_ids = categorize_many(
+        ((t.description, t.merchant) for t in uncategorized), user_id=current_user.id
+    )
+    for transaction, category_id in zip(uncategorized, category_ids):
+        if category_id > 0:
+            transaction.category_id = int(category_id)
             count += 1
 
     db.session.commit()
@@ -93,41 +136,35 @@ def categorize_transactions():
 
 @transactions_bp.route("/transactions/analysis")
 @login_required
+@replica_reads
 def transaction_analysis():
-    # Get all user transactions
-    user_transactions = (
-        Transaction.query.join(BankAccount)
-        .filter(BankAccount.user_id == current_user.id)
-        .all()
-    )
-
-    if not user_transactions:
+    # The monthly summary keeps the totals of archived transactions too
+    has_transactions = db.session.query(
+        MonthlySpendingSummary.query.filter_by(user_id=current_user.id)
+        .filter(MonthlySpendingSummary.count > 0)
+        .exists()
+    ).scalar()
+
+    if not has_transactions:
         flash("No transactions available for analysis.", "info")
         return redirect(url_for("transactions.transactions"))
 
-    # Convert to DataFrame for analysis
-    transactions_data = [
-        {
-            "amount": t.amount,
-            "date": t.transaction_date,
-            "description": t.description,
-            "merchant": t.merchant,
-            "category_id": t.category_id,
-            "is_expense": t.is_expense,
-        }
-        for t in user_transactions
-    ]
-
-    df = pd.DataFrame(transactions_data)
-
-    # Run analysis
-    analysis_results = analyze_transactions(df)
+    # ?history=full analyzes every transaction, archived ones included;
+    # otherwise the monthly summary and daily rollup are enough
+    full_history = request.args.get("history") == "full"
+    if full_history:
+        analysis_results = analyze_transactions(transaction_history(current_user.id))
+    else:
+        analysis_results = analyze_spending(current_user.id)
 
     # Get categories for the report
-    categories = {c.id: c.name for c in Category.query.all()}
+    categories = get_category_names()
 
     return render_template(
-        "transaction_analysis.html", results=analysis_results, categories=categories
+        "transaction_analysis.html",
+        results=analysis_results,
+        categories=categories,
+        full_history=full_history,
     )
 
 
@@ -140,14 +177,14 @@ def update_transaction_category(transaction_id):
 
     # Validate transaction belongs to user
     transaction = (
-        Transaction.query.join(BankAccount)
-        .filter(BankAccount.user_id == current_user.id)
+        Transaction.query.filter_by(user_id=current_user.id)
         .filter(Transaction.id == transaction_id)
         .first_or_404()
     )
 
-    # Update category
+    # Update category and remember the choice for this merchant
     transaction.category_id = category_id
+    record_merchant_override(current_user.id, transaction.merchant, category_id)
     db.session.commit()
 
     flash("Transaction category updated successfully.", "success")
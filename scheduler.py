@@ -0,0 +1,18 @@
+import argparse
+from app import app
+from services.sync_scheduler import METRICS_PORT, SyncScheduler, start_metrics_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Queue periodic bank syncs")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT)
+    args = parser.parse_args()
+
+    scheduler = SyncScheduler()
+    start_metrics_server(scheduler.metrics, args.metrics_port)
+    with app.app_context():
+        scheduler.run()
+
+
+if __name__ == "__main__":
+    main()
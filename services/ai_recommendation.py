@@ -1,10 +1,11 @@
 import json
 import os
 import logging
-from datetime import datetime, timedelta
 from app import db
-from models import Transaction, BankAccount, Category, Recommendation
-import pandas as pd
+from models import Recommendation
+from services.category_registry import get_categories
+from services.spending_rollup import spending_summary
+from services.transaction_archive import history_range
 from openai import OpenAI
 from dotenv import load_dotenv
 
@@ -52,17 +53,13 @@ def generate_ai_recommendations(user_id):
             db.session.delete(rec)
         db.session.commit()
 
-        # Get user's transactions
-        transactions = (
-            Transaction.query.join(BankAccount)
-            .filter(BankAccount.user_id == user_id)
-            .all()
-        )
+        # Totals per category and month come from the monthly summary
+        summary = spending_summary(user_id)
 
         # Get categories
-        categories = {c.id: c for c in Category.query.all()}
+        categories = {c.id: c for c in get_categories()}
 
-        if not transactions:
+        if not summary["transactions_count"]:
             # No transactions, create a basic recommendation
             new_recommendation = Recommendation(
                 user_id=user_id,
@@ -74,76 +71,33 @@ def generate_ai_recommendations(user_id):
             db.session.commit()
             return 1, False
 
-        # Convert to DataFrame for analysis
-        transactions_data = [
-            {
-                "id": t.id,
-                "amount": t.amount,
-                "date": t.transaction_date,
-                "description": t.description,
-                "merchant": t.merchant,
-                "category_id": t.category_id,
-                "category_name": (
-                    categories[t.category_id].name
-                    if t.category_id and t.category_id in categories
-                    else "Unknown"
-                ),
-                "is_expense": t.is_expense,
-                "account_id": t.account_id,
-            }
-            for t in transactions
-        ]
-
-        df = pd.DataFrame(transactions_data)
-
         # Calculate some basic statistics to provide to the model
-        stats = {}
-
-        # Overall spending
-        stats["total_spent"] = float(df[df["is_expense"] == True]["amount"].sum())
-        stats["total_income"] = float(df[df["is_expense"] == False]["amount"].sum())
-
-        # Monthly calculations
-        current_month = datetime.now().replace(
-            day=1, hour=0, minute=0, second=0, microsecond=0
-        )
-        prev_month = (current_month - timedelta(days=1)).replace(day=1)
-
-        current_month_expenses = df[
-            (df["is_expense"] == True) & (df["date"] >= current_month)
-        ]
-        prev_month_expenses = df[
-            (df["is_expense"] == True)
-            & (df["date"] >= prev_month)
-            & (df["date"] < current_month)
-        ]
-
-        stats["current_month_spent"] = float(
-            current_month_expenses["amount"].sum()
-            if not current_month_expenses.empty
-            else 0
-        )
-        stats["prev_month_spent"] = float(
-            prev_month_expenses["amount"].sum() if not prev_month_expenses.empty else 0
-        )
+        stats = {
+            "total_spent": float(summary["total_spent"]),
+            "total_income": float(summary["total_income"]),
+            "current_month_spent": float(summary["current_month_spent"]),
+            "prev_month_spent": float(summary["prev_month_spent"]),
+        }
 
         # Category spending
         category_spending = {}
-        expenses_df = df[df["is_expense"] == True]
-        if not expenses_df.empty and "category_name" in expenses_df.columns:
-            for category_name, group in expenses_df.groupby("category_name"):
-                category_spending[category_name] = float(group["amount"].sum())
+        for category_id, total in summary["category_spending"].items():
+            category_name = (
+                categories[category_id].name if category_id in categories else "Unknown"
+            )
+            category_spending[category_name] = (
+                category_spending.get(category_name, 0.0) + total
+            )
 
         stats["category_spending"] = category_spending
 
         # Create JSON for AI
+        first_date, last_date = history_range(user_id)
         data_for_ai = {
-            "transactions_count": len(transactions),
+            "transactions_count": summary["transactions_count"],
             "date_range": {
-                "start": (
-                    df["date"].min().strftime("%Y-%m-%d") if not df.empty else "N/A"
-                ),
-                "end": df["date"].max().strftime("%Y-%m-%d") if not df.empty else "N/A",
+                "start": first_date.strftime("%Y-%m-%d") if first_date else "N/A",
+                "end": last_date.strftime("%Y-%m-%d") if last_date else "N/A",
             },
             "financial_stats": stats,
         }
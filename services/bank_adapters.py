@@ -0,0 +1,411 @@
+import logging
+import os
+from collections import namedtuple
+from datetime import datetime, timedelta
+from services.bank_client import (
+    BACKOFF_BASE,
+    HTTP_TIMEOUT,
+    MAX_RETRIES,
+    CircuitBreaker,
+    request_with_retries,
+)
+
+logger = logging.getLogger(__name__)
+
+# "demo" serves generated data, "live" calls the bank APIs over HTTP
+BANK_API_MODE = os.environ.get("BANK_API_MODE", "demo")
+
+# expires_at is None for tokens that do not expire
+BankToken = namedtuple(
+    "BankToken", ["access_token", "refresh_token", "expires_at"], defaults=(None, None)
+)
+
+
+class BankAdapter:
+    """
+    Interface every bank integration implements
+
+    Adapters are registered by bank id with register_adapter(). All methods
+    are coroutines run on the shared bank client loop.
+    """
+
+    bank_id = None
+    name = None
+    logo = None
+
+    async def authenticate(self, credentials):
+        """
+        Exchange credentials for an access token
+
+        Returns:
+            BankToken: The token, with its refresh token and expiry if any
+        """
+        raise NotImplementedError
+
+    async def refresh(self, refresh_token):
+        """
+        Exchange a refresh token for a new access token
+
+        Returns:
+            BankToken: The new token
+        """
+        raise NotImplementedError
+
+    async def fetch_accounts(self, access_token):
+        """
+        List the user's accounts
+
+        Returns:
+            list: Dictionaries with account_number, account_type, balance
+                and currency
+        """
+        raise NotImplementedError
+
+    async def iter_transaction_pages(self, access_token, account_number, since, until):
+        """
+        Yield an account's transactions between since and until page by page
+
+        Only one page needs to be held in memory, however long the history.
+
+        Yields:
+            list: Transaction dictionaries as consumed by ingest_transactions
+        """
+        raise NotImplementedError
+        yield
+
+    async def fetch_transactions(self, access_token, account_number, since, until):
+        """List an account's transactions between since and until"""
+        transactions = []
+        async for page in self.iter_transaction_pages(
+            access_token, account_number, since, until
+        ):
+            transactions.extend(page)
+        return transactions
+
+
+class DemoBankAdapter(BankAdapter):
+    """Bank without an API integration yet; serves generated data"""
+
+    # (account number prefix, account type, balance)
+    demo_accounts = [
+        ("debit", "Дебетовая карта", 45000.0),
+        ("credit", "Кредитная карта", 75000.0),
+    ]
+
+    def __init__(self, bank_id, name, logo, demo_accounts=None):
+        self.bank_id = bank_id
+        self.name = name
+        self.logo = logo
+        if demo_accounts is not None:
+            self.demo_accounts = demo_accounts
+
+    async def authenticate(self, credentials):
+        logger.debug(f"Simulating connection to {self.bank_id}")
+        return BankToken(f"{self.bank_id}_demo_token_{datetime.utcnow().timestamp()}")
+
+    async def refresh(self, refresh_token):
+        return await self.authenticate({})
+
+    async def fetch_accounts(self, access_token):
+        logger.debug(f"Simulating account fetch for {self.bank_id}")
+        timestamp = datetime.utcnow().timestamp()
+        return [
+            {
+                "account_number": f"{self.bank_id}_{prefix}_{timestamp}",
+                "account_type": account_type,
+                "balance": balance,
+                "currency": "RUB",
+            }
+            for prefix, account_type, balance in self.demo_accounts
+        ]
+
+    async def iter_transaction_pages(self, access_token, account_number, since, until):
+        logger.debug(
+            f"Simulating transactions for {self.bank_id} account {account_number}"
+        )
+        yield generate_sample_transactions(
+            self.bank_id, account_number, since=since, until=until
+        )
+
+
+class HttpBankAdapter(DemoBankAdapter):
+    """
+    Bank with a REST API
+
+    Requests go through the shared pooled client with this bank's timeout,
+    retries and circuit breaker. Outside live mode the demo data is served.
+    """
+
+    def __init__(
+        self,
+        bank_id,
+        name,
+        logo,
+        base_url,
+        demo_accounts=None,
+        timeout=HTTP_TIMEOUT,
+        max_retries=MAX_RETRIES,
+        backoff_base=BACKOFF_BASE,
+        live=None,
+    ):
+        super().__init__(bank_id, name, logo, demo_accounts)
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.live = BANK_API_MODE == "live" if live is None else live
+        self.breaker = CircuitBreaker()
+
+    async def request(self, method, path, access_token=None, **kwargs):
+        headers = kwargs.pop("headers", {})
+        if access_token:
+            headers["Authorization"] = f"Bearer {access_token}"
+        response = await request_with_retries(
+            self.breaker,
+            method,
+            f"{self.base_url}{path}",
+            timeout=self.timeout,
+            max_retries=self.max_retries,
+            backoff_base=self.backoff_base,
+            headers=headers,
+            **kwargs,
+        )
+        return response.json()
+
+    async def authenticate(self, credentials):
+        if not self.live:
+            return await super().authenticate(credentials)
+        data = await self.request("POST", "/auth", json=credentials)
+        return self.parse_token(data)
+
+    async def refresh(self, refresh_token):
+        if not self.live:
+            return await super().refresh(refresh_token)
+        data = await self.request(
+            "POST", "/auth/refresh", json={"refreshToken": refresh_token}
+        )
+        return self.parse_token(data)
+
+    def parse_token(self, data):
+        """Convert an API auth response into a BankToken"""
+        expires_in = data.get("expiresIn")
+        return BankToken(
+            access_token=data["accessToken"],
+            refresh_token=data.get("refreshToken"),
+            expires_at=(
+                datetime.utcnow() + timedelta(seconds=expires_in)
+                if expires_in
+                else None
+            ),
+        )
+
+    async def fetch_accounts(self, access_token):
+        if not self.live:
+            return await super().fetch_accounts(access_token)
+        data = await self.request("GET", "/accounts", access_token)
+        return [
+            {
+                "account_number": acc["accountNumber"],
+                "account_type": acc["accountType"],
+                "balance": acc["balance"],
+                "currency": acc["currency"],
+            }
+            for acc in data["accounts"]
+        ]
+
+    async def iter_transaction_pages(self, access_token, account_number, since, until):
+        if not self.live:
+            async for page in super().iter_transaction_pages(
+                access_token, account_number, since, until
+            ):
+                yield page
+            return
+
+        params = {"from": since.isoformat(), "to": until.isoformat()}
+        while True:
+            data = await self.request(
+                "GET",
+                f"/accounts/{account_number}/transactions",
+                access_token,
+                params=params,
+            )
+            yield [self.parse_transaction(tx) for tx in data["transactions"]]
+            if not data.get("nextPageToken"):
+                return
+            params = {**params, "pageToken": data["nextPageToken"]}
+
+    def parse_merchant(self, tx):
+        return tx.get("merchant") or ""
+
+    def parse_transaction(self, tx):
+        """Convert an API transaction into our transaction dictionary"""
+        amount = float(tx["amount"])
+        return {
+            "external_id": str(tx["id"]),
+            "amount": abs(amount),
+            "currency": tx.get("currency", "RUB"),
+            "description": tx.get("description", ""),
+            "date": datetime.fromisoformat(tx["date"]),
+            "merchant": self.parse_merchant(tx),
+            "is_expense": tx.get("isExpense", amount < 0),
+        }
+
+
+class TinkoffAdapter(HttpBankAdapter):
+    def parse_merchant(self, tx):
+        # Tinkoff nests the merchant as {"name": ...}
+        return (tx.get("merchant") or {}).get("name", "")
+
+
+_adapters = {}
+
+
+def register_adapter(adapter):
+    """Make a bank available under adapter.bank_id"""
+    _adapters[adapter.bank_id.lower()] = adapter
+    return adapter
+
+
+def get_adapter(bank_name):
+    """Return the adapter for a bank id, or None if the bank is unsupported"""
+    return _adapters.get((bank_name or "").lower())
+
+
+def get_adapters():
+    """Registered adapters in registration order"""
+    return list(_adapters.values())
+
+
+def generate_sample_transactions(
+    bank_name, account_number, days=30, since=None, until=None
+):
+    """
+    Generate sample transactions for demo purposes
+
+    Without since, 50 transactions spread over the last 'days' days are
+    generated. With since, the count is proportional to the window length so
+    incremental syncs of a short window return only a few transactions.
+    """
+    from random import randint, choice, uniform
+
+    # Common Russian merchants and transaction descriptions
+    merchants = [
+        "Пятёрочка",
+        "Магнит",
+        "OZON",
+        "Wildberries",
+        "Яндекс.Такси",
+        "Dodo Пицца",
+        "Лента",
+        "Перекрёсток",
+        "М.Видео",
+        "Starbucks",
+        "KFC",
+        "McDonald's",
+        "IKEA",
+        "АЗС Газпром",
+        "Аптека 36.6",
+        "Okko",
+        "Детский мир",
+        "H&M",
+        "Zara",
+        "DNS",
+        "Спортмастер",
+    ]
+
+    transaction_types = [
+        "Оплата",
+        "Покупка",
+        "Платеж",
+        "Перевод",
+        "Списание",
+        "Снятие наличных",
+    ]
+
+    transactions = []
+    now = until or datetime.utcnow()
+
+    if since is None:
+        window = timedelta(days=days)
+        count = 50
+    else:
+        window = max(now - since, timedelta(0))
+        count = round(50 * window / timedelta(days=30))
+
+    # Generate random transactions
+    for i in range(count):
+        # Random date within the window
+        date = now - timedelta(seconds=uniform(0, window.total_seconds()))
+
+        # Random amount (mostly expenses, some income)
+        is_expense = randint(0, 9) < 8  # 80% chance of expense
+
+        amount = 0
+        if is_expense:
+            # Expenses: typically between 100 and 5000 rubles
+            amount = round(uniform(100, 5000), 2)
+        else:
+            # Income: typically larger amounts
+            amount = round(uniform(5000, 50000), 2)
+
+        # For expenses, amount is negative
+        if is_expense:
+            amount = -amount
+
+        merchant = choice(merchants) if is_expense else ""
+        transaction_type = choice(transaction_types) if is_expense else "Зачисление"
+
+        description = ""
+        if is_expense:
+            description = f"{transaction_type} {merchant}"
+        else:
+            description = (
+                "Зачисление средств" if randint(0, 1) == 0 else "Перевод от клиента"
+            )
+
+        # Create transaction object
+        transaction = {
+            "external_id": f"{bank_name}_{account_number}_{i}_{date.timestamp()}",
+            "amount": abs(amount),  # Store as positive number
+            "currency": "RUB",
+            "description": description,
+            "date": date,
+            "merchant": merchant if is_expense else "",
+            "is_expense": is_expense,
+        }
+
+        transactions.append(transaction)
+
+    # Sort by date, newest first
+    transactions.sort(key=lambda x: x["date"], reverse=True)
+
+    return transactions
+
+
+register_adapter(
+    TinkoffAdapter(
+        "tinkoff",
+        "Тинькофф Банк",
+        "tinkoff.svg",
+        os.environ.get("TINKOFF_API_URL", "https://api.tinkoff.ru/v1"),
+        demo_accounts=[
+            ("black", "Дебетовая карта Tinkoff Black", 135750.25),
+            ("platinum", "Кредитная карта Tinkoff Platinum", 50000.0),
+        ],
+    )
+)
+register_adapter(
+    HttpBankAdapter(
+        "sber",
+        "Сбербанк",
+        "sber.svg",
+        os.environ.get("SBER_API_URL", "https://api.sberbank.ru/v1"),
+        demo_accounts=[
+            ("debit", "Дебетовая карта СберКарта", 87500.0),
+            ("savings", "Сберегательный счёт", 250000.0),
+        ],
+    )
+)
+register_adapter(DemoBankAdapter("vtb", "ВТБ", "vtb.svg"))
+register_adapter(DemoBankAdapter("alpha", "Альфа-Банк", "alpha.svg"))
+register_adapter(DemoBankAdapter("gazprombank", "Газпромбанк", "gazprombank.svg"))
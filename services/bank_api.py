@@ -1,30 +1,33 @@
-import httpx
 import logging
-import json
 from datetime import datetime, timedelta
 from app import db
-from models import Transaction
-from services.transaction_analyzer import categorize_transaction
+from models import BankAccount
+from services.bank_adapters import (
+    generate_sample_transactions,
+    get_adapter,
+    get_adapters,
+)
+from services.bank_client import run_sync, stream_limited
+from services.bank_tokens import apply_token, cache_accounts, get_cached_accounts
+from services.transaction_ingest import ingest_transactions
 
 logger = logging.getLogger(__name__)
 
-# Constants
-TINKOFF_API_URL = "https://api.tinkoff.ru/v1"
-SBER_API_URL = "https://api.sberbank.ru/v1"
-
-# Mock banks for development (in real app, this would be from a database)
-SUPPORTED_BANKS = [
-    {"id": "tinkoff", "name": "Тинькофф Банк", "logo": "tinkoff.svg"},
-    {"id": "sber", "name": "Сбербанк", "logo": "sber.svg"},
-    {"id": "vtb", "name": "ВТБ", "logo": "vtb.svg"},
-    {"id": "alpha", "name": "Альфа-Банк", "logo": "alpha.svg"},
-    {"id": "gazprombank", "name": "Газпромбанк", "logo": "gazprombank.svg"},
-]
+# Transaction history is fetched and committed in windows of this many days
+SYNC_PAGE_DAYS = 7
+# Days before the sync cursor fetched again, for transactions the bank posts
+# late with an earlier date; ingest skips the ones already imported
+SYNC_OVERLAP_DAYS = 3
+# Upper bound on bank calls made while a web request waits, retries included
+CONNECT_DEADLINE_SECONDS = 15
 
 
 def get_supported_banks():
     """Return list of supported banks"""
-    return SUPPORTED_BANKS
+    return [
+        {"id": adapter.bank_id, "name": adapter.name, "logo": adapter.logo}
+        for adapter in get_adapters()
+    ]
 
 
 def connect_to_bank(bank_name, credentials):
@@ -36,401 +39,300 @@ def connect_to_bank(bank_name, credentials):
         credentials (dict): Authentication credentials
 
     Returns:
-        str: Access token if successful, None otherwise
+        BankToken: Access token (with refresh token and expiry if the bank
+            issues them) if successful, None otherwise
     """
-    try:
-        if bank_name.lower() == "tinkoff":
-            return connect_to_tinkoff(credentials)
-        elif bank_name.lower() == "sber":
-            return connect_to_sber(credentials)
-        elif bank_name.lower() in ["vtb", "alpha", "gazprombank"]:
-            # For demo purposes, simulate connection to other banks
-            logger.debug(f"Simulating connection to {bank_name}")
-            # In a real app, we would make an actual API call here
-            return f"demo_token_{bank_name}_{datetime.utcnow().timestamp()}"
-        else:
-            logger.error(f"Unsupported bank: {bank_name}")
-            return None
-    except Exception as e:
-        logger.error(f"Error connecting to {bank_name}: {str(e)}")
+    adapter = get_adapter(bank_name)
+    if adapter is None:
+        logger.error(f"Unsupported bank: {bank_name}")
         return None
 
-
-def connect_to_tinkoff(credentials):
-    """Connect to Tinkoff Bank API"""
-    try:
-        # In a real app, this would make an actual API call to Tinkoff
-        # For demo purposes, simulate a successful connection
-        logger.debug("Connecting to Tinkoff Bank API")
-
-        # In a real app, we would use:
-        # async with httpx.AsyncClient() as client:
-        #     response = await client.post(
-        #         f"{TINKOFF_API_URL}/auth",
-        #         json=credentials
-        #     )
-        #     response.raise_for_status()
-        #     return response.json()["accessToken"]
-
-        return f"tinkoff_demo_token_{datetime.utcnow().timestamp()}"
-    except Exception as e:
-        logger.error(f"Error connecting to Tinkoff: {str(e)}")
-        raise
-
-
-def connect_to_sber(credentials):
-    """Connect to Sberbank API"""
     try:
-        # In a real app, this would make an actual API call to Sberbank
-        # For demo purposes, simulate a successful connection
-        logger.debug("Connecting to Sberbank API")
-
-        # In a real app, we would use:
-        # async with httpx.AsyncClient() as client:
-        #     response = await client.post(
-        #         f"{SBER_API_URL}/auth",
-        #         json=credentials
-        #     )
-        #     response.raise_for_status()
-        #     return response.json()["accessToken"]
-
-        return f"sber_demo_token_{datetime.utcnow().timestamp()}"
+        return run_sync(
+            adapter.authenticate(credentials), timeout=CONNECT_DEADLINE_SECONDS
+        )
     except Exception as e:
-        logger.error(f"Error connecting to Sberbank: {str(e)}")
-        raise
+        logger.error(f"Error connecting to {bank_name}: {str(e)}")
+        return None
 
 
-def fetch_account_data(bank_name, access_token):
+def fetch_account_data(bank_name, access_token, use_cache=True):
     """
     Fetch account information from bank
 
+    The list is cached per token for ACCOUNT_CACHE_TTL seconds, so syncing
+    several accounts of one connection asks the bank only once.
+
     Args:
         bank_name (str): Name of the bank
         access_token (str): Authentication token
+        use_cache (bool): Whether a recently fetched list may be returned
 
     Returns:
         list: List of account information dictionaries
     """
+    adapter = get_adapter(bank_name)
+    if adapter is None:
+        logger.error(f"Unsupported bank: {bank_name}")
+        return []
+
+    if use_cache:
+        accounts = get_cached_accounts(bank_name, access_token)
+        if accounts is not None:
+            return accounts
+
     try:
-        if bank_name.lower() == "tinkoff":
-            return fetch_tinkoff_accounts(access_token)
-        elif bank_name.lower() == "sber":
-            return fetch_sber_accounts(access_token)
-        elif bank_name.lower() in ["vtb", "alpha", "gazprombank"]:
-            # For demo purposes, simulate accounts for other banks
-            logger.debug(f"Simulating account fetch for {bank_name}")
-
-            # Generate sample accounts
-            return [
-                {
-                    "account_number": f"{bank_name}_debit_{datetime.utcnow().timestamp()}",
-                    "account_type": "Дебетовая карта",
-                    "balance": 45000.0,
-                    "currency": "RUB",
-                },
-                {
-                    "account_number": f"{bank_name}_credit_{datetime.utcnow().timestamp()}",
-                    "account_type": "Кредитная карта",
-                    "balance": 75000.0,
-                    "currency": "RUB",
-                },
-            ]
-        else:
-            logger.error(f"Unsupported bank: {bank_name}")
-            return []
+        accounts = run_sync(adapter.fetch_accounts(access_token))
     except Exception as e:
         logger.error(f"Error fetching accounts from {bank_name}: {str(e)}")
         raise
+    cache_accounts(bank_name, access_token, accounts)
+    return accounts
 
 
-def fetch_tinkoff_accounts(access_token):
-    """Fetch account information from Tinkoff Bank"""
-    try:
-        # In a real app, this would make an actual API call to Tinkoff
-        # For demo purposes, simulate account data
-        logger.debug("Fetching Tinkoff accounts")
-
-        # In a real app, we would use:
-        # async with httpx.AsyncClient() as client:
-        #     response = await client.get(
-        #         f"{TINKOFF_API_URL}/accounts",
-        #         headers={"Authorization": f"Bearer {access_token}"}
-        #     )
-        #     response.raise_for_status()
-        #     return [
-        #         {
-        #             "account_number": acc["accountNumber"],
-        #             "account_type": acc["accountType"],
-        #             "balance": acc["balance"],
-        #             "currency": acc["currency"]
-        #         }
-        #         for acc in response.json()["accounts"]
-        #     ]
-
-        # Return demo accounts
-        return [
-            {
-                "account_number": f"tinkoff_black_{datetime.utcnow().timestamp()}",
-                "account_type": "Дебетовая карта Tinkoff Black",
-                "balance": 135750.25,
-                "currency": "RUB",
-            },
-            {
-                "account_number": f"tinkoff_platinum_{datetime.utcnow().timestamp()}",
-                "account_type": "Кредитная карта Tinkoff Platinum",
-                "balance": 50000.0,
-                "currency": "RUB",
-            },
-        ]
-    except Exception as e:
-        logger.error(f"Error fetching Tinkoff accounts: {str(e)}")
-        raise
+def fetch_transactions(
+    bank_name, access_token, account_number, days=30, since=None, until=None
+):
+    """
+    Fetch transaction history for an account
 
+    Args:
+        bank_name (str): Name of the bank
+        access_token (str): Authentication token
+        account_number (str): Account number
+        days (int): Number of days of history to fetch when since is not given
+        since (datetime): Only fetch transactions at or after this time
+        until (datetime): Only fetch transactions before this time
 
-def fetch_sber_accounts(access_token):
-    """Fetch account information from Sberbank"""
-    try:
-        # In a real app, this would make an actual API call to Sberbank
-        # For demo purposes, simulate account data
-        logger.debug("Fetching Sberbank accounts")
-
-        # In a real app, we would use:
-        # async with httpx.AsyncClient() as client:
-        #     response = await client.get(
-        #         f"{SBER_API_URL}/accounts",
-        #         headers={"Authorization": f"Bearer {access_token}"}
-        #     )
-        #     response.raise_for_status()
-        #     return [
-        #         {
-        #             "account_number": acc["accountNumber"],
-        #             "account_type": acc["accountType"],
-        #             "balance": acc["balance"],
-        #             "currency": acc["currency"]
-        #         }
-        #         for acc in response.json()["accounts"]
-        #     ]
-
-        # Return demo accounts
-        return [
-            {
-                "account_number": f"sber_debit_{datetime.utcnow().timestamp()}",
-                "account_type": "Дебетовая карта СберКарта",
-                "balance": 87500.0,
-                "currency": "RUB",
-            },
-            {
-                "account_number": f"sber_savings_{datetime.utcnow().timestamp()}",
-                "account_type": "Сберегательный счёт",
-                "balance": 250000.0,
-                "currency": "RUB",
-            },
-        ]
-    except Exception as e:
-        logger.error(f"Error fetching Sberbank accounts: {str(e)}")
-        raise
+    Returns:
+        list: List of transaction dictionaries
+    """
+    until = until or datetime.utcnow()
+    since = since or until - timedelta(days=days)
+    return run_sync(
+        fetch_transactions_async(bank_name, access_token, account_number, since, until)
+    )
 
 
-def fetch_transactions(bank_name, access_token, account_number, days=30):
+async def fetch_transactions_async(
+    bank_name, access_token, account_number, since, until
+):
     """
-    Fetch transaction history for an account
+    Fetch transaction history for an account (coroutine)
 
     Args:
         bank_name (str): Name of the bank
         access_token (str): Authentication token
         account_number (str): Account number
-        days (int): Number of days of history to fetch
+        since (datetime): Only fetch transactions at or after this time
+        until (datetime): Only fetch transactions before this time
 
     Returns:
         list: List of transaction dictionaries
     """
-    try:
-        if bank_name.lower() == "tinkoff":
-            return fetch_tinkoff_transactions(access_token, account_number, days)
-        elif bank_name.lower() == "sber":
-            return fetch_sber_transactions(access_token, account_number, days)
-        elif bank_name.lower() in ["vtb", "alpha", "gazprombank"]:
-            # For demo purposes, generate transactions for other banks
-            logger.debug(
-                f"Simulating transactions for {bank_name} account {account_number}"
-            )
+    adapter = get_adapter(bank_name)
+    if adapter is None:
+        logger.error(f"Unsupported bank: {bank_name}")
+        return []
 
-            # Generate sample transactions
-            return generate_sample_transactions(bank_name, account_number, days)
-        else:
-            logger.error(f"Unsupported bank: {bank_name}")
-            return []
+    try:
+        return await adapter.fetch_transactions(
+            access_token, account_number, since, until
+        )
     except Exception as e:
         logger.error(f"Error fetching transactions from {bank_name}: {str(e)}")
         raise
 
 
-def fetch_tinkoff_transactions(access_token, account_number, days=30):
-    """Fetch transaction history from Tinkoff Bank"""
-    try:
-        # In a real app, this would make an actual API call to Tinkoff
-        # For demo purposes, generate sample transactions
-        logger.debug(f"Fetching Tinkoff transactions for account {account_number}")
-
-        # In a real app, we would use:
-        # from_date = (datetime.utcnow() - timedelta(days=days)).strftime("%Y-%m-%d")
-        # async with httpx.AsyncClient() as client:
-        #     response = await client.get(
-        #         f"{TINKOFF_API_URL}/accounts/{account_number}/transactions",
-        #         headers={"Authorization": f"Bearer {access_token}"},
-        #         params={"from": from_date}
-        #     )
-        #     response.raise_for_status()
-        #     return [
-        #         {
-        #             "external_id": tx["id"],
-        #             "amount": tx["amount"],
-        #             "currency": tx["currency"],
-        #             "description": tx["description"],
-        #             "date": datetime.fromisoformat(tx["date"]),
-        #             "merchant": tx.get("merchant", {}).get("name", "")
-        #         }
-        #         for tx in response.json()["transactions"]
-        #     ]
-
-        # Return demo transactions
-        return generate_sample_transactions("tinkoff", account_number, days)
-    except Exception as e:
-        logger.error(f"Error fetching Tinkoff transactions: {str(e)}")
-        raise
+def save_bank_accounts(user_id, bank_name, token, accounts_data):
+    """
+    Create or update a user's accounts from fetched account data
 
+    Args:
+        user_id (int): Owner of the accounts
+        bank_name (str): Name of the bank
+        token (BankToken): Token the accounts were fetched with
+        accounts_data (list): Account dictionaries from fetch_account_data
 
-def fetch_sber_transactions(access_token, account_number, days=30):
-    """Fetch transaction history from Sberbank"""
-    try:
-        # In a real app, this would make an actual API call to Sberbank
-        # For demo purposes, generate sample transactions
-        logger.debug(f"Fetching Sberbank transactions for account {account_number}")
-
-        # In a real app, we would use:
-        # from_date = (datetime.utcnow() - timedelta(days=days)).strftime("%Y-%m-%d")
-        # async with httpx.AsyncClient() as client:
-        #     response = await client.get(
-        #         f"{SBER_API_URL}/accounts/{account_number}/transactions",
-        #         headers={"Authorization": f"Bearer {access_token}"},
-        #         params={"from": from_date}
-        #     )
-        #     response.raise_for_status()
-        #     return [
-        #         {
-        #             "external_id": tx["id"],
-        #             "amount": tx["amount"],
-        #             "currency": tx["currency"],
-        #             "description": tx["description"],
-        #             "date": datetime.fromisoformat(tx["date"]),
-        #             "merchant": tx.get("merchant", "")
-        #         }
-        #         for tx in response.json()["transactions"]
-        #     ]
-
-        # Return demo transactions
-        return generate_sample_transactions("sber", account_number, days)
-    except Exception as e:
-        logger.error(f"Error fetching Sberbank transactions: {str(e)}")
-        raise
+    Returns:
+        list: The BankAccount rows
+    """
+    accounts = []
+    for account_data in accounts_data:
+        # Check if account already exists
+        account = BankAccount.query.filter_by(
+            user_id=user_id,
+            bank_name=bank_name,
+            account_number=account_data["account_number"],
+        ).first()
+
+        if account:
+            # Update existing account
+            account.balance = account_data["balance"]
+            account.currency = account_data["currency"]
+            account.last_sync = datetime.utcnow()
+        else:
+            # Create new account
+            account = BankAccount(
+                user_id=user_id,
+                bank_name=bank_name,
+                account_number=account_data["account_number"],
+                account_type=account_data["account_type"],
+                balance=account_data["balance"],
+                currency=account_data["currency"],
+                last_sync=datetime.utcnow(),
+            )
+            db.session.add(account)
+        apply_token(account, token)
+        accounts.append(account)
 
+    db.session.commit()
+    return accounts
 
-def generate_sample_transactions(bank_name, account_number, days=30):
-    """Generate sample transactions for demo purposes"""
-    from random import randint, choice, uniform
-
-    # Common Russian merchants and transaction descriptions
-    merchants = [
-        "Пятёрочка",
-        "Магнит",
-        "OZON",
-        "Wildberries",
-        "Яндекс.Такси",
-        "Dodo Пицца",
-        "Лента",
-        "Перекрёсток",
-        "М.Видео",
-        "Starbucks",
-        "KFC",
-        "McDonald's",
-        "IKEA",
-        "АЗС Газпром",
-        "Аптека 36.6",
-        "Okko",
-        "Детский мир",
-        "H&M",
-        "Zara",
-        "DNS",
-        "Спортмастер",
-    ]
 
-    transaction_types = [
-        "Оплата",
-        "Покупка",
-        "Платеж",
-        "Перевод",
-        "Списание",
-        "Снятие наличных",
-    ]
+async def iter_transaction_pages(bank_name, access_token, account_number, since, until):
+    """
+    Yield an account's transactions page by page (async generator)
 
-    transactions = []
-    now = datetime.utcnow()
+    Args:
+        bank_name (str): Name of the bank
+        access_token (str): Authentication token
+        account_number (str): Account number
+        since (datetime): Only fetch transactions at or after this time
+        until (datetime): Only fetch transactions before this time
 
-    # Generate random transactions
-    for i in range(50):  # Generate 50 sample transactions
-        # Random date within the past 'days' days
-        days_ago = randint(0, days)
-        hours_ago = randint(0, 23)
-        minutes_ago = randint(0, 59)
+    Yields:
+        list: Transaction dictionaries
+    """
+    adapter = get_adapter(bank_name)
+    if adapter is None:
+        logger.error(f"Unsupported bank: {bank_name}")
+        return
 
-        date = now - timedelta(days=days_ago, hours=hours_ago, minutes=minutes_ago)
+    async for page in adapter.iter_transaction_pages(
+        access_token, account_number, since, until
+    ):
+        yield page
 
-        # Random amount (mostly expenses, some income)
-        is_expense = randint(0, 9) < 8  # 80% chance of expense
 
-        amount = 0
-        if is_expense:
-            # Expenses: typically between 100 and 5000 rubles
-            amount = round(uniform(100, 5000), 2)
-        else:
-            # Income: typically larger amounts
-            amount = round(uniform(5000, 50000), 2)
+async def _iter_account_history(bank_name, access_token, account_number, start, end):
+    """
+    Yield (until, page) for each page from start to end, oldest window first
 
-        # For expenses, amount is negative
-        if is_expense:
-            amount = -amount
+    After the last page of each SYNC_PAGE_DAYS window (until, None) is
+    yielded to mark the window as complete.
+    """
+    page_size = timedelta(days=SYNC_PAGE_DAYS)
+    since = start
+    while since < end:
+        until = min(since + page_size, end)
+        async for page in iter_transaction_pages(
+            bank_name, access_token, account_number, since, until
+        ):
+            yield until, page
+        yield until, None
+        since = until
+
+
+def sync_accounts_transactions(
+    bank_name, access_token, accounts, days=30, on_progress=None
+):
+    """
+    Import transactions newer than each account's sync cursor
+
+    The cursor (BankAccount.sync_cursor_date) marks the point up to which
+    history is complete. Each sync starts SYNC_OVERLAP_DAYS before it, so
+    transactions posted late with an earlier date are still picked up;
+    without a cursor the last 'days' days are imported.
+    History is fetched oldest first in windows of SYNC_PAGE_DAYS, with all
+    accounts fetched concurrently. Pages are streamed: each one is
+    categorized, inserted and committed before more are requested, so
+    memory stays flat however long the history is. A cursor advances when
+    its window is complete, so an interrupted backfill resumes where it
+    stopped.
 
-        merchant = choice(merchants) if is_expense else ""
-        transaction_type = choice(transaction_types) if is_expense else "Зачисление"
+    Args:
+        bank_name (str): Name of the bank
+        access_token (str): Authentication token
+        accounts (list): BankAccount rows of this bank to sync
+        days (int): History to import on the first sync
+        on_progress (callable): Called with the fraction of history done
+            before each completed window is committed
 
-        description = ""
-        if is_expense:
-            description = f"{transaction_type} {merchant}"
-        else:
-            description = (
-                "Зачисление средств" if randint(0, 1) == 0 else "Перевод от клиента"
+    Returns:
+        int: Number of new transactions
+    """
+    now = datetime.utcnow()
+    accounts_by_id = {account.id: account for account in accounts}
+    overlap = timedelta(days=SYNC_OVERLAP_DAYS)
+    starts = {
+        account.id: (
+            account.sync_cursor_date - overlap
+            if account.sync_cursor_date
+            else now - timedelta(days=days)
+        )
+        for account in accounts
+    }
+    total_span = sum(((now - start) for start in starts.values()), timedelta())
+    # Newest (date, external_id) seen in each account's current window
+    newest = {}
+
+    sources = {
+        account.id: _iter_account_history(
+            bank_name, access_token, account.account_number, starts[account.id], now
+        )
+        for account in accounts
+        if starts[account.id] < now
+    }
+
+    new_transaction_count = 0
+    for account_id, (until, page) in stream_limited(bank_name, sources):
+        account = accounts_by_id[account_id]
+
+        if page is not None:
+            new_transaction_count += ingest_transactions(
+                account.id, page, user_id=account.user_id
             )
+            if page:
+                last = max(page, key=lambda t: t["date"])
+                if account_id not in newest or last["date"] > newest[account_id][0]:
+                    newest[account_id] = (last["date"], last.get("external_id"))
+        else:
+            # Window complete
+            if account_id in newest:
+                account.sync_cursor = newest.pop(account_id)[1]
+            account.sync_cursor_date = until
+            starts[account_id] = until
+            if on_progress and total_span:
+                remaining = sum(
+                    ((now - start) for start in starts.values()), timedelta()
+                )
+                on_progress(1 - remaining / total_span)
 
-        # Create transaction object
-        transaction = {
-            "external_id": f"{bank_name}_{account_number}_{i}_{date.timestamp()}",
-            "amount": abs(amount),  # Store as positive number
-            "currency": "RUB",
-            "description": description,
-            "date": date,
-            "merchant": merchant if is_expense else "",
-            "is_expense": is_expense,
-        }
+        db.session.commit()
 
-        transactions.append(transaction)
+    return new_transaction_count
 
-    # Sort by date, newest first
-    transactions.sort(key=lambda x: x["date"], reverse=True)
 
-    return transactions
+def sync_account_transactions(bank_name, access_token, account, days=30):
+    """
+    Import transactions newer than one account's sync cursor
+
+    Args:
+        bank_name (str): Name of the bank
+        access_token (str): Authentication token
+        account (BankAccount): Account to sync
+        days (int): History to import on the first sync
+
+    Returns:
+        int: Number of new transactions
+    """
+    return sync_accounts_transactions(bank_name, access_token, [account], days)
 
 
-def sync_account_data(bank_name, access_token, account_number, account_id):
+def sync_account_data(
+    bank_name, access_token, account_number, account_id, on_progress=None
+):
     """
     Sync account data and transactions from bank
 
@@ -439,6 +341,7 @@ def sync_account_data(bank_name, access_token, account_number, account_id):
         access_token (str): Authentication token
         account_number (str): Account number
         account_id (int): Database ID of the account
+        on_progress (callable): Progress callback, see sync_accounts_transactions
 
     Returns:
         tuple: (new_balance, new_transaction_count)
@@ -458,53 +361,11 @@ def sync_account_data(bank_name, access_token, account_number, account_id):
 
         new_balance = account_data["balance"]
 
-        # Fetch latest transactions
-        transactions = fetch_transactions(bank_name, access_token, account_number)
-
-        # Insert new transactions
-        new_transaction_count = 0
-        for transaction_data in transactions:
-            # Check if transaction already exists
-            existing_transaction = Transaction.query.filter_by(
-                external_id=transaction_data["external_id"]
-            ).first()
-
-            if not existing_transaction:
-                # Categorize transaction
-                category_id = categorize_transaction(
-                    transaction_data["description"],
-                    transaction_data.get("merchant", ""),
-                )
-
-                # Make sure we have a valid category_id
-                if category_id is None:
-                    # Use the "Other" category if categorization fails
-                    from models import Category
-
-                    other_category = Category.query.filter_by(name="Другое").first()
-                    if other_category:
-                        category_id = other_category.id
-                    else:
-                        # If we somehow don't have an "Other" category, log error and skip
-                        logger.error("Failed to find 'Other' category")
-                        continue
-
-                # Create new transaction
-                new_transaction = Transaction(
-                    account_id=account_id,
-                    external_id=transaction_data["external_id"],
-                    amount=transaction_data["amount"],
-                    currency=transaction_data["currency"],
-                    description=transaction_data["description"],
-                    transaction_date=transaction_data["date"],
-                    merchant=transaction_data.get("merchant", ""),
-                    category_id=category_id,
-                    is_expense=transaction_data["is_expense"],
-                )
-                db.session.add(new_transaction)
-                new_transaction_count += 1
-
-        db.session.commit()
+        # Fetch transactions newer than the sync cursor
+        account = db.session.get(BankAccount, account_id)
+        new_transaction_count = sync_accounts_transactions(
+            bank_name, access_token, [account], on_progress=on_progress
+        )
 
         return new_balance, new_transaction_count
     except Exception as e:
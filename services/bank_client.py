@@ -0,0 +1,325 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Connection pool shared by every bank API call in the process
+HTTP_MAX_CONNECTIONS = int(os.environ.get("BANK_HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE = int(os.environ.get("BANK_HTTP_MAX_KEEPALIVE", 20))
+HTTP_KEEPALIVE_EXPIRY = 30.0
+HTTP_TIMEOUT = float(os.environ.get("BANK_HTTP_TIMEOUT", 10.0))
+# Maximum concurrent requests to a single bank from this process
+BANK_CONCURRENCY_LIMIT = int(os.environ.get("BANK_CONCURRENCY_LIMIT", 8))
+# Retries after the first attempt, with exponential backoff from BACKOFF_BASE
+MAX_RETRIES = 2
+BACKOFF_BASE = 0.2
+# Consecutive failures that open a bank's circuit, and how long it stays open
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 30.0
+# Responses worth retrying; other 4xx errors are the caller's fault
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class BankAPIError(Exception):
+    """A bank API request failed"""
+
+
+class BankUnavailableError(BankAPIError):
+    """The bank's circuit is open; requests fail without being sent"""
+
+
+class _LoopState:
+    """Event loop thread, HTTP client and semaphores owned by one process"""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.loop = asyncio.new_event_loop()
+        self.client = None
+        self.semaphores = {}
+        self.thread = threading.Thread(
+            target=self.loop.run_forever, name="bank-client-loop", daemon=True
+        )
+        self.thread.start()
+
+
+_state = None
+_state_lock = threading.Lock()
+
+
+def _get_state():
+    """Start the background loop on first use, and again after a fork"""
+    global _state
+    if _state is None or _state.pid != os.getpid():
+        with _state_lock:
+            if _state is None or _state.pid != os.getpid():
+                _state = _LoopState()
+    return _state
+
+
+def run_sync(coro, timeout=None):
+    """
+    Run a coroutine on the shared bank client loop and wait for the result
+
+    This is the bridge Flask views and other synchronous code use to call
+    the async bank layer.
+
+    Args:
+        coro (coroutine): Coroutine to run
+        timeout (float): Seconds to wait, None to wait indefinitely
+
+    Returns:
+        The coroutine's result; its exception is re-raised here
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, _get_state().loop)
+    try:
+        return future.result(timeout)
+    except TimeoutError:
+        future.cancel()
+        raise
+
+
+def get_async_client():
+    """
+    Return the pooled httpx.AsyncClient for this process
+
+    Must be called from a coroutine running under run_sync, as the client is
+    bound to the background loop.
+    """
+    state = _get_state()
+    if state.client is None:
+        state.client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+    return state.client
+
+
+def get_bank_semaphore(bank_name):
+    """Return the semaphore limiting concurrent requests to one bank"""
+    semaphores = _get_state().semaphores
+    key = bank_name.lower()
+    if key not in semaphores:
+        semaphores[key] = asyncio.Semaphore(BANK_CONCURRENCY_LIMIT)
+    return semaphores[key]
+
+
+class CircuitBreaker:
+    """
+    Stops calling a bank after repeated failures
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    fail immediately. Once reset_seconds have passed one trial call is let
+    through: success closes the circuit, failure opens it again.
+    """
+
+    def __init__(
+        self,
+        failure_threshold=BREAKER_FAILURE_THRESHOLD,
+        reset_seconds=BREAKER_RESET_SECONDS,
+        clock=time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        """Whether a call may be made now"""
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+            self.trial_running = False
+
+    def release_trial(self):
+        """Let another trial call through after one ended without an answer"""
+        with self.lock:
+            self.trial_running = False
+
+
+async def request_with_retries(
+    breaker,
+    method,
+    url,
+    timeout=HTTP_TIMEOUT,
+    max_retries=MAX_RETRIES,
+    backoff_base=BACKOFF_BASE,
+    **kwargs,
+):
+    """
+    Send a request on the pooled client with retries and a circuit breaker
+
+    Connection errors, timeouts and 429/5xx responses are retried with
+    exponential backoff and jitter. Every failed attempt counts against the
+    breaker, so a broken bank is cut off quickly.
+
+    Args:
+        breaker (CircuitBreaker): The bank's breaker
+        method (str): HTTP method
+        url (str): Request URL
+        timeout (float): Per-attempt timeout in seconds
+        max_retries (int): Retries after the first attempt
+        backoff_base (float): Delay before the first retry in seconds
+        **kwargs: Passed to httpx.AsyncClient.request
+
+    Returns:
+        httpx.Response: A successful response
+
+    Raises:
+        BankUnavailableError: The circuit is open
+        BankAPIError: The request failed after all retries
+    """
+    client = get_async_client()
+    for attempt in range(max_retries + 1):
+        if not breaker.allow():
+            raise BankUnavailableError(f"Circuit open for {url}")
+
+        try:
+            response = await client.request(method, url, timeout=timeout, **kwargs)
+        except httpx.TransportError as e:
+            error = BankAPIError(f"{method} {url} failed: {e!r}")
+        except BaseException:
+            # Cancelled (a run_sync deadline) or failed for a reason that says
+            # nothing about the bank; a half-open circuit must not wait for
+            # this trial forever
+            breaker.release_trial()
+            raise
+        else:
+            if response.status_code < 400:
+                breaker.record_success()
+                return response
+            error = BankAPIError(f"{method} {url} returned {response.status_code}")
+            if response.status_code not in RETRY_STATUS_CODES:
+                # The bank is up; the request itself is wrong
+                breaker.record_success()
+                raise error
+
+        breaker.record_failure()
+        if attempt < max_retries:
+            delay = backoff_base * 2**attempt
+            await asyncio.sleep(delay + random.uniform(0, delay))
+
+    logger.warning(str(error))
+    raise error
+
+
+_DONE = object()
+
+
+def stream_limited(bank_name, sources, max_pending=None):
+    """
+    Consume several async iterators for one bank from synchronous code
+
+    Every source runs on the shared loop and is advanced under the bank's
+    concurrency limit. Items are handed over through a bounded queue, so
+    producers pause while the consumer is busy and at most max_pending
+    items are held in memory at once.
+
+    Args:
+        bank_name (str): Bank the requests go to
+        sources (dict): Key -> async iterator
+        max_pending (int): Queue size, defaults to BANK_CONCURRENCY_LIMIT
+
+    Yields:
+        tuple: (key, item) in the order items become available
+
+    Raises:
+        The first exception raised by any source; the others are cancelled
+    """
+    if not sources:
+        return
+    max_pending = max_pending or BANK_CONCURRENCY_LIMIT
+
+    async def start():
+        queue = asyncio.Queue(max_pending)
+        semaphore = get_bank_semaphore(bank_name)
+
+        async def produce(key, iterator):
+            try:
+                while True:
+                    async with semaphore:
+                        try:
+                            item = await iterator.__anext__()
+                        except StopAsyncIteration:
+                            break
+                    await queue.put((key, item, None))
+                await queue.put((key, _DONE, None))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await queue.put((key, _DONE, e))
+
+        tasks = [
+            asyncio.ensure_future(produce(key, iterator))
+            for key, iterator in sources.items()
+        ]
+        return queue, tasks
+
+    async def cancel(tasks):
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    queue, tasks = run_sync(start())
+    remaining = len(tasks)
+    try:
+        while remaining:
+            key, item, error = run_sync(queue.get())
+            if error is not None:
+                raise error
+            if item is _DONE:
+                remaining -= 1
+            else:
+                yield key, item
+    finally:
+        if remaining:
+            run_sync(cancel(tasks))
+
+
+async def _close_client():
+    state = _get_state()
+    if state.client is not None:
+        await state.client.aclose()
+        state.client = None
+
+
+def close_async_client():
+    """Close pooled connections (used on shutdown and in tests)"""
+    if _state is not None and _state.pid == os.getpid():
+        run_sync(_close_client())
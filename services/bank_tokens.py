@@ -0,0 +1,235 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from app import db
+from models import BankAccount
+from services.bank_adapters import get_adapter
+from services.bank_client import run_sync
+
+logger = logging.getLogger(__name__)
+
+# Seconds an account list fetched with a token is reused
+ACCOUNT_CACHE_TTL = int(os.environ.get("ACCOUNT_CACHE_TTL", 300))
+ACCOUNT_CACHE_SIZE = 1024
+# Tokens are refreshed this long before they expire
+TOKEN_REFRESH_MARGIN = timedelta(
+    seconds=int(os.environ.get("TOKEN_REFRESH_MARGIN", 600))
+)
+# Upper bound on one refresh call, retries included
+TOKEN_REFRESH_TIMEOUT = 15
+
+
+class TTLCache:
+    """
+    Thread-safe mapping whose entries expire after ttl seconds
+
+    When maxsize is reached the least recently stored entry is dropped.
+    """
+
+    def __init__(self, ttl, maxsize=1024, clock=time.monotonic):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if self.clock() - stored_at >= self.ttl:
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (self.clock(), value)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_account_cache = TTLCache(ACCOUNT_CACHE_TTL, ACCOUNT_CACHE_SIZE)
+
+
+def _account_cache_key(bank_name, access_token):
+    # Keyed by a digest so the cache does not hold raw tokens
+    digest = hashlib.sha256((access_token or "").encode("utf-8")).hexdigest()
+    return ((bank_name or "").lower(), digest)
+
+
+def get_cached_accounts(bank_name, access_token):
+    """Account list fetched with this token within ACCOUNT_CACHE_TTL, or None"""
+    accounts = _account_cache.get(_account_cache_key(bank_name, access_token))
+    return [dict(account) for account in accounts] if accounts is not None else None
+
+
+def cache_accounts(bank_name, access_token, accounts):
+    """Remember an account list fetched with this token"""
+    _account_cache.set(
+        _account_cache_key(bank_name, access_token),
+        [dict(account) for account in accounts],
+    )
+
+
+def invalidate_accounts(bank_name=None, access_token=None):
+    """Forget one token's account list, or every cached list"""
+    if bank_name is None:
+        _account_cache.clear()
+    else:
+        _account_cache.pop(_account_cache_key(bank_name, access_token))
+
+
+def apply_token(target, token):
+    """
+    Store a BankToken on a BankAccount or SyncJob
+
+    Args:
+        target: Object with access_token, refresh_token and token_expires_at
+        token (BankToken): Token to store
+    """
+    target.access_token = token.access_token
+    target.refresh_token = token.refresh_token
+    target.token_expires_at = token.expires_at
+
+
+class TokenManager:
+    """
+    Hands out valid access tokens, refreshing them before they expire
+
+    All accounts a user connected at one bank share a token, so a refresh
+    updates all of them. The scheduler calls refresh_expiring() every tick
+    so tokens are normally renewed in the background; get_access_token()
+    only refreshes inline when that has not happened in time.
+    """
+
+    def __init__(self, refresh_margin=TOKEN_REFRESH_MARGIN, clock=datetime.utcnow):
+        self.refresh_margin = refresh_margin
+        self.clock = clock
+
+    def needs_refresh(self, account):
+        """Whether the account's token expires within the refresh margin"""
+        return (
+            account.token_expires_at is not None
+            and account.token_expires_at - self.refresh_margin <= self.clock()
+        )
+
+    def refresh(self, account):
+        """
+        Renew an account's token and store it on every account sharing it
+
+        The caller commits.
+
+        Args:
+            account (BankAccount): Account whose token to renew
+
+        Returns:
+            BankToken: The new token
+        """
+        if not account.refresh_token:
+            raise ValueError(
+                f"Token for {account.bank_name} account {account.id} has expired "
+                "and cannot be refreshed; reconnect the bank"
+            )
+        adapter = get_adapter(account.bank_name)
+        if adapter is None:
+            raise ValueError(f"Unsupported bank: {account.bank_name}")
+
+        old_token = account.access_token
+        token = run_sync(
+            adapter.refresh(account.refresh_token), timeout=TOKEN_REFRESH_TIMEOUT
+        )
+        sharing = BankAccount.query.filter_by(
+            user_id=account.user_id,
+            bank_name=account.bank_name,
+            access_token=old_token,
+        ).all()
+        for shared in set(sharing) | {account}:
+            apply_token(shared, token)
+        invalidate_accounts(account.bank_name, old_token)
+        logger.info(
+            f"Refreshed {account.bank_name} token for user {account.user_id} "
+            f"({len(sharing)} accounts)"
+        )
+        return token
+
+    def get_access_token(self, account):
+        """
+        Return a usable access token for an account
+
+        Args:
+            account (BankAccount): Account about to be synced
+
+        Returns:
+            str: Access token, refreshed first if it is about to expire
+        """
+        if self.needs_refresh(account):
+            self.refresh(account)
+        return account.access_token
+
+    def refresh_expiring(self, limit=100):
+        """
+        Refresh tokens that expire within the refresh margin
+
+        One refresh per (user, bank, token); failures are logged and left
+        for the sync job to report. Commits.
+
+        Args:
+            limit (int): Most tokens refreshed in one call
+
+        Returns:
+            int: Number of tokens refreshed
+        """
+        # One account per shared token
+        due_ids = [
+            account_id
+            for (account_id,) in db.session.query(func.min(BankAccount.id))
+            .filter(
+                BankAccount.token_expires_at.isnot(None),
+                BankAccount.token_expires_at <= self.clock() + self.refresh_margin,
+                BankAccount.refresh_token.isnot(None),
+            )
+            .group_by(
+                BankAccount.user_id, BankAccount.bank_name, BankAccount.access_token
+            )
+            .order_by(func.min(BankAccount.token_expires_at))
+            .limit(limit)
+        ]
+
+        refreshed = 0
+        for account_id in due_ids:
+            account = db.session.get(BankAccount, account_id)
+            try:
+                self.refresh(account)
+                db.session.commit()
+                refreshed += 1
+            except Exception as e:
+                db.session.rollback()
+                logger.error(
+                    f"Failed to refresh {account.bank_name} token for user "
+                    f"{account.user_id}: {str(e)}"
+                )
+        return refreshed
+
+
+token_manager = TokenManager()
@@ -0,0 +1,282 @@
+import json
+import logging
+import os
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Hashed character n-gram features
+DEFAULT_HASH_BITS = 18
+DEFAULT_NGRAM_SIZES = (2, 3, 4)
+# Predictions below this probability fall back to keyword matching
+DEFAULT_MIN_CONFIDENCE = 0.6
+# Descriptions featurized at once during prediction; bounds peak memory
+PREDICT_CHUNK_SIZE = 20000
+
+_HASH_MULTIPLIER = np.uint64(1000003)
+_HASH_MIX = np.uint64(0x9E3779B97F4A7C15)
+_SEPARATOR = "\x00"
+
+
+def hash_ngrams(texts, hash_bits=DEFAULT_HASH_BITS, ngram_sizes=DEFAULT_NGRAM_SIZES):
+    """
+    Hash the character n-grams of many texts in one vectorized pass
+
+    Every text is padded with spaces so word boundaries produce their own
+    n-grams. The hash only depends on the characters, so features are stable
+    across processes (unlike Python's salted hash()).
+
+    Args:
+        texts (list): Normalized texts
+        hash_bits (int): Size of the feature space as a power of two
+        ngram_sizes (tuple): N-gram lengths to extract
+
+    Returns:
+        tuple: (doc_ids, buckets) int64 arrays with one entry per n-gram
+    """
+    if not texts:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+
+    joined = _SEPARATOR.join(f" {text.replace(_SEPARATOR, ' ')} " for text in texts)
+    codes = np.frombuffer(joined.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    is_separator = codes == ord(_SEPARATOR)
+    # doc_of[i] is the index of the text that character i belongs to
+    doc_of = np.cumsum(is_separator)
+    separators_before = np.concatenate(([0], doc_of))
+
+    shift = np.uint64(64 - hash_bits)
+    doc_ids = []
+    buckets = []
+    for size in ngram_sizes:
+        count = len(codes) - size + 1
+        if count <= 0:
+            continue
+        # An n-gram is valid when it contains no separator
+        valid = separators_before[size : size + count] == separators_before[:count]
+        hashed = np.full(count, np.uint64(size), dtype=np.uint64)
+        for offset in range(size):
+            hashed = hashed * _HASH_MULTIPLIER ^ codes[offset : offset + count]
+        hashed = (hashed * _HASH_MIX) >> shift
+        doc_ids.append(doc_of[:count][valid].astype(np.int64))
+        buckets.append(hashed[valid].astype(np.int64))
+
+    return np.concatenate(doc_ids), np.concatenate(buckets)
+
+
+class CategoryModel:
+    """
+    Linear classifier over hashed character n-grams
+
+    The weight matrix has one row per hash bucket plus a final bias row and
+    one column per category. It is stored as a .npy file with a JSON sidecar
+    holding the labels, so worker processes can memory-map a single copy.
+    """
+
+    def __init__(
+        self,
+        weights,
+        labels,
+        hash_bits=DEFAULT_HASH_BITS,
+        ngram_sizes=DEFAULT_NGRAM_SIZES,
+    ):
+        self.weights = weights
+        self.labels = list(labels)
+        self.hash_bits = hash_bits
+        self.ngram_sizes = tuple(ngram_sizes)
+
+    def decision_function(self, texts):
+        """Raw class scores with shape (len(texts), len(labels))"""
+        doc_ids, buckets = hash_ngrams(texts, self.hash_bits, self.ngram_sizes)
+        bias = np.asarray(self.weights[-1], dtype=np.float32)
+        scores = np.tile(bias, (len(texts), 1))
+        gathered = np.asarray(self.weights[buckets], dtype=np.float32)
+        for k in range(len(self.labels)):
+            scores[:, k] += np.bincount(
+                doc_ids, weights=gathered[:, k], minlength=len(texts)
+            )
+        return scores
+
+    def predict_proba(self, texts):
+        """Class probabilities with shape (len(texts), len(labels))"""
+        scores = self.decision_function(texts)
+        scores -= scores.max(axis=1, keepdims=True)
+        np.exp(scores, out=scores)
+        scores /= scores.sum(axis=1, keepdims=True)
+        return scores
+
+    def predict(self, texts):
+        """
+        Predict category names for many texts
+
+        Args:
+            texts (list): Normalized texts
+
+        Returns:
+            tuple: (labels, confidences) arrays aligned with texts
+        """
+        label_array = np.array(self.labels, dtype=object)
+        names = np.empty(len(texts), dtype=object)
+        confidences = np.empty(len(texts), dtype=np.float32)
+        for start in range(0, len(texts), PREDICT_CHUNK_SIZE):
+            chunk = texts[start : start + PREDICT_CHUNK_SIZE]
+            proba = self.predict_proba(chunk)
+            best = proba.argmax(axis=1)
+            names[start : start + len(chunk)] = label_array[best]
+            confidences[start : start + len(chunk)] = proba[np.arange(len(chunk)), best]
+        return names, confidences
+
+    def save(self, path):
+        """Write weights to path (.npy) and metadata to path + '.json'"""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # Write to temporary files first so running workers never map a partial file
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.ascontiguousarray(self.weights, dtype=np.float32))
+        with open(f"{tmp_path}.json", "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "labels": self.labels,
+                    "hash_bits": self.hash_bits,
+                    "ngram_sizes": list(self.ngram_sizes),
+                },
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(f"{tmp_path}.json", f"{path}.json")
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Memory-map a saved model"""
+        with open(f"{path}.json", encoding="utf-8") as f:
+            meta = json.load(f)
+        weights = np.load(path, mmap_mode="r")
+        return cls(weights, meta["labels"], meta["hash_bits"], meta["ngram_sizes"])
+
+
+def train_category_model(
+    texts,
+    labels,
+    epochs=10,
+    learning_rate=0.5,
+    l2=1e-6,
+    batch_size=4096,
+    hash_bits=DEFAULT_HASH_BITS,
+    ngram_sizes=DEFAULT_NGRAM_SIZES,
+    seed=0,
+):
+    """
+    Train a softmax regression model with mini-batch gradient descent
+
+    Args:
+        texts (list): Normalized transaction texts
+        labels (list): Category name for each text
+        epochs (int): Passes over the training data
+        learning_rate (float): Step size
+        l2 (float): L2 regularization strength
+        batch_size (int): Texts per gradient step
+        hash_bits (int): Size of the feature space as a power of two
+        ngram_sizes (tuple): N-gram lengths to extract
+        seed (int): Seed for batch shuffling
+
+    Returns:
+        CategoryModel: Trained model
+    """
+    if len(texts) != len(labels):
+        raise ValueError("texts and labels must have the same length")
+    if not texts:
+        raise ValueError("No training data")
+
+    classes, targets = np.unique(np.array(labels, dtype=object), return_inverse=True)
+    num_classes = len(classes)
+    num_buckets = 1 << hash_bits
+    weights = np.zeros((num_buckets + 1, num_classes), dtype=np.float32)
+    rng = np.random.default_rng(seed)
+
+    # Featurize once; each batch keeps its own (doc_ids, buckets) arrays
+    order = rng.permutation(len(texts))
+    batches = []
+    for start in range(0, len(texts), batch_size):
+        index = order[start : start + batch_size]
+        doc_ids, buckets = hash_ngrams(
+            [texts[i] for i in index], hash_bits, ngram_sizes
+        )
+        batches.append((doc_ids, buckets, targets[index]))
+
+    model = CategoryModel(weights, classes.tolist(), hash_bits, ngram_sizes)
+    for epoch in range(epochs):
+        loss = 0.0
+        for batch_index in rng.permutation(len(batches)):
+            doc_ids, buckets, batch_targets = batches[batch_index]
+            size = len(batch_targets)
+
+            scores = np.tile(weights[-1], (size, 1))
+            gathered = weights[buckets]
+            for k in range(num_classes):
+                scores[:, k] += np.bincount(
+                    doc_ids, weights=gathered[:, k], minlength=size
+                )
+            scores -= scores.max(axis=1, keepdims=True)
+            proba = np.exp(scores)
+            proba /= proba.sum(axis=1, keepdims=True)
+            loss -= np.log(proba[np.arange(size), batch_targets] + 1e-12).sum()
+
+            # Gradient of the mean cross-entropy with respect to the scores
+            gradient = proba
+            gradient[np.arange(size), batch_targets] -= 1.0
+            gradient /= size
+
+            touched = np.unique(buckets)
+            for k in range(num_classes):
+                bucket_gradient = np.bincount(
+                    buckets, weights=gradient[doc_ids, k], minlength=num_buckets
+                )
+                weights[touched, k] -= learning_rate * (
+                    bucket_gradient[touched] + l2 * weights[touched, k]
+                )
+            weights[-1] -= learning_rate * gradient.sum(axis=0)
+
+        logger.debug(f"Epoch {epoch + 1}/{epochs}: loss {loss / len(texts):.4f}")
+
+    return model
+
+
+_model = None
+_model_path = None
+_model_lock = threading.Lock()
+
+
+def get_category_model():
+    """
+    Return the configured model, or None when no model is available
+
+    The model is loaded from CATEGORY_MODEL_PATH once per process and
+    reloaded when the file is replaced.
+    """
+    global _model, _model_path
+    path = os.environ.get("CATEGORY_MODEL_PATH")
+    if not path or not os.path.exists(path):
+        return None
+
+    mtime = os.path.getmtime(path)
+    if _model is None or _model_path != (path, mtime):
+        with _model_lock:
+            if _model is None or _model_path != (path, mtime):
+                try:
+                    _model = CategoryModel.load(path)
+                    _model_path = (path, mtime)
+                    logger.info(f"Loaded category model from {path}")
+                except Exception as e:
+                    logger.error(f"Failed to load category model: {str(e)}")
+                    return None
+    return _model
+
+
+def get_min_confidence():
+    """Minimum probability for a model prediction to be used"""
+    return float(
+        os.environ.get("CATEGORY_MODEL_MIN_CONFIDENCE", DEFAULT_MIN_CONFIDENCE)
+    )
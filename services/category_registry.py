@@ -0,0 +1,95 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+from sqlalchemy import event
+from app import db
+from models import Category
+
+logger = logging.getLogger(__name__)
+
+# Seconds before the registry reloads, so categories changed by other worker
+# processes are picked up; changes made in this process invalidate it at once
+CATEGORY_CACHE_TTL = 300
+
+CategoryInfo = namedtuple("CategoryInfo", ["id", "name", "icon"])
+
+_Snapshot = namedtuple("_Snapshot", ["loaded_at", "categories", "by_id", "by_name"])
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def _is_fresh(snapshot):
+    return (
+        snapshot is not None
+        and time.monotonic() - snapshot.loaded_at < CATEGORY_CACHE_TTL
+    )
+
+
+def _get_snapshot():
+    global _snapshot
+    snapshot = _snapshot
+    if _is_fresh(snapshot):
+        return snapshot
+
+    with _lock:
+        if _snapshot is not snapshot and _is_fresh(_snapshot):
+            # Another thread reloaded while we waited
+            return _snapshot
+
+        categories = tuple(
+            CategoryInfo(category_id, name, icon)
+            for category_id, name, icon in db.session.query(
+                Category.id, Category.name, Category.icon
+            ).order_by(Category.id)
+        )
+        snapshot = _Snapshot(
+            loaded_at=time.monotonic(),
+            categories=categories,
+            by_id={c.id: c for c in categories},
+            by_name={c.name: c for c in categories},
+        )
+        _snapshot = snapshot
+        logger.debug(f"Loaded {len(categories)} categories into registry")
+        return snapshot
+
+
+def get_categories():
+    """Return all categories as CategoryInfo tuples, ordered by id"""
+    return list(_get_snapshot().categories)
+
+
+def get_category(category_id):
+    """Return the CategoryInfo for an id, or None"""
+    return _get_snapshot().by_id.get(category_id)
+
+
+def get_category_by_name(name):
+    """Return the CategoryInfo for a name, or None"""
+    return _get_snapshot().by_name.get(name)
+
+
+def get_category_names():
+    """Return a mapping of category id to name"""
+    return {c.id: c.name for c in _get_snapshot().categories}
+
+
+def get_category_ids():
+    """Return a mapping of category name to id"""
+    return {c.name: c.id for c in _get_snapshot().categories}
+
+
+def invalidate_categories():
+    """Forget loaded categories so the next lookup reloads them"""
+    global _snapshot
+    with _lock:
+        _snapshot = None
+
+
+@event.listens_for(Category, "after_insert")
+@event.listens_for(Category, "after_update")
+@event.listens_for(Category, "after_delete")
+def _invalidate_on_change(mapper, connection, target):
+    """Drop the registry whenever a category row changes"""
+    invalidate_categories()
@@ -0,0 +1,269 @@
+import functools
+import logging
+import os
+import time
+from flask import current_app, request, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+
+logger = logging.getLogger(__name__)
+
+# Gunicorn reads WEB_CONCURRENCY as its worker count; WEB_THREADS should
+# match its --threads
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", 2))
+WEB_THREADS = int(os.environ.get("WEB_THREADS", 1))
+# Processes besides the web workers that connect: worker.py, scheduler.py
+BACKGROUND_PROCESSES = int(os.environ.get("DB_BACKGROUND_PROCESSES", 2))
+# Connections all processes together may open; PostgreSQL's default
+# max_connections is 100, a few of which are reserved
+DB_MAX_CONNECTIONS = int(os.environ.get("DB_MAX_CONNECTIONS", 90))
+# Connect through PgBouncer in transaction pooling mode
+DB_PGBOUNCER = os.environ.get("DB_PGBOUNCER", "").lower() in ("1", "true", "yes")
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", 30000))
+DB_LOCK_TIMEOUT_MS = int(os.environ.get("DB_LOCK_TIMEOUT_MS", 10000))
+DB_IDLE_IN_TRANSACTION_TIMEOUT_MS = int(
+    os.environ.get("DB_IDLE_IN_TRANSACTION_TIMEOUT_MS", 60000)
+)
+DB_APPLICATION_NAME = os.environ.get("DB_APPLICATION_NAME", "financial_assistant")
+
+# Streaming replica serving the read-only pages; unset sends all reads
+# to the primary
+REPLICA_DATABASE_URL = os.environ.get("REPLICA_DATABASE_URL")
+REPLICA_BIND_KEY = "replica"
+# Seconds after a user's write during which their reads stay on the
+# primary; should exceed the replica's usual lag
+REPLICA_STICKY_SECONDS = float(os.environ.get("REPLICA_STICKY_SECONDS", 10))
+
+# Milliseconds a SQLite connection waits for a lock before failing
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000))
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+# Page cache per connection in KiB
+SQLITE_CACHE_SIZE_KIB = int(os.environ.get("SQLITE_CACHE_SIZE_KIB", 64 * 1024))
+
+
+def pool_limits(
+    workers=WEB_CONCURRENCY,
+    threads=WEB_THREADS,
+    background_processes=BACKGROUND_PROCESSES,
+    max_connections=DB_MAX_CONNECTIONS,
+):
+    """
+    Pool size and overflow per process
+
+    Every process gets an equal share of max_connections. A web worker
+    serves `threads` requests at once; one more connection covers code
+    that opens a second one next to the session (db.engine.begin()), and
+    overflow up to twice that absorbs bursts while staying in the share.
+
+    Returns:
+        tuple: (pool_size, max_overflow)
+    """
+    share = max(max_connections // (workers + background_processes), 1)
+    pool_size = min(threads + 1, share)
+    max_overflow = max(min(2 * pool_size, share) - pool_size, 0)
+    return pool_size, max_overflow
+
+
+def _timeout_settings():
+    return {
+        "statement_timeout": DB_STATEMENT_TIMEOUT_MS,
+        "lock_timeout": DB_LOCK_TIMEOUT_MS,
+        "idle_in_transaction_session_timeout": DB_IDLE_IN_TRANSACTION_TIMEOUT_MS,
+    }
+
+
+def engine_options(database_url):
+    """
+    SQLAlchemy engine options for the database in DATABASE_URL
+
+    Args:
+        database_url (str): Database URL
+
+    Returns:
+        dict: Keyword arguments for create_engine
+    """
+    backend = make_url(database_url).get_backend_name()
+    if backend == "sqlite":
+        # Pragmas are set per connection by apply_engine_profile
+        return {}
+    if backend != "postgresql":
+        return {"pool_recycle": 300, "pool_pre_ping": True}
+
+    if DB_PGBOUNCER:
+        # PgBouncer pools server connections; holding client connections
+        # here as well would only pin them. It rejects the "options"
+        # startup parameter, so timeouts are set per transaction instead.
+        return {
+            "poolclass": NullPool,
+            "connect_args": {"application_name": DB_APPLICATION_NAME},
+        }
+
+    pool_size, max_overflow = pool_limits()
+    options = " ".join(
+        f"-c {name}={value}" for name, value in _timeout_settings().items()
+    )
+    return {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": 10,
+        "pool_recycle": 1800,
+        "pool_pre_ping": True,
+        "connect_args": {
+            "application_name": DB_APPLICATION_NAME,
+            "options": options,
+        },
+    }
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        # WAL lets dashboard reads proceed while a sync writes; NORMAL only
+        # syncs at checkpoints, which is safe in WAL mode
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KIB}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+
+def _set_transaction_timeouts(connection):
+    for name, value in _timeout_settings().items():
+        connection.exec_driver_sql(f"SET LOCAL {name} = {int(value)}")
+
+
+def apply_engine_profile(engine):
+    """
+    Register the per-connection settings of the engine's database
+
+    SQLite connections get WAL mode and the other pragmas. Behind
+    PgBouncer, PostgreSQL timeouts are set at the start of every
+    transaction, since a session may move between server connections.
+    """
+    backend = engine.url.get_backend_name()
+    if backend == "sqlite":
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+    elif backend == "postgresql" and DB_PGBOUNCER:
+        event.listen(engine, "begin", _set_transaction_timeouts)
+    logger.debug(f"Applied {backend} engine profile")
+
+
+def without_statement_timeout(bind):
+    """
+    Lift the statement timeout for the rest of the current transaction
+
+    For migrations, rollup rebuilds and bulk loads, which legitimately
+    run longer than a web request may.
+
+    Args:
+        bind: Session or Connection inside a transaction
+    """
+    dialect = bind.get_bind().dialect if hasattr(bind, "get_bind") else bind.dialect
+    if dialect.name == "postgresql":
+        bind.execute(text("SET LOCAL statement_timeout = 0"))
+
+
+def replica_binds(replica_url=REPLICA_DATABASE_URL):
+    """
+    SQLALCHEMY_BINDS with the read replica engine, when one is configured
+
+    No model has the replica's bind key, so create_all and drop_all never
+    touch it; RoutingSession picks it for reads.
+    """
+    if not replica_url:
+        return {}
+    return {REPLICA_BIND_KEY: {"url": replica_url, **engine_options(replica_url)}}
+
+
+# session.info keys: reads may use the replica; the session has written
+READ_FROM_REPLICA = "read_from_replica"
+WROTE = "wrote"
+# Flask session key with the time of the user's last write
+LAST_WRITE_KEY = "db_last_write_at"
+
+
+class RoutingSession(Session):
+    """
+    Session that sends reads to the read replica when asked to
+
+    Reads use the replica once session.info[READ_FROM_REPLICA] is set (see
+    replica_reads) and a replica is configured. Flushes and INSERT, UPDATE
+    and DELETE statements always go to the primary, and after a write the
+    rest of the session reads from the primary as well, so it sees its own
+    changes.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and self.info.get(READ_FROM_REPLICA)
+            and not self._flushing
+            and not getattr(clause, "is_dml", False)
+        ):
+            replica = self._db.engines.get(REPLICA_BIND_KEY)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _record_write(session):
+    session.info[READ_FROM_REPLICA] = False
+    session.info[WROTE] = True
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _record_flush(session, flush_context):
+    _record_write(session)
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _record_bulk_write(state):
+    if state.is_insert or state.is_update or state.is_delete:
+        _record_write(state.session)
+
+
+def replica_reads(view):
+    """
+    Serve a view's GET requests from the read replica
+
+    Requests within REPLICA_STICKY_SECONDS of the user's last write stay on
+    the primary, so users see their own changes despite replication lag.
+    """
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        last_write = flask_session.get(LAST_WRITE_KEY, 0)
+        if (
+            request.method == "GET"
+            and time.time() - last_write >= REPLICA_STICKY_SECONDS
+        ):
+            current_app.extensions["sqlalchemy"].session.info[READ_FROM_REPLICA] = True
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+def init_replica_routing(app, db):
+    """
+    Track each request's writes for replica stickiness
+
+    The time of the last write is kept in the user's (signed) session
+    cookie, so it holds across gunicorn workers.
+    """
+
+    @app.before_request
+    def reset_replica_routing():
+        db.session.info.pop(READ_FROM_REPLICA, None)
+        db.session.info.pop(WROTE, None)
+
+    @app.after_request
+    def remember_write(response):
+        if db.session.info.pop(WROTE, False):
+            flask_session[LAST_WRITE_KEY] = time.time()
+        db.session.info.pop(READ_FROM_REPLICA, None)
+        return response
@@ -0,0 +1,238 @@
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import or_, update
+from app import db
+from models import BankAccount, SyncJob
+from services.bank_adapters import BankToken
+from services.bank_tokens import apply_token, token_manager
+
+logger = logging.getLogger(__name__)
+
+# Seconds an idle worker waits before polling the queue again
+POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 2.0))
+# A running job not finished after this long is assumed to belong to a dead worker
+STALE_JOB_SECONDS = int(os.environ.get("JOB_STALE_SECONDS", 1800))
+MAX_ATTEMPTS = 3
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+def enqueue_job(user_id, kind, bank_name, account_id=None, token=None):
+    """
+    Queue a bank sync for the worker
+
+    A job already queued or running for the same account is returned
+    instead of creating a duplicate. The caller commits.
+
+    Args:
+        user_id (int): Owner of the job
+        kind (str): 'connect' to import all accounts, 'sync' for one account,
+            'archive' to archive the user's old transactions
+        bank_name (str): Name of the bank
+        account_id (int): Account to sync for 'sync' jobs
+        token (BankToken): Token for 'connect' jobs, cleared when the job ends
+
+    Returns:
+        SyncJob: The queued job
+    """
+    if account_id is not None:
+        existing = SyncJob.query.filter(
+            SyncJob.account_id == account_id,
+            SyncJob.status.in_(ACTIVE_STATUSES),
+        ).first()
+        if existing:
+            return existing
+
+    job = SyncJob(
+        user_id=user_id,
+        kind=kind,
+        bank_name=bank_name,
+        account_id=account_id,
+        status="queued",
+    )
+    if token is not None:
+        apply_token(job, token)
+    db.session.add(job)
+    db.session.flush()
+    return job
+
+
+def claim_next_job(worker_id):
+    """
+    Atomically take the oldest queued job
+
+    The claim is a conditional UPDATE, so two workers can never run the
+    same job. On PostgreSQL the candidate row is read with SKIP LOCKED so
+    workers do not queue up behind each other.
+
+    Args:
+        worker_id (str): Identifier recorded on the claimed job
+
+    Returns:
+        SyncJob: The claimed job, or None when the queue is empty
+    """
+    query = (
+        db.session.query(SyncJob.id)
+        .filter(
+            SyncJob.status == "queued",
+            or_(SyncJob.run_after.is_(None), SyncJob.run_after <= datetime.utcnow()),
+        )
+        .order_by(SyncJob.id)
+        .limit(1)
+    )
+    if db.engine.dialect.name == "postgresql":
+        query = query.with_for_update(skip_locked=True)
+
+    job_id = query.scalar()
+    if job_id is None:
+        db.session.rollback()
+        return None
+
+    result = db.session.execute(
+        update(SyncJob)
+        .where(SyncJob.id == job_id, SyncJob.status == "queued")
+        .values(
+            status="running",
+            worker_id=worker_id,
+            started_at=datetime.utcnow(),
+            attempts=SyncJob.attempts + 1,
+        )
+    )
+    db.session.commit()
+    if result.rowcount != 1:
+        # Another worker got there first
+        return None
+    return db.session.get(SyncJob, job_id)
+
+
+def run_job(job):
+    """
+    Run a claimed job and record its outcome
+
+    Args:
+        job (SyncJob): Job in the 'running' state
+    """
+    from services.bank_api import (
+        fetch_account_data,
+        save_bank_accounts,
+        sync_account_data,
+        sync_accounts_transactions,
+    )
+
+    def on_progress(fraction):
+        # Committed together with each imported page
+        job.progress = int(fraction * 100)
+
+    try:
+        if job.kind == "connect":
+            token = BankToken(job.access_token, job.refresh_token, job.token_expires_at)
+            accounts_data = fetch_account_data(job.bank_name, token.access_token)
+            accounts = save_bank_accounts(
+                job.user_id, job.bank_name, token, accounts_data
+            )
+            count = sync_accounts_transactions(
+                job.bank_name, token.access_token, accounts, on_progress=on_progress
+            )
+        elif job.kind == "sync":
+            account = db.session.get(BankAccount, job.account_id)
+            if account is None:
+                raise ValueError(f"Account {job.account_id} no longer exists")
+            new_balance, count = sync_account_data(
+                account.bank_name,
+                token_manager.get_access_token(account),
+                account.account_number,
+                account.id,
+                on_progress=on_progress,
+            )
+            account.balance = new_balance
+            account.last_sync = datetime.utcnow()
+        elif job.kind == "archive":
+            from services.transaction_archive import (
+                ARCHIVE_AFTER_MONTHS,
+                archive_transactions,
+            )
+
+            count = archive_transactions(ARCHIVE_AFTER_MONTHS, user_id=job.user_id)
+        else:
+            raise ValueError(f"Unknown job kind: {job.kind}")
+
+        job.status = "succeeded"
+        job.progress = 100
+        job.transaction_count = count
+    except Exception as e:
+        logger.error(f"Sync job {job.id} failed: {str(e)}", exc_info=True)
+        db.session.rollback()
+        job.status = "failed"
+        job.error = str(e)
+
+    apply_token(job, BankToken(None))
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+
+def requeue_stale_jobs():
+    """
+    Return jobs left 'running' by a crashed worker to the queue
+
+    Jobs that already used MAX_ATTEMPTS are failed instead. Returns the
+    number of jobs touched.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=STALE_JOB_SECONDS)
+    stale = SyncJob.query.filter(
+        SyncJob.status == "running", SyncJob.started_at < cutoff
+    ).all()
+    for job in stale:
+        if job.attempts >= MAX_ATTEMPTS:
+            job.status = "failed"
+            job.error = "Worker stopped responding"
+            apply_token(job, BankToken(None))
+            job.finished_at = datetime.utcnow()
+        else:
+            job.status = "queued"
+            job.worker_id = None
+    db.session.commit()
+    return len(stale)
+
+
+def run_next_job(worker_id=None):
+    """
+    Claim and run one job
+
+    Returns:
+        SyncJob: The job that ran, or None when the queue was empty
+    """
+    job = claim_next_job(worker_id or default_worker_id())
+    if job is not None:
+        logger.info(f"Running sync job {job.id} ({job.kind} {job.bank_name})")
+        run_job(job)
+    return job
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def run_worker(poll_interval=POLL_INTERVAL, once=False):
+    """
+    Process queued jobs until interrupted
+
+    Args:
+        poll_interval (float): Seconds to sleep when the queue is empty
+        once (bool): Drain the queue and return instead of polling forever
+    """
+    worker_id = default_worker_id()
+    logger.info(f"Sync worker {worker_id} started")
+    requeue_stale_jobs()
+
+    while True:
+        job = run_next_job(worker_id)
+        # Don't keep identity-mapped rows around between jobs
+        db.session.remove()
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            requeue_stale_jobs()
@@ -0,0 +1,143 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import db
+from models import MerchantCategoryOverride
+
+logger = logging.getLogger(__name__)
+
+# How many users' override maps to keep in memory
+OVERRIDE_CACHE_SIZE = 1024
+# Seconds before a cached map is reloaded, so overrides recorded by other
+# worker processes are picked up
+OVERRIDE_CACHE_TTL = 300
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+# session.info key with the users whose overrides the session changed
+_PENDING_INVALIDATIONS = "merchant_override_users"
+
+
+def normalize_merchant(merchant):
+    """Normalize a merchant name into the key used for overrides"""
+    if not merchant:
+        return ""
+    return " ".join(merchant.lower().replace("ё", "е").split())[:100]
+
+
+def get_user_overrides(user_id):
+    """
+    Get a user's merchant -> category overrides
+
+    The map is served from an in-memory LRU and loaded with a single query
+    on a miss.
+
+    Args:
+        user_id (int): User ID
+
+    Returns:
+        dict: Mapping of normalized merchant name to category ID
+    """
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(user_id)
+        if entry is not None and now - entry[0] < OVERRIDE_CACHE_TTL:
+            _cache.move_to_end(user_id)
+            return entry[1]
+
+    overrides = {
+        merchant_key: category_id
+        for merchant_key, category_id in db.session.query(
+            MerchantCategoryOverride.merchant_key,
+            MerchantCategoryOverride.category_id,
+        ).filter(MerchantCategoryOverride.user_id == user_id)
+    }
+
+    with _cache_lock:
+        _cache[user_id] = (now, overrides)
+        _cache.move_to_end(user_id)
+        while len(_cache) > OVERRIDE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return overrides
+
+
+def get_merchant_override(user_id, merchant):
+    """
+    Look up the category a user chose for a merchant
+
+    Args:
+        user_id (int): User ID
+        merchant (str): Merchant name
+
+    Returns:
+        int: Category ID, or None if the user has no override
+    """
+    merchant_key = normalize_merchant(merchant)
+    if not merchant_key:
+        return None
+    return get_user_overrides(user_id).get(merchant_key)
+
+
+def record_merchant_override(user_id, merchant, category_id):
+    """
+    Remember a manual recategorization for future transactions
+
+    The change is added to the current session; the caller commits it.
+    The user's cached map is dropped once that commit succeeds.
+
+    Args:
+        user_id (int): User ID
+        merchant (str): Merchant name
+        category_id (int): Category chosen by the user
+
+    Returns:
+        bool: True if an override was recorded
+    """
+    merchant_key = normalize_merchant(merchant)
+    if not merchant_key or not category_id:
+        return False
+
+    override = MerchantCategoryOverride.query.filter_by(
+        user_id=user_id, merchant_key=merchant_key
+    ).first()
+    if override:
+        override.category_id = category_id
+    else:
+        db.session.add(
+            MerchantCategoryOverride(
+                user_id=user_id, merchant_key=merchant_key, category_id=category_id
+            )
+        )
+
+    # Invalidating now would let a concurrent lookup cache the old mapping
+    # again before the commit, so it waits for the commit
+    db.session.info.setdefault(_PENDING_INVALIDATIONS, set()).add(user_id)
+    logger.debug(f"Recorded override for user {user_id}: {merchant_key}")
+    return True
+
+
+def invalidate_user_overrides(user_id=None):
+    """Drop cached overrides for one user, or for everyone"""
+    with _cache_lock:
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(user_id, None)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    """Drop the cached maps of users whose overrides were just committed"""
+    for user_id in session.info.pop(_PENDING_INVALIDATIONS, ()):
+        invalidate_user_overrides(user_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_rolled_back(session, previous_transaction):
+    """Nothing to invalidate once the changes are rolled back"""
+    if not session.in_transaction():
+        session.info.pop(_PENDING_INVALIDATIONS, None)
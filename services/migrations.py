@@ -0,0 +1,258 @@
+import importlib.util
+import logging
+import os
+import re
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    inspect,
+    select,
+    text,
+)
+from sqlalchemy.schema import CreateColumn
+from app import db
+from services.db_engine import without_statement_timeout
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations"
+)
+# Serializes migration runs of several processes on PostgreSQL
+MIGRATION_LOCK_ID = 7240518
+
+_SCRIPT_NAME = re.compile(r"^(\d{4})_(\w+)\.py$")
+
+schema_version = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("description", String(255)),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+Migration = namedtuple("Migration", ["version", "name", "description", "upgrade"])
+
+
+class Migrator:
+    """
+    Schema operations available to migration scripts
+
+    Every operation checks the live schema first and does nothing when the
+    change is already there, so a script can run against a fresh database
+    (tables created from the models) as well as one created by an older
+    version of the app.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.dialect = connection.dialect.name
+
+    def _inspector(self):
+        # Fresh inspector per call: earlier operations change the schema
+        return inspect(self.connection)
+
+    def has_table(self, table_name):
+        return self._inspector().has_table(table_name)
+
+    def has_column(self, table_name, column_name):
+        return any(
+            column["name"] == column_name
+            for column in self._inspector().get_columns(table_name)
+        )
+
+    def has_index(self, table_name, index_name):
+        inspector = self._inspector()
+        names = {index["name"] for index in inspector.get_indexes(table_name)}
+        names.update(
+            constraint["name"]
+            for constraint in inspector.get_unique_constraints(table_name)
+        )
+        return index_name in names
+
+    def execute(self, statement, parameters=None):
+        """Run a SQL statement (text or a SQLAlchemy construct)"""
+        if isinstance(statement, str):
+            statement = text(statement)
+        return self.connection.execute(statement, parameters)
+
+    def create_tables(self, metadata, *table_names):
+        """Create the named tables (all tables when none are named) if missing"""
+        tables = [metadata.tables[name] for name in table_names] or None
+        metadata.create_all(self.connection, tables=tables, checkfirst=True)
+
+    def add_column(self, table_name, column):
+        """
+        Add a column to an existing table
+
+        Args:
+            table_name (str): Table to alter
+            column (Column): Unbound column definition; constraints such as
+                unique or foreign keys belong in separate indexes
+
+        Returns:
+            bool: Whether the column was added, False if it already existed
+        """
+        if self.has_column(table_name, column.name):
+            return False
+        Table(table_name, MetaData(), column)
+        ddl = CreateColumn(column).compile(dialect=self.connection.dialect)
+        table = self.connection.dialect.identifier_preparer.quote(table_name)
+        self.connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {ddl}"))
+        logger.info(f"Added column {table_name}.{column.name}")
+        return True
+
+    def create_index(self, name, table_name, columns, unique=False, where=None):
+        """
+        Create an index if no index or constraint with this name exists
+
+        Args:
+            name (str): Index name
+            table_name (str): Indexed table
+            columns (list): Column names, "name DESC" for descending order
+                and "name NULLS FIRST" or "name NULLS LAST" for where NULLs
+                sort
+            unique (bool): Whether to create a unique index
+            where: Condition for a partial index, SQL text or an expression
+                such as column("is_expense", Boolean) == True. SQLite only
+                uses a partial index for queries repeating the condition
+                exactly, so build it the way the queries do. Honored on
+                PostgreSQL and SQLite, other databases index every row.
+        """
+        if self.has_index(table_name, name):
+            return
+        table = Table(table_name, MetaData(), autoload_with=self.connection)
+        expressions = []
+        for column in columns:
+            column_name, *order = column.upper().split()
+            expression = table.c[column.split()[0]]
+            if "DESC" in order:
+                expression = expression.desc()
+            if "NULLS" in order:
+                expression = (
+                    expression.nullsfirst()
+                    if order[-1] == "FIRST"
+                    else expression.nullslast()
+                )
+            expressions.append(expression)
+        options = {}
+        if where is not None:
+            if isinstance(where, str):
+                where = text(where)
+            options = {"postgresql_where": where, "sqlite_where": where}
+        Index(name, *expressions, unique=unique, **options).create(self.connection)
+        logger.info(f"Created index {name} on {table_name}")
+
+    def drop_index(self, name, table_name):
+        """Drop an index if it exists"""
+        if not self.has_index(table_name, name):
+            return
+        table = Table(table_name, MetaData(), autoload_with=self.connection)
+        index = next(index for index in table.indexes if index.name == name)
+        index.drop(self.connection)
+        logger.info(f"Dropped index {name} on {table_name}")
+
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    """
+    Load the migration scripts from a directory
+
+    Scripts are named NNNN_description.py and define upgrade(migrator);
+    the module docstring is recorded as the migration's description.
+
+    Args:
+        directory (str): Directory with the scripts
+
+    Returns:
+        list: Migration tuples ordered by version
+    """
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = _SCRIPT_NAME.match(filename)
+        if match is None:
+            continue
+        version = int(match.group(1))
+        spec = importlib.util.spec_from_file_location(
+            f"migrations.m{match.group(1)}", os.path.join(directory, filename)
+        )
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        description = (module.__doc__ or match.group(2)).strip().splitlines()[0]
+        migrations.append(
+            Migration(version, match.group(2), description, module.upgrade)
+        )
+
+    versions = [migration.version for migration in migrations]
+    if len(set(versions)) != len(versions):
+        raise RuntimeError(f"Duplicate migration versions in {directory}")
+    return migrations
+
+
+def applied_versions(connection):
+    """Versions recorded in the schema_version table"""
+    schema_version.create(connection, checkfirst=True)
+    return set(connection.execute(select(schema_version.c.version)).scalars())
+
+
+def current_version(engine=None):
+    """
+    Return the newest applied migration version
+
+    Returns:
+        int: Version number, 0 for a database that was never migrated
+    """
+    engine = engine if engine is not None else db.engine
+    with engine.begin() as connection:
+        return max(applied_versions(connection), default=0)
+
+
+def upgrade(engine=None, target=None, directory=MIGRATIONS_DIR):
+    """
+    Apply the migrations that are not recorded yet, in version order
+
+    Each migration runs and is recorded in its own transaction. On
+    PostgreSQL the transaction holds an advisory lock, so app instances
+    starting at the same time apply each migration exactly once.
+
+    Args:
+        engine: SQLAlchemy engine, the app's engine when not given
+        target (int): Stop after this version; all migrations when None
+        directory (str): Directory with the migration scripts
+
+    Returns:
+        list: Versions applied by this call
+    """
+    engine = engine if engine is not None else db.engine
+    applied = []
+    for migration in load_migrations(directory):
+        if target is not None and migration.version > target:
+            break
+        with engine.begin() as connection:
+            if connection.dialect.name == "postgresql":
+                connection.execute(
+                    text("SELECT pg_advisory_xact_lock(:lock_id)"),
+                    {"lock_id": MIGRATION_LOCK_ID},
+                )
+            without_statement_timeout(connection)
+            if migration.version in applied_versions(connection):
+                continue
+            logger.info(
+                f"Applying migration {migration.version:04d}: {migration.description}"
+            )
+            migration.upgrade(Migrator(connection))
+            connection.execute(
+                schema_version.insert().values(
+                    version=migration.version,
+                    description=migration.description[:255],
+                    applied_at=datetime.utcnow(),
+                )
+            )
+        applied.append(migration.version)
+    return applied
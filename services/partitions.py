@@ -0,0 +1,471 @@
+import logging
+import os
+import re
+from datetime import date, datetime
+from sqlalchemy import text
+from app import db
+from models import Transaction
+from services.db_engine import without_statement_timeout
+from services.spending_rollup import UNCATEGORIZED, apply_rollup_deltas
+
+logger = logging.getLogger(__name__)
+
+# Monthly partitions kept ready beyond the current month
+PARTITION_MONTHS_AHEAD = int(os.environ.get("TRANSACTION_PARTITION_MONTHS_AHEAD", 3))
+# Partitions of months older than this are detached; 0 keeps all of them
+PARTITION_RETENTION_MONTHS = int(os.environ.get("TRANSACTION_RETENTION_MONTHS", 0))
+# Serializes partition maintenance of several processes
+PARTITION_LOCK_ID = 7240519
+
+PARTITIONED_TABLE = Transaction.__tablename__
+DEFAULT_PARTITION = f"{PARTITIONED_TABLE}_default"
+# Non-partitioned table keeping external ids unique across all dates
+EXTERNAL_ID_REGISTRY = f"{PARTITIONED_TABLE}_external_id"
+
+_PARTITION_NAME = re.compile(rf"^{PARTITIONED_TABLE}_y(\d{{4}})m(\d{{2}})$")
+
+
+def month_floor(value):
+    """First day of the month of a date or datetime"""
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, months):
+    """Shift the first day of a month by a number of months"""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    """Name of the partition holding a month, e.g. transaction_y2024m05"""
+    return f"{PARTITIONED_TABLE}_y{month.year:04d}m{month.month:02d}"
+
+
+def _quote(connection, name):
+    return connection.dialect.identifier_preparer.quote(name)
+
+
+def is_partitioned(connection):
+    """Whether the transaction table is a partitioned PostgreSQL table"""
+    if connection.dialect.name != "postgresql":
+        return False
+    return connection.execute(
+        text(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table p "
+            "JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = :name AND pg_table_is_visible(c.oid))"
+        ),
+        {"name": PARTITIONED_TABLE},
+    ).scalar()
+
+
+def list_partitions(connection):
+    """
+    Monthly partitions attached to the transaction table
+
+    Returns:
+        list: (name, month) tuples in month order; the default partition
+            is not included
+    """
+    names = connection.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :name AND pg_table_is_visible(p.oid)"
+        ),
+        {"name": PARTITIONED_TABLE},
+    ).scalars()
+    partitions = []
+    for name in names:
+        match = _PARTITION_NAME.match(name)
+        if match:
+            month = date(int(match.group(1)), int(match.group(2)), 1)
+            partitions.append((name, month))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def detached_partitions(connection):
+    """
+    Monthly partition tables no longer attached to the transaction table
+
+    Returns:
+        list: (name, month) tuples in month order
+    """
+    names = connection.execute(
+        text(
+            "SELECT relname FROM pg_class "
+            "WHERE relkind = 'r' AND NOT relispartition "
+            "AND relname LIKE :pattern AND pg_table_is_visible(oid)"
+        ),
+        {"pattern": f"{PARTITIONED_TABLE}_y%"},
+    ).scalars()
+    partitions = []
+    for name in names:
+        match = _PARTITION_NAME.match(name)
+        if match:
+            month = date(int(match.group(1)), int(match.group(2)), 1)
+            partitions.append((name, month))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def create_partition(connection, month):
+    """
+    Attach the partition for one month
+
+    Rows of that month that landed in the default partition (imports of
+    old statements, clock skew) are moved into the new partition first,
+    since PostgreSQL refuses a partition overlapping default rows.
+
+    Args:
+        connection: Connection in the caller's transaction
+        month (date): First day of the month
+
+    Returns:
+        str: Name of the new partition
+    """
+    name = partition_name(month)
+    table = _quote(connection, PARTITIONED_TABLE)
+    partition = _quote(connection, name)
+    bounds = {
+        "start": datetime.combine(month, datetime.min.time()),
+        "end": datetime.combine(add_months(month, 1), datetime.min.time()),
+    }
+    connection.execute(
+        text(
+            f"CREATE TABLE {partition} "
+            f"(LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        )
+    )
+    moved = connection.execute(
+        text(
+            f"WITH moved AS (DELETE FROM {_quote(connection, DEFAULT_PARTITION)} "
+            "WHERE transaction_date >= :start AND transaction_date < :end "
+            f"RETURNING *) INSERT INTO {partition} SELECT * FROM moved"
+        ),
+        bounds,
+    ).rowcount
+    # DDL takes no bind parameters; the bounds are generated dates
+    connection.execute(
+        text(
+            f"ALTER TABLE {table} ATTACH PARTITION {partition} FOR VALUES "
+            f"FROM ('{bounds['start'].isoformat()}') "
+            f"TO ('{bounds['end'].isoformat()}')"
+        )
+    )
+    logger.info(f"Attached partition {name} ({moved} rows from the default one)")
+    return name
+
+
+def detach_partition(connection, name):
+    """
+    Detach a partition; it stays in the database as a standalone table
+
+    The daily rollup and monthly summary keep the detached months, so
+    totals and charts still cover them, although the table no longer holds
+    those transactions. rebuild-spending-rollup therefore adds detached
+    partitions back after recomputing from the table (see
+    add_detached_to_rollups), and archiving them keeps the rollups as they
+    are.
+    """
+    connection.execute(
+        text(
+            f"ALTER TABLE {_quote(connection, PARTITIONED_TABLE)} "
+            f"DETACH PARTITION {_quote(connection, name)}"
+        )
+    )
+    logger.info(f"Detached partition {name}")
+
+
+def add_detached_to_rollups(user_id=None):
+    """
+    Add detached partitions to a freshly rebuilt rollup and summary
+
+    rebuild_daily_rollup and rebuild_monthly_summary only see the attached
+    partitions; this puts the detached months back. The caller commits.
+
+    Args:
+        user_id (int): Only add this user's transactions; all when None
+
+    Returns:
+        int: Number of detached transactions added
+    """
+    connection = db.session.connection()
+    if connection.dialect.name != "postgresql":
+        return 0
+    added = 0
+    for name, _ in detached_partitions(connection):
+        query = (
+            "SELECT user_id, CAST(transaction_date AS DATE), "
+            f"COALESCE(category_id, {UNCATEGORIZED}), COALESCE(is_expense, false), "
+            "sum(amount), count(*), min(amount), max(amount), "
+            f"sum(amount * amount) FROM {_quote(connection, name)}"
+        )
+        if user_id is not None:
+            query += " WHERE user_id = :user_id"
+        query += " GROUP BY 1, 2, 3, 4"
+        deltas = {}
+        for row in connection.execute(text(query), {"user_id": user_id}):
+            total, count, low, high, squares = row[4:]
+            deltas[tuple(row[:4])] = [total, count, low, high, squares, 0]
+            added += count
+        apply_rollup_deltas(deltas)
+    return added
+
+
+def ensure_partitions(connection, months_ahead=PARTITION_MONTHS_AHEAD, today=None):
+    """
+    Create the missing partitions from the current month to months_ahead
+
+    Returns:
+        list: Names of the partitions created
+    """
+    if not is_partitioned(connection):
+        return []
+    current = month_floor(today or datetime.utcnow())
+    existing = {month for _, month in list_partitions(connection)}
+    return [
+        create_partition(connection, add_months(current, offset))
+        for offset in range(months_ahead + 1)
+        if add_months(current, offset) not in existing
+    ]
+
+
+def detach_old_partitions(
+    connection, retention_months=PARTITION_RETENTION_MONTHS, today=None
+):
+    """
+    Detach partitions of months older than retention_months
+
+    Args:
+        retention_months (int): Months kept, the current one included;
+            0 keeps every partition
+
+    Returns:
+        list: Names of the partitions detached
+    """
+    if not retention_months or not is_partitioned(connection):
+        return []
+    cutoff = add_months(month_floor(today or datetime.utcnow()), 1 - retention_months)
+    detached = []
+    for name, month in list_partitions(connection):
+        if month < cutoff:
+            detach_partition(connection, name)
+            detached.append(name)
+    return detached
+
+
+def maintain_partitions(engine=None, today=None):
+    """
+    Create upcoming partitions and detach expired ones
+
+    Does nothing unless the transaction table is partitioned, i.e. on
+    SQLite. Safe to call from several processes at once.
+
+    Returns:
+        tuple: (created, detached) partition names
+    """
+    engine = engine if engine is not None else db.engine
+    if engine.dialect.name != "postgresql":
+        return [], []
+    with engine.begin() as connection:
+        connection.execute(
+            text("SELECT pg_advisory_xact_lock(:lock_id)"),
+            {"lock_id": PARTITION_LOCK_ID},
+        )
+        # Moving rows out of the default partition can take a while
+        without_statement_timeout(connection)
+        created = ensure_partitions(connection, today=today)
+        detached = detach_old_partitions(connection, today=today)
+    return created, detached
+
+
+def partition_transaction_table(connection, months_ahead=PARTITION_MONTHS_AHEAD):
+    """
+    Turn the transaction table into one partitioned by transaction_date
+
+    The rows are copied into a new table with a partition per month from
+    the oldest transaction to months_ahead beyond the current month, plus
+    a default partition for anything outside that range. Unique
+    constraints must contain the partition key, so the primary key becomes
+    (id, transaction_date) and external ids and fingerprints are unique per
+    transaction_date. A fingerprint hashes the date, so that is the same as
+    unique; external ids, whose date a bank may change after posting, are
+    kept unique by create_external_id_registry (migration 0010). Runs in
+    the caller's transaction.
+
+    Args:
+        connection: PostgreSQL connection
+        months_ahead (int): Future months to create partitions for
+    """
+    table = _quote(connection, PARTITIONED_TABLE)
+    old_name = f"{PARTITIONED_TABLE}_unpartitioned"
+    old = _quote(connection, old_name)
+
+    connection.execute(text(f"ALTER TABLE {table} RENAME TO {old}"))
+    sequence = connection.execute(
+        text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": old_name}
+    ).scalar()
+    # The new table's id default keeps using the sequence once the old
+    # table, its owner, is dropped
+    connection.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY NONE"))
+    connection.execute(
+        text(
+            f"CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS) "
+            "PARTITION BY RANGE (transaction_date)"
+        )
+    )
+    connection.execute(
+        text(
+            f"CREATE TABLE {_quote(connection, DEFAULT_PARTITION)} "
+            f"PARTITION OF {table} DEFAULT"
+        )
+    )
+
+    first = connection.execute(text(f"SELECT min(transaction_date) FROM {old}"))
+    first = first.scalar() or datetime.utcnow()
+    last = add_months(month_floor(datetime.utcnow()), months_ahead)
+    month = month_floor(first)
+    while month <= last:
+        start = datetime.combine(month, datetime.min.time()).isoformat()
+        end = datetime.combine(add_months(month, 1), datetime.min.time()).isoformat()
+        connection.execute(
+            text(
+                f"CREATE TABLE {_quote(connection, partition_name(month))} "
+                f"PARTITION OF {table} FOR VALUES FROM ('{start}') TO ('{end}')"
+            )
+        )
+        month = add_months(month, 1)
+
+    copied = connection.execute(
+        text(f"INSERT INTO {table} SELECT * FROM {old}")
+    ).rowcount
+    connection.execute(text(f"DROP TABLE {old}"))
+    connection.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id"))
+
+    connection.execute(
+        text(f"ALTER TABLE {table} ADD PRIMARY KEY (id, transaction_date)")
+    )
+    connection.execute(
+        text(
+            f"ALTER TABLE {table} ADD CONSTRAINT transaction_external_id_key "
+            "UNIQUE (external_id, transaction_date)"
+        )
+    )
+    for column, target in (
+        ("account_id", "bank_account"),
+        ("user_id", "user"),
+        ("category_id", "category"),
+    ):
+        connection.execute(
+            text(
+                f"ALTER TABLE {table} ADD CONSTRAINT transaction_{column}_fkey "
+                f"FOREIGN KEY ({column}) REFERENCES {_quote(connection, target)} (id)"
+            )
+        )
+    # Indexes on the parent are created on every partition
+    for index in Transaction.__table__.indexes:
+        if index.name == "ix_transaction_fingerprint":
+            connection.execute(
+                text(
+                    f"CREATE UNIQUE INDEX ix_transaction_fingerprint "
+                    f"ON {table} (fingerprint, transaction_date)"
+                )
+            )
+        else:
+            index.create(connection)
+    connection.execute(text(f"ANALYZE {table}"))
+    logger.info(f"Partitioned {PARTITIONED_TABLE} by month ({copied} rows)")
+
+
+def create_external_id_registry(connection):
+    """
+    Keep external ids unique across partitions with a side table
+
+    A partitioned table can only enforce (external_id, transaction_date),
+    so a pending transaction the bank later posts under another date would
+    be stored twice. transaction_external_id maps every external id to its
+    transaction and is maintained by triggers: an insert whose external id
+    belongs to another transaction is skipped, like ON CONFLICT DO NOTHING
+    skips it on SQLite, and a delete frees the id. Moving a row to another
+    partition (a changed transaction_date) runs as a delete and an insert,
+    which keeps the row's own registration. Runs in the caller's
+    transaction; existing external ids are registered first.
+
+    Args:
+        connection: PostgreSQL connection
+    """
+    table = _quote(connection, PARTITIONED_TABLE)
+    registry = _quote(connection, EXTERNAL_ID_REGISTRY)
+    id_type = Transaction.__table__.c.external_id.type.compile(connection.dialect)
+
+    connection.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS {registry} ("
+            f"external_id {id_type} PRIMARY KEY, transaction_id INTEGER NOT NULL)"
+        )
+    )
+    # Ids already stored under several dates keep their oldest transaction
+    connection.execute(
+        text(
+            f"INSERT INTO {registry} (external_id, transaction_id) "
+            f"SELECT external_id, min(id) FROM {table} "
+            "WHERE external_id IS NOT NULL GROUP BY external_id "
+            "ON CONFLICT DO NOTHING"
+        )
+    )
+    connection.execute(text(f"""
+            CREATE OR REPLACE FUNCTION {PARTITIONED_TABLE}_claim_external_id()
+            RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                IF NEW.external_id IS NULL THEN
+                    RETURN NEW;
+                END IF;
+                IF TG_OP = 'UPDATE'
+                        AND NEW.external_id IS NOT DISTINCT FROM OLD.external_id THEN
+                    RETURN NEW;
+                END IF;
+                INSERT INTO {registry} (external_id, transaction_id)
+                VALUES (NEW.external_id, NEW.id) ON CONFLICT DO NOTHING;
+                IF NOT FOUND AND NOT EXISTS (
+                    SELECT 1 FROM {registry}
+                    WHERE external_id = NEW.external_id AND transaction_id = NEW.id
+                ) THEN
+                    IF TG_OP = 'UPDATE' THEN
+                        RAISE unique_violation
+                            USING MESSAGE = 'duplicate external_id ' || NEW.external_id;
+                    END IF;
+                    RETURN NULL;
+                END IF;
+                IF TG_OP = 'UPDATE' THEN
+                    DELETE FROM {registry}
+                    WHERE external_id = OLD.external_id AND transaction_id = OLD.id;
+                END IF;
+                RETURN NEW;
+            END $$
+            """))
+    # AFTER row triggers run at the end of the statement, when a row moved
+    # to another partition already exists there again
+    connection.execute(text(f"""
+            CREATE OR REPLACE FUNCTION {PARTITIONED_TABLE}_release_external_id()
+            RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                DELETE FROM {registry}
+                WHERE external_id = OLD.external_id AND transaction_id = OLD.id
+                    AND NOT EXISTS (SELECT 1 FROM {table} WHERE id = OLD.id);
+                RETURN NULL;
+            END $$
+            """))
+    for name, timing, function in (
+        ("claim", "BEFORE INSERT OR UPDATE OF external_id", "claim"),
+        ("release", "AFTER DELETE", "release"),
+    ):
+        trigger = _quote(connection, f"{PARTITIONED_TABLE}_{name}_external_id")
+        connection.execute(text(f"DROP TRIGGER IF EXISTS {trigger} ON {table}"))
+        connection.execute(
+            text(
+                f"CREATE TRIGGER {trigger} {timing} ON {table} FOR EACH ROW "
+                f"EXECUTE FUNCTION {PARTITIONED_TABLE}_{function}_external_id()"
+            )
+        )
+    logger.info(f"Created the {EXTERNAL_ID_REGISTRY} registry")
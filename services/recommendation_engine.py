@@ -1,20 +1,27 @@
-import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
+import pandas as pd
 import logging
 from app import db
-from models import Transaction, BankAccount, Category, Recommendation
-from sqlalchemy import func, desc
+from models import Transaction, Recommendation
+from services.category_registry import get_categories
+from services.spending_rollup import month_start, spending_summary
+from services.transaction_archive import archive_available, archived_transactions
+from sqlalchemy import func
+
+# Description keywords of cash withdrawals
+CASH_KEYWORDS = ["снятие", "наличные", "банкомат", "atm"]
 
 logger = logging.getLogger(__name__)
 
 
-def generate_recommendations(user_id):
+def generate_recommendations(user_id, include_archive=False):
     """
     Generate money-saving recommendations based on user's transaction history
 
     Args:
         user_id (int): User ID
+        include_archive (bool): Look for subscriptions and cash withdrawals
+            in archived transactions too
 
     Returns:
         int: Number of recommendations generated
@@ -26,14 +33,10 @@ def generate_recommendations(user_id):
             db.session.delete(rec)
         db.session.commit()
 
-        # Get user's transactions
-        transactions = (
-            Transaction.query.join(BankAccount)
-            .filter(BankAccount.user_id == user_id)
-            .all()
-        )
+        # Totals per category and month come from the monthly summary
+        summary = spending_summary(user_id)
 
-        if not transactions:
+        if not summary["transactions_count"]:
             # No transactions, create a basic recommendation
             new_recommendation = Recommendation(
                 user_id=user_id,
@@ -45,164 +48,114 @@ def generate_recommendations(user_id):
             db.session.commit()
             return 1
 
-        # Convert to DataFrame for analysis
-        transactions_data = [
-            {
-                "id": t.id,
-                "amount": t.amount,
-                "date": t.transaction_date,
-                "description": t.description,
-                "merchant": t.merchant,
-                "category_id": t.category_id,
-                "is_expense": t.is_expense,
-                "account_id": t.account_id,
-            }
-            for t in transactions
-        ]
-
-        df = pd.DataFrame(transactions_data)
-
         # Get categories
-        categories = {c.id: c for c in Category.query.all()}
+        categories = {c.id: c for c in get_categories()}
 
         # Generate recommendations
         recommendations = []
 
         # 1. Identify high-spending categories
-        if not df.empty and "category_id" in df.columns and "amount" in df.columns:
-            expense_df = df[df["is_expense"] == True]
+        category_spending = sorted(
+            summary["category_spending"].items(),
+            key=lambda item: item[1],
+            reverse=True,
+        )
+        if category_spending:
+            # Top spending category
+            top_category_id, total_spent = category_spending[0]
+            top_category = categories.get(top_category_id)
 
-            if not expense_df.empty and "category_id" in expense_df.columns:
-                # Group by category and calculate total spending
-                category_spending = (
-                    expense_df.groupby("category_id")["amount"].sum().reset_index()
-                )
-                category_spending = category_spending.sort_values(
-                    "amount", ascending=False
-                )
+            if top_category:
+                avg_monthly = total_spent / 3  # Assume data is for about 3 months
+                potential_savings = avg_monthly * 0.15  # Suggest 15% reduction
 
-                # Top spending category
-                if not category_spending.empty:
-                    top_category_id = category_spending.iloc[0]["category_id"]
-                    top_category = categories.get(top_category_id)
-
-                    if top_category:
-                        total_spent = category_spending.iloc[0]["amount"]
-                        avg_monthly = (
-                            total_spent / 3
-                        )  # Assume data is for about 3 months
-                        potential_savings = avg_monthly * 0.15  # Suggest 15% reduction
-
-                        recommendation = Recommendation(
-                            user_id=user_id,
-                            title=f"Сократите расходы на {top_category.name}",
-                            description=f"Вы тратите значительную часть своего бюджета на {top_category.name}. "
-                            f"Попробуйте сократить эти расходы на 15%, это позволит вам сэкономить "
-                            f"около {potential_savings:.0f} ₽ в месяц.",
-                            potential_savings=float(potential_savings),
-                            category_id=int(top_category_id),
-                        )
-                        recommendations.append(recommendation)
+                recommendation = Recommendation(
+                    user_id=user_id,
+                    title=f"Сократите расходы на {top_category.name}",
+                    description=f"Вы тратите значительную часть своего бюджета на {top_category.name}. "
+                    f"Попробуйте сократить эти расходы на 15%, это позволит вам сэкономить "
+                    f"около {potential_savings:.0f} ₽ в месяц.",
+                    potential_savings=float(potential_savings),
+                    category_id=int(top_category_id),
+                )
+                recommendations.append(recommendation)
 
         # 2. Identify subscription services
-        current_month = datetime.now().replace(
-            day=1, hour=0, minute=0, second=0, microsecond=0
-        )
-        prev_month = (current_month - timedelta(days=1)).replace(day=1)
-        two_months_ago = (prev_month - timedelta(days=1)).replace(day=1)
-
         # Find recurring transactions of similar amounts
-        if not df.empty and "date" in df.columns and "amount" in df.columns:
-            df["month"] = pd.to_datetime(df["date"]).dt.to_period("M")
-
-            # Group by month and merchant, looking for similar amounts
-            potential_subscriptions = []
-
-            for merchant in df["merchant"].unique():
-                if not merchant:
-                    continue
-
-                merchant_df = df[df["merchant"] == merchant]
-                monthly_charges = merchant_df.groupby("month")["amount"].sum()
-
-                # Check if charges exist for at least 2 months with similar amounts
-                if len(monthly_charges) >= 2:
-                    amounts = monthly_charges.values
-                    if (
-                        np.std(amounts) / np.mean(amounts) < 0.1
-                    ):  # Low variance in amounts
-                        potential_subscriptions.append(
-                            {
-                                "merchant": merchant,
-                                "amount": float(np.mean(amounts)),
-                                "count": len(monthly_charges),
-                            }
-                        )
-
-            # Create recommendations for subscriptions
-            if potential_subscriptions:
-                total_subscription_cost = sum(
-                    sub["amount"] for sub in potential_subscriptions
-                )
-
-                subscription_text = "Потенциальные подписки:\n"
-                for sub in potential_subscriptions:
-                    subscription_text += (
-                        f"- {sub['merchant']}: ~{sub['amount']:.0f} ₽/месяц\n"
+        potential_subscriptions = []
+
+        for merchant, amounts in merchant_monthly_spending(
+            user_id, include_archive
+        ).items():
+            # Check if charges exist for at least 2 months with similar amounts
+            if len(amounts) >= 2:
+                if np.std(amounts) / np.mean(amounts) < 0.1:  # Low variance in amounts
+                    potential_subscriptions.append(
+                        {
+                            "merchant": merchant,
+                            "amount": float(np.mean(amounts)),
+                            "count": len(amounts),
+                        }
                     )
 
-                recommendation = Recommendation(
-                    user_id=user_id,
-                    title="Проверьте свои регулярные подписки",
-                    description=f"Мы обнаружили несколько регулярных платежей, которые могут быть подписками. "
-                    f"Проверьте, все ли из них вам действительно нужны. "
-                    f"Отключение ненужных подписок может сэкономить до {total_subscription_cost:.0f} ₽ в месяц.\n\n"
-                    f"{subscription_text}",
-                    potential_savings=float(
-                        total_subscription_cost / 2
-                    ),  # Assume half could be cancelled
+        # Create recommendations for subscriptions
+        if potential_subscriptions:
+            total_subscription_cost = sum(
+                sub["amount"] for sub in potential_subscriptions
+            )
+
+            subscription_text = "Потенциальные подписки:\n"
+            for sub in potential_subscriptions:
+                subscription_text += (
+                    f"- {sub['merchant']}: ~{sub['amount']:.0f} ₽/месяц\n"
                 )
-                recommendations.append(recommendation)
+
+            recommendation = Recommendation(
+                user_id=user_id,
+                title="Проверьте свои регулярные подписки",
+                description=f"Мы обнаружили несколько регулярных платежей, которые могут быть подписками. "
+                f"Проверьте, все ли из них вам действительно нужны. "
+                f"Отключение ненужных подписок может сэкономить до {total_subscription_cost:.0f} ₽ в месяц.\n\n"
+                f"{subscription_text}",
+                potential_savings=float(
+                    total_subscription_cost / 2
+                ),  # Assume half could be cancelled
+            )
+            recommendations.append(recommendation)
 
         # 3. Dining out recommendation
-        if not df.empty and "category_id" in df.columns and "amount" in df.columns:
-            # Check for restaurant category
-            restaurant_category = next(
-                (c for c in categories.values() if c.name == "Рестораны"), None
+        # Check for restaurant category
+        restaurant_category = next(
+            (c for c in categories.values() if c.name == "Рестораны"), None
+        )
+
+        if restaurant_category:
+            restaurant_spent = summary["category_spending"].get(
+                restaurant_category.id, 0
             )
 
-            if restaurant_category:
-                restaurant_expenses = df[
-                    (df["category_id"] == restaurant_category.id)
-                    & (df["is_expense"] == True)
-                ]
-
-                if not restaurant_expenses.empty:
-                    monthly_dining = (
-                        restaurant_expenses["amount"].sum() / 3
-                    )  # Assume 3 months of data
-
-                    if (
-                        monthly_dining > 5000
-                    ):  # If spending more than 5000₽ monthly on dining
-                        potential_savings = (
-                            monthly_dining * 0.3
-                        )  # Suggest 30% reduction
-
-                        recommendation = Recommendation(
-                            user_id=user_id,
-                            title="Готовьте дома чаще",
-                            description=f"Вы тратите около {monthly_dining:.0f} ₽ в месяц на кафе и рестораны. "
-                            f"Приготовление еды дома вместо походов в рестораны может сэкономить "
-                            f"до {potential_savings:.0f} ₽ ежемесячно.",
-                            potential_savings=float(potential_savings),
-                            category_id=int(restaurant_category.id),
-                        )
-                        recommendations.append(recommendation)
+            if restaurant_spent:
+                monthly_dining = restaurant_spent / 3  # Assume 3 months of data
+
+                if (
+                    monthly_dining > 5000
+                ):  # If spending more than 5000₽ monthly on dining
+                    potential_savings = monthly_dining * 0.3  # Suggest 30% reduction
+
+                    recommendation = Recommendation(
+                        user_id=user_id,
+                        title="Готовьте дома чаще",
+                        description=f"Вы тратите около {monthly_dining:.0f} ₽ в месяц на кафе и рестораны. "
+                        f"Приготовление еды дома вместо походов в рестораны может сэкономить "
+                        f"до {potential_savings:.0f} ₽ ежемесячно.",
+                        potential_savings=float(potential_savings),
+                        category_id=int(restaurant_category.id),
+                    )
+                    recommendations.append(recommendation)
 
         # 4. General savings recommendation
-        total_expenses = df[df["is_expense"] == True]["amount"].sum()
-        total_income = df[df["is_expense"] == False]["amount"].sum()
+        total_expenses = summary["total_spent"]
+        total_income = summary["total_income"]
 
         if total_income > 0:
             savings_rate = 1 - (total_expenses / total_income)
@@ -228,34 +181,25 @@ def generate_recommendations(user_id):
                 recommendations.append(recommendation)
 
         # 5. Check for cash withdrawals
-        if not df.empty and "description" in df.columns and "amount" in df.columns:
-            cash_keywords = ["снятие", "наличные", "банкомат", "atm"]
-            cash_withdrawals = df[
-                df["description"]
-                .str.lower()
-                .str.contains("|".join(cash_keywords), na=False)
-            ]
-
-            if not cash_withdrawals.empty:
-                monthly_cash = (
-                    cash_withdrawals["amount"].sum() / 3
-                )  # Assume 3 months of data
-
-                if monthly_cash > 10000:  # If withdrawing more than 10000₽ monthly
-                    potential_savings = (
-                        monthly_cash * 0.1
-                    )  # Assume 10% savings from better tracking
+        monthly_cash = (
+            cash_withdrawn(user_id, include_archive) / 3
+        )  # Assume 3 months of data
 
-                    recommendation = Recommendation(
-                        user_id=user_id,
-                        title="Уменьшите использование наличных",
-                        description=f"Вы снимаете около {monthly_cash:.0f} ₽ наличными каждый месяц. "
-                        f"Платежи картой легче отследить и проанализировать. "
-                        f"Уменьшение использования наличных поможет вам лучше контролировать расходы "
-                        f"и может сэкономить до {potential_savings:.0f} ₽ в месяц.",
-                        potential_savings=float(potential_savings),
-                    )
-                    recommendations.append(recommendation)
+        if monthly_cash > 10000:  # If withdrawing more than 10000₽ monthly
+            potential_savings = (
+                monthly_cash * 0.1
+            )  # Assume 10% savings from better tracking
+
+            recommendation = Recommendation(
+                user_id=user_id,
+                title="Уменьшите использование наличных",
+                description=f"Вы снимаете около {monthly_cash:.0f} ₽ наличными каждый месяц. "
+                f"Платежи картой легче отследить и проанализировать. "
+                f"Уменьшение использования наличных поможет вам лучше контролировать расходы "
+                f"и может сэкономить до {potential_savings:.0f} ₽ в месяц.",
+                potential_savings=float(potential_savings),
+            )
+            recommendations.append(recommendation)
 
         # Add all recommendations to database
         for rec in recommendations:
@@ -282,3 +226,92 @@ def generate_recommendations(user_id):
         except:
             logger.error("Failed to add fallback recommendation")
             return 0
+
+
+def _archived(user_id, columns, include_archive):
+    """
+    Archived transactions for a report, empty unless requested and readable
+
+    Without pyarrow the report falls back to the transactions table alone.
+    """
+    if not include_archive:
+        return pd.DataFrame(columns=columns)
+    if not archive_available():
+        logger.warning(
+            "pyarrow is not installed, archived transactions are left out of "
+            f"the report for user {user_id}"
+        )
+        return pd.DataFrame(columns=columns)
+    return archived_transactions(user_id, columns=columns)
+
+
+def merchant_monthly_spending(user_id, include_archive=False):
+    """
+    Monthly expense totals per merchant, summed by the database
+
+    Archived months are only read and merged in when include_archive is set,
+    as that reads every archive file of the user.
+
+    Args:
+        user_id (int): User ID
+        include_archive (bool): Merge in transactions from the archive
+
+    Returns:
+        dict: Merchant -> list of monthly totals, for months with charges
+    """
+    month = month_start(
+        Transaction.transaction_date, db.session.get_bind().dialect.name
+    )
+    rows = (
+        db.session.query(Transaction.merchant, month, func.sum(Transaction.amount))
+        .filter(Transaction.user_id == user_id)
+        .filter(Transaction.is_expense == True)
+        .filter(Transaction.merchant != "")
+        .group_by(Transaction.merchant, month)
+    )
+    # Months are keyed as "YYYY-MM": SQLite returns strings, PostgreSQL dates
+    totals = {(merchant, str(start)[:7]): total for merchant, start, total in rows}
+
+    archived = _archived(
+        user_id,
+        ["merchant", "transaction_date", "amount", "is_expense"],
+        include_archive,
+    )
+    if not archived.empty:
+        archived = archived[archived["is_expense"] & (archived["merchant"] != "")]
+        archived_months = archived.groupby(
+            [archived["merchant"], archived["transaction_date"].dt.strftime("%Y-%m")]
+        )["amount"].sum()
+        for key, total in archived_months.items():
+            totals[key] = totals.get(key, 0.0) + float(total)
+
+    monthly = {}
+    for (merchant, _), total in totals.items():
+        monthly.setdefault(merchant, []).append(total)
+    return monthly
+
+
+def _is_cash(description):
+    description = (description or "").lower()
+    return any(keyword in description for keyword in CASH_KEYWORDS)
+
+
+def cash_withdrawn(user_id, include_archive=False):
+    """
+    Total of transactions whose description mentions a cash withdrawal
+
+    Descriptions are grouped by the database and matched here, as SQL
+    LOWER() does not fold Cyrillic on SQLite. Archived transactions are
+    included when include_archive is set.
+    """
+    rows = (
+        db.session.query(Transaction.description, func.sum(Transaction.amount))
+        .filter(Transaction.user_id == user_id)
+        .group_by(Transaction.description)
+    )
+    total = sum(total for description, total in rows if _is_cash(description))
+
+    archived = _archived(user_id, ["description", "amount"], include_archive)
+    if not archived.empty:
+        total += float(archived[archived["description"].map(_is_cash)]["amount"].sum())
+    return total
@@ -0,0 +1,693 @@
+import logging
+import math
+from datetime import date, datetime, time, timedelta
+from operator import itemgetter
+from sqlalchemy import Date, cast, delete, event, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, attributes, object_session
+from app import db
+from models import (
+    Category,
+    DailySpendingRollup,
+    MonthlySpendingSummary,
+    Transaction,
+)
+
+logger = logging.getLogger(__name__)
+
+# Rollup rows per upsert statement
+UPSERT_CHUNK_SIZE = 1000
+# Stored category_id of uncategorized transactions
+UNCATEGORIZED = 0
+# Transaction columns a rollup row is derived from, see rollup_deltas
+ROLLUP_SOURCE_COLUMNS = [
+    "user_id",
+    "transaction_date",
+    "category_id",
+    "is_expense",
+    "amount",
+]
+WEEKDAYS = [
+    "Monday",
+    "Tuesday",
+    "Wednesday",
+    "Thursday",
+    "Friday",
+    "Saturday",
+    "Sunday",
+]
+
+
+def _day(column, dialect_name):
+    # CAST(... AS DATE) has numeric affinity on SQLite
+    if dialect_name == "sqlite":
+        return func.date(column)
+    return cast(column, Date)
+
+
+def month_start(column, dialect_name):
+    """SQL expression for the first day of the month of a date column"""
+    if dialect_name == "sqlite":
+        return func.date(column, "start of month")
+    return cast(func.date_trunc("month", column), Date)
+
+
+def _next_month(month):
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+def _dialect_name(bind):
+    if hasattr(bind, "get_bind"):
+        return bind.get_bind().dialect.name
+    return bind.dialect.name
+
+
+def rollup_deltas(rows, sign=1, deltas=None):
+    """
+    Sum transactions into rollup increments
+
+    Args:
+        rows (iterable): Mappings or tuples with the ROLLUP_SOURCE_COLUMNS
+        sign (int): 1 for added transactions, -1 for removed ones
+        deltas (dict): Increments to add to, a new dict when None
+
+    Returns:
+        dict: (user_id, day, category_id, is_expense) -> [total, count,
+            min, max, sum of squares, number of removed transactions]
+    """
+    deltas = deltas if deltas is not None else {}
+    source_values = itemgetter(*ROLLUP_SOURCE_COLUMNS)
+    for row in rows:
+        if isinstance(row, dict):
+            row = source_values(row)
+        user_id, transaction_date, category_id, is_expense, amount = row
+        if isinstance(transaction_date, datetime):
+            transaction_date = transaction_date.date()
+        key = (
+            user_id,
+            transaction_date,
+            category_id or UNCATEGORIZED,
+            bool(is_expense),
+        )
+        amount = float(amount)
+        delta = deltas.get(key)
+        if delta is None:
+            delta = deltas[key] = [0.0, 0, amount, amount, 0.0, 0]
+        delta[0] += sign * amount
+        delta[1] += sign
+        delta[4] += sign * amount * amount
+        if sign > 0:
+            delta[2] = min(delta[2], amount)
+            delta[3] = max(delta[3], amount)
+        else:
+            delta[5] += 1
+    return deltas
+
+
+def monthly_deltas(deltas):
+    """
+    Merge daily increments into monthly ones
+
+    Args:
+        deltas (dict): Increments from rollup_deltas
+
+    Returns:
+        dict: (user_id, month, category_id, is_expense) -> increments in
+            the rollup_deltas format, month being the first day
+    """
+    monthly = {}
+    for (user_id, day, category_id, is_expense), delta in deltas.items():
+        key = (user_id, day.replace(day=1), category_id, is_expense)
+        merged = monthly.get(key)
+        if merged is None:
+            monthly[key] = list(delta)
+            continue
+        merged[0] += delta[0]
+        merged[1] += delta[1]
+        merged[2] = min(merged[2], delta[2])
+        merged[3] = max(merged[3], delta[3])
+        merged[4] += delta[4]
+        merged[5] += delta[5]
+    return monthly
+
+
+def _upsert_statement(table, dialect_name):
+    if dialect_name == "postgresql":
+        statement = postgresql.insert(table)
+        least, greatest = func.least, func.greatest
+    elif dialect_name == "sqlite":
+        statement = sqlite.insert(table)
+        # Multi-argument min() and max() are scalar functions on SQLite
+        least, greatest = func.min, func.max
+    else:
+        return None
+
+    current, added = table.c, statement.excluded
+    merged = {
+        "total": current.total + added.total,
+        "count": current.count + added.count,
+    }
+    if "sum_squares" in current:
+        merged.update(
+            sum_squares=current.sum_squares + added.sum_squares,
+            min_amount=least(
+                func.coalesce(current.min_amount, added.min_amount), added.min_amount
+            ),
+            max_amount=greatest(
+                func.coalesce(current.max_amount, added.max_amount), added.max_amount
+            ),
+        )
+    return statement.on_conflict_do_update(
+        index_elements=[column.name for column in table.primary_key],
+        set_=merged,
+    )
+
+
+def apply_rollup_deltas(deltas, bind=None):
+    """
+    Add increments to the daily rollup and the monthly summary
+
+    Runs in the caller's transaction, so both commit or roll back together
+    with the transactions they describe. Rows whose count drops to zero
+    are removed. Removals are applied as increments too, since the table
+    may no longer hold every transaction of the month (archived or
+    detached ones); a minimum or maximum cannot be taken back, so those are
+    narrowed from the table where it still holds the whole month.
+
+    Args:
+        deltas (dict): Increments from rollup_deltas
+        bind: Session or Connection to write with, db.session when None
+    """
+    if not deltas:
+        return
+    bind = bind if bind is not None else db.session
+    dialect_name = _dialect_name(bind)
+    table = DailySpendingRollup.__table__
+    rows = [
+        {
+            "user_id": user_id,
+            "day": day,
+            "category_id": category_id,
+            "is_expense": is_expense,
+            "total": total,
+            "count": count,
+        }
+        for (user_id, day, category_id, is_expense), (
+            total,
+            count,
+            *_,
+        ) in deltas.items()
+        if count or total
+    ]
+
+    statement = _upsert_statement(table, dialect_name)
+    if statement is not None:
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            bind.execute(statement, rows[start : start + UPSERT_CHUNK_SIZE])
+    else:
+        for row in rows:
+            key = (column == row[column.name] for column in table.primary_key)
+            updated = bind.execute(
+                update(table)
+                .where(*key)
+                .values(
+                    total=table.c.total + row["total"],
+                    count=table.c.count + row["count"],
+                )
+            )
+            if updated.rowcount == 0:
+                bind.execute(insert(table).values(**row))
+
+    if any(row["count"] < 0 for row in rows):
+        user_ids = {row["user_id"] for row in rows}
+        bind.execute(
+            delete(table).where(table.c.user_id.in_(user_ids), table.c.count <= 0)
+        )
+
+    _apply_monthly_deltas(monthly_deltas(deltas), bind, dialect_name)
+
+
+def _apply_monthly_deltas(deltas, bind, dialect_name):
+    table = MonthlySpendingSummary.__table__
+    statement = _upsert_statement(table, dialect_name)
+    if statement is None:
+        # No upsert on this database: recompute the months from the table
+        for user_id, month in sorted({key[:2] for key in deltas}):
+            rebuild_monthly_summary(bind, user_id=user_id, month=month)
+        return
+
+    rows = [
+        {
+            "user_id": user_id,
+            "month": month,
+            "category_id": category_id,
+            "is_expense": is_expense,
+            "total": total,
+            "count": count,
+            "min_amount": low,
+            "max_amount": high,
+            "sum_squares": squares,
+        }
+        for (user_id, month, category_id, is_expense), (
+            total,
+            count,
+            low,
+            high,
+            squares,
+            _,
+        ) in deltas.items()
+    ]
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        bind.execute(statement, rows[start : start + UPSERT_CHUNK_SIZE])
+
+    shrunk = [key for key, delta in deltas.items() if delta[5]]
+    if shrunk:
+        user_ids = {key[0] for key in shrunk}
+        bind.execute(
+            delete(table).where(table.c.user_id.in_(user_ids), table.c.count <= 0)
+        )
+    for key in shrunk:
+        _narrow_month_bounds(bind, table, *key)
+
+
+def _narrow_month_bounds(bind, table, user_id, month, category_id, is_expense):
+    """
+    Recompute a summary row's minimum and maximum after a removal
+
+    Only done when the table still holds every transaction the row counts;
+    months partly archived or detached keep their bounds, which then may be
+    wider than the remaining transactions.
+    """
+    transactions = Transaction.__table__
+    group = (
+        transactions.c.user_id == user_id,
+        transactions.c.transaction_date >= datetime.combine(month, time.min),
+        transactions.c.transaction_date
+        < datetime.combine(_next_month(month), time.min),
+        func.coalesce(transactions.c.category_id, UNCATEGORIZED) == category_id,
+        func.coalesce(transactions.c.is_expense, False) == is_expense,
+    )
+
+    def live(column):
+        return select(column).where(*group).scalar_subquery()
+
+    bind.execute(
+        update(table)
+        .where(
+            table.c.user_id == user_id,
+            table.c.month == month,
+            table.c.category_id == category_id,
+            table.c.is_expense == is_expense,
+            table.c.count == live(func.count()),
+        )
+        .values(
+            min_amount=live(func.min(transactions.c.amount)),
+            max_amount=live(func.max(transactions.c.amount)),
+        )
+    )
+
+
+def rebuild_daily_rollup(bind=None, user_id=None):
+    """
+    Recompute the daily rollup from the transactions
+
+    Args:
+        bind: Session or Connection to write with, db.session when None
+        user_id (int): Only rebuild this user's rows; all users when None
+
+    Returns:
+        int: Number of rollup rows written
+    """
+    bind = bind if bind is not None else db.session
+    dialect_name = _dialect_name(bind)
+    table = DailySpendingRollup.__table__
+    transactions = Transaction.__table__
+    day = _day(transactions.c.transaction_date, dialect_name)
+    category_id = func.coalesce(transactions.c.category_id, UNCATEGORIZED)
+    # NULL counts as income, like the dashboard's is_expense == True filter
+    is_expense = func.coalesce(transactions.c.is_expense, False)
+
+    source = select(
+        transactions.c.user_id,
+        day,
+        category_id,
+        is_expense,
+        func.sum(transactions.c.amount),
+        func.count(),
+    ).group_by(transactions.c.user_id, day, category_id, is_expense)
+    clear = delete(table)
+    if user_id is not None:
+        source = source.where(transactions.c.user_id == user_id)
+        clear = clear.where(table.c.user_id == user_id)
+
+    bind.execute(clear)
+    result = bind.execute(
+        insert(table).from_select(
+            ["user_id", "day", "category_id", "is_expense", "total", "count"], source
+        )
+    )
+    logger.info(f"Rebuilt {result.rowcount} daily rollup rows")
+    return result.rowcount
+
+
+def rebuild_monthly_summary(bind=None, user_id=None, month=None):
+    """
+    Recompute the monthly summary from the transactions
+
+    Args:
+        bind: Session or Connection to write with, db.session when None
+        user_id (int): Only rebuild this user's rows; all users when None
+        month (date): Only rebuild this month (its first day); all when None
+
+    Returns:
+        int: Number of summary rows written
+    """
+    bind = bind if bind is not None else db.session
+    dialect_name = _dialect_name(bind)
+    table = MonthlySpendingSummary.__table__
+    transactions = Transaction.__table__
+    amount = transactions.c.amount
+    month_column = month_start(transactions.c.transaction_date, dialect_name)
+    category_id = func.coalesce(transactions.c.category_id, UNCATEGORIZED)
+    is_expense = func.coalesce(transactions.c.is_expense, False)
+
+    source = select(
+        transactions.c.user_id,
+        month_column,
+        category_id,
+        is_expense,
+        func.sum(amount),
+        func.count(),
+        func.min(amount),
+        func.max(amount),
+        func.sum(amount * amount),
+    ).group_by(transactions.c.user_id, month_column, category_id, is_expense)
+    clear = delete(table)
+    if user_id is not None:
+        source = source.where(transactions.c.user_id == user_id)
+        clear = clear.where(table.c.user_id == user_id)
+    if month is not None:
+        # A date range rather than the month expression, so the index is used
+        source = source.where(
+            transactions.c.transaction_date >= datetime.combine(month, time.min),
+            transactions.c.transaction_date
+            < datetime.combine(_next_month(month), time.min),
+        )
+        clear = clear.where(table.c.month == month)
+
+    bind.execute(clear)
+    result = bind.execute(
+        insert(table).from_select(
+            [
+                "user_id",
+                "month",
+                "category_id",
+                "is_expense",
+                "total",
+                "count",
+                "min_amount",
+                "max_amount",
+                "sum_squares",
+            ],
+            source,
+        )
+    )
+    if month is None:
+        logger.info(f"Rebuilt {result.rowcount} monthly summary rows")
+    return result.rowcount
+
+
+def spending_summary(user_id, today=None):
+    """
+    Spending statistics computed from the monthly summary
+
+    Args:
+        user_id (int): User ID
+        today (date): Reference day for the current month, today when None
+
+    Returns:
+        dict: transactions_count, total_spent, total_income,
+            current_month_spent, prev_month_spent, month_over_month_change
+            (percent), category_spending (category id -> expense total, 0
+            for uncategorized) and the count, mean and standard deviation
+            of single expenses (expense_count, expense_mean, expense_std)
+    """
+    today = today or datetime.now().date()
+    current_month = today.replace(day=1)
+    prev_month = (current_month - timedelta(days=1)).replace(day=1)
+
+    summary = {
+        "transactions_count": 0,
+        "total_spent": 0.0,
+        "total_income": 0.0,
+        "current_month_spent": 0.0,
+        "prev_month_spent": 0.0,
+        "month_over_month_change": 0.0,
+        "category_spending": {},
+    }
+    expense_squares = 0.0
+    expense_count = 0
+    rows = db.session.query(
+        MonthlySpendingSummary.month,
+        MonthlySpendingSummary.category_id,
+        MonthlySpendingSummary.is_expense,
+        MonthlySpendingSummary.total,
+        MonthlySpendingSummary.count,
+        MonthlySpendingSummary.sum_squares,
+    ).filter(MonthlySpendingSummary.user_id == user_id)
+    for month, category_id, is_expense, total, count, squares in rows:
+        summary["transactions_count"] += count
+        if not is_expense:
+            summary["total_income"] += total
+            continue
+        summary["total_spent"] += total
+        expense_count += count
+        expense_squares += squares
+        categories = summary["category_spending"]
+        categories[category_id] = categories.get(category_id, 0.0) + total
+        if month == current_month:
+            summary["current_month_spent"] += total
+        elif month == prev_month:
+            summary["prev_month_spent"] += total
+
+    if summary["prev_month_spent"] > 0:
+        summary["month_over_month_change"] = (
+            (summary["current_month_spent"] - summary["prev_month_spent"])
+            / summary["prev_month_spent"]
+            * 100
+        )
+
+    # Sample standard deviation from the sum and the sum of squares
+    mean = summary["total_spent"] / expense_count if expense_count else 0.0
+    variance = 0.0
+    if expense_count > 1:
+        variance = max(
+            (expense_squares - expense_count * mean * mean) / (expense_count - 1), 0.0
+        )
+    summary.update(
+        expense_count=expense_count,
+        expense_mean=mean,
+        expense_std=math.sqrt(variance),
+    )
+    return summary
+
+
+def expense_days(user_id):
+    """Number of days with at least one expense"""
+    return (
+        db.session.query(func.count(DailySpendingRollup.day.distinct()))
+        .filter(DailySpendingRollup.user_id == user_id)
+        .filter(DailySpendingRollup.is_expense == True)
+        .scalar()
+    )
+
+
+def category_spending(user_id, since, until=None):
+    """
+    Expense totals per category between two days
+
+    Args:
+        user_id (int): User ID
+        since (date): First day included
+        until (date): Day after the last one included; open-ended when None
+
+    Returns:
+        list: (category name, total) tuples, largest first
+    """
+    total = func.sum(DailySpendingRollup.total)
+    query = (
+        db.session.query(Category.name, total)
+        .join(DailySpendingRollup, DailySpendingRollup.category_id == Category.id)
+        .filter(DailySpendingRollup.user_id == user_id)
+        .filter(DailySpendingRollup.is_expense == True)
+        .filter(DailySpendingRollup.day >= since)
+    )
+    if until is not None:
+        query = query.filter(DailySpendingRollup.day < until)
+    return query.group_by(Category.name).order_by(total.desc()).all()
+
+
+def daily_spending(user_id, since):
+    """
+    Expense totals per day from a given day on
+
+    Returns:
+        list: (date, total) tuples in date order
+    """
+    return (
+        db.session.query(DailySpendingRollup.day, func.sum(DailySpendingRollup.total))
+        .filter(DailySpendingRollup.user_id == user_id)
+        .filter(DailySpendingRollup.is_expense == True)
+        .filter(DailySpendingRollup.day >= since)
+        .group_by(DailySpendingRollup.day)
+        .order_by(DailySpendingRollup.day)
+        .all()
+    )
+
+
+def recent_activity_start(user_id, count, category_id=None, until=None):
+    """
+    First day of the most recent days holding at least count transactions
+
+    Gives "latest transactions" queries a date bound, so on a partitioned
+    table they read the newest partitions only.
+
+    Args:
+        user_id (int): User ID
+        count (int): Transactions the days must hold
+        category_id (int): Only count this category's transactions
+        until (date): Only count days before this one
+
+    Returns:
+        date: The bound, the first day of activity if the user has fewer
+            transactions, or None if there are none
+    """
+    query = db.session.query(
+        DailySpendingRollup.day, func.sum(DailySpendingRollup.count)
+    ).filter(DailySpendingRollup.user_id == user_id)
+    if category_id is not None:
+        query = query.filter(DailySpendingRollup.category_id == category_id)
+    if until is not None:
+        query = query.filter(DailySpendingRollup.day < until)
+    rows = (
+        query.group_by(DailySpendingRollup.day)
+        .order_by(DailySpendingRollup.day.desc())
+        .limit(count)
+    )
+    start = None
+    seen = 0
+    for day, day_count in rows:
+        start = day
+        seen += day_count
+        if seen >= count:
+            break
+    return start
+
+
+def first_uncategorized_day(user_id):
+    """Day of the user's oldest uncategorized transaction, or None"""
+    return (
+        db.session.query(func.min(DailySpendingRollup.day))
+        .filter(DailySpendingRollup.user_id == user_id)
+        .filter(DailySpendingRollup.category_id == UNCATEGORIZED)
+        .scalar()
+    )
+
+
+def weekday_spending(user_id):
+    """
+    Expense totals per day of the week over the user's whole history
+
+    Returns:
+        list: {"day_of_week": name, "amount": total} dicts, Monday first,
+            for the days with any spending
+    """
+    totals = [0.0] * 7
+    seen = [False] * 7
+    for day, total in daily_spending(user_id, date.min):
+        totals[day.weekday()] += total
+        seen[day.weekday()] = True
+    return [
+        {"day_of_week": name, "amount": totals[index]}
+        for index, name in enumerate(WEEKDAYS)
+        if seen[index]
+    ]
+
+
+def spending_charts(user_id, today=None):
+    """
+    Chart data for the transaction analysis page
+
+    Args:
+        user_id (int): User ID
+        today (date): Reference day, today when None
+
+    Returns:
+        dict: top_spending_categories (current month, top 5) and
+            day_of_week_spending, in the format of analyze_transactions
+    """
+    today = today or datetime.now().date()
+    top_categories = category_spending(user_id, today.replace(day=1))[:5]
+    return {
+        "top_spending_categories": [
+            {"name": name, "amount": float(total)} for name, total in top_categories
+        ],
+        "day_of_week_spending": weekday_spending(user_id),
+    }
+
+
+def _transaction_values(target, previous=False):
+    values = {}
+    for name in ROLLUP_SOURCE_COLUMNS:
+        value = getattr(target, name)
+        if previous:
+            history = attributes.get_history(target, name)
+            if history.deleted:
+                value = history.deleted[0]
+        values[name] = value
+    return values
+
+
+# ORM writes (manual edits, recategorization, cascade deletes) keep the
+# rollups in step here; bulk Core inserts call apply_rollup_deltas directly.
+# Increments are collected per session and applied once per flush, so
+# deleting an account with its transactions recomputes each month once.
+_PENDING_DELTAS = "spending_rollup_deltas"
+
+
+def _pending_deltas(target):
+    return object_session(target).info.setdefault(_PENDING_DELTAS, {})
+
+
+@event.listens_for(Transaction, "after_insert")
+def _rollup_inserted(mapper, connection, target):
+    rollup_deltas([_transaction_values(target)], deltas=_pending_deltas(target))
+
+
+@event.listens_for(Transaction, "after_update")
+def _rollup_updated(mapper, connection, target):
+    before = _transaction_values(target, previous=True)
+    after = _transaction_values(target)
+    if before == after:
+        return
+    deltas = _pending_deltas(target)
+    rollup_deltas([before], sign=-1, deltas=deltas)
+    rollup_deltas([after], deltas=deltas)
+
+
+@event.listens_for(Transaction, "after_delete")
+def _rollup_deleted(mapper, connection, target):
+    values = _transaction_values(target, previous=True)
+    rollup_deltas([values], sign=-1, deltas=_pending_deltas(target))
+
+
+@event.listens_for(Session, "after_flush")
+def _apply_pending_deltas(session, flush_context):
+    deltas = session.info.pop(_PENDING_DELTAS, None)
+    if deltas:
+        apply_rollup_deltas(deltas, session)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_pending_deltas(session, previous_transaction):
+    session.info.pop(_PENDING_DELTAS, None)
@@ -0,0 +1,483 @@
+import codecs
+import csv
+import hashlib
+import io
+import logging
+import re
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from itertools import islice
+from services.transaction_ingest import ingest_transaction_batches
+
+logger = logging.getLogger(__name__)
+
+# Parsed rows categorized and loaded per batch
+IMPORT_BATCH_SIZE = 5000
+# Bytes read up front to detect the format, encoding and CSV dialect
+SNIFF_BYTES = 64 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+
+SUPPORTED_EXTENSIONS = (".csv", ".txt", ".ofx", ".qfx", ".xml")
+
+# Normalized CSV header -> Transaction field
+CSV_COLUMN_ALIASES = {
+    "date": [
+        "дата",
+        "дата операции",
+        "дата платежа",
+        "дата проводки",
+        "date",
+        "transaction date",
+        "posted date",
+        "booking date",
+    ],
+    "amount": ["сумма", "сумма операции", "сумма платежа", "amount"],
+    "debit": ["расход", "списание", "дебет", "debit", "withdrawal"],
+    "credit": ["приход", "поступление", "зачисление", "кредит", "credit", "deposit"],
+    "description": [
+        "описание",
+        "описание операции",
+        "назначение платежа",
+        "назначение",
+        "description",
+        "details",
+        "memo",
+    ],
+    "merchant": ["контрагент", "получатель", "merchant", "payee", "counterparty"],
+    "currency": ["валюта", "валюта операции", "currency"],
+    "reference": [
+        "номер операции",
+        "номер документа",
+        "id",
+        "transaction id",
+        "reference",
+    ],
+}
+
+DATE_FORMATS = (
+    "%Y-%m-%d",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d %H:%M:%S",
+    "%d.%m.%Y",
+    "%d.%m.%Y %H:%M",
+    "%d.%m.%Y %H:%M:%S",
+    "%d/%m/%Y",
+)
+
+_DOTTED_DATE = re.compile(
+    r"(\d{2})\.(\d{2})\.(\d{4})(?:[ T](\d{2}):(\d{2})(?::(\d{2}))?)?"
+)
+_OFX_TAG = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+
+
+class StatementFormatError(ValueError):
+    """The uploaded file is not a statement we can read"""
+
+
+def _normalize_header(name):
+    return (name or "").strip().strip('"').lower().replace("ё", "е")
+
+
+def parse_amount(value):
+    """Parse '1 234,56', '-1234.56', '1,234.56' or '1.234,56' into a float"""
+    text = (value or "").strip().replace("\xa0", "").replace(" ", "")
+    if "," in text and "." in text:
+        # Whichever separator comes last is the decimal point
+        if text.rfind(",") > text.rfind("."):
+            text = text.replace(".", "").replace(",", ".")
+        else:
+            text = text.replace(",", "")
+    else:
+        text = text.replace(",", ".")
+    return float(text)
+
+
+def parse_date(value):
+    """Parse ISO 8601 or the usual Russian 'dd.mm.yyyy [HH:MM[:SS]]' dates"""
+    text = (value or "").strip()
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        pass
+    # strptime is slow enough to dominate large imports, so match the common
+    # dotted format directly
+    match = _DOTTED_DATE.fullmatch(text)
+    if match:
+        return datetime(*(int(part) for part in match.group(3, 2, 1, 4, 5, 6) if part))
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format)
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognized date: {value!r}")
+
+
+class _PrefixedStream(io.RawIOBase):
+    """Binary stream that replays already-read bytes before the rest"""
+
+    def __init__(self, prefix, stream):
+        self.prefix = prefix
+        self.stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.prefix:
+            size = min(len(buffer), len(self.prefix))
+            buffer[:size] = self.prefix[:size]
+            self.prefix = self.prefix[size:]
+            return size
+        data = self.stream.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+
+def _detect_encoding(head):
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        # Incremental decoding tolerates a character cut at the end of head
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "cp1251"
+
+
+def detect_format(filename, head):
+    """
+    Guess the statement format from the file name and first bytes
+
+    Returns:
+        str: 'csv', 'ofx' or 'camt'
+    """
+    sample = head[:4096].decode("latin-1").lower()
+    if "ofxheader" in sample or "<ofx>" in sample:
+        return "ofx"
+    if "camt.053" in sample or "bktocstmrstmt" in sample:
+        return "camt"
+    name = (filename or "").lower()
+    if name.endswith((".ofx", ".qfx")):
+        return "ofx"
+    if name.endswith(".xml"):
+        return "camt"
+    return "csv"
+
+
+def iter_csv_transactions(text_stream, sample, on_skip):
+    """
+    Yield transactions from a bank CSV export
+
+    Columns are matched by header name (see CSV_COLUMN_ALIASES). Amounts are
+    either one signed column or separate debit/credit columns.
+
+    Args:
+        text_stream (io.TextIOBase): Decoded file
+        sample (str): Start of the file, used to detect the delimiter
+        on_skip (callable): Called with the error for each unreadable row
+    """
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=";,\t|")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(text_stream, dialect)
+
+    header = next(reader, None)
+    if header is None:
+        return
+    columns = {}
+    for index, name in enumerate(header):
+        normalized = _normalize_header(name)
+        for field, aliases in CSV_COLUMN_ALIASES.items():
+            if normalized in aliases and field not in columns:
+                columns[field] = index
+    if "date" not in columns or not (
+        "amount" in columns or "debit" in columns or "credit" in columns
+    ):
+        raise StatementFormatError(
+            "CSV header must contain a date and an amount (or debit/credit) column"
+        )
+
+    width = len(header)
+
+    def cell(row, field):
+        index = columns.get(field)
+        return row[index].strip() if index is not None else ""
+
+    for row in reader:
+        if not any(row):
+            continue
+        if len(row) < width:
+            row += [""] * (width - len(row))
+        try:
+            if "amount" in columns and cell(row, "amount"):
+                amount = parse_amount(cell(row, "amount"))
+            elif cell(row, "debit"):
+                amount = -abs(parse_amount(cell(row, "debit")))
+            else:
+                amount = abs(parse_amount(cell(row, "credit")))
+            date = parse_date(cell(row, "date"))
+        except ValueError as e:
+            on_skip(e)
+            continue
+
+        yield {
+            "reference": cell(row, "reference"),
+            "amount": abs(amount),
+            "is_expense": amount < 0,
+            "currency": cell(row, "currency") or None,
+            "description": cell(row, "description"),
+            "merchant": cell(row, "merchant"),
+            "date": date,
+        }
+
+
+def _parse_ofx_date(value):
+    # YYYYMMDD[HHMMSS[.XXX]][[+-]TZ:NAME]
+    digits = re.match(r"\d*", value.strip()).group()
+    if len(digits) >= 14:
+        return datetime.strptime(digits[:14], "%Y%m%d%H%M%S")
+    return datetime.strptime(digits[:8], "%Y%m%d")
+
+
+def iter_ofx_transactions(text_stream):
+    """
+    Yield transactions from an OFX 1.x (SGML) or 2.x (XML) statement
+
+    The file is tokenized chunk by chunk; only the current STMTTRN is kept.
+    """
+    currency = None
+    current = None
+    buffer = ""
+    while True:
+        chunk = text_stream.read(READ_CHUNK_SIZE)
+        buffer += chunk
+        # Tokens are only complete up to the last '<'
+        cut = len(buffer) if not chunk else buffer.rfind("<")
+        for match in _OFX_TAG.finditer(buffer, 0, max(cut, 0)):
+            closing, tag, value = match.group(1), match.group(2).upper(), match.group(3)
+            value = value.strip()
+            if tag == "STMTTRN":
+                if not closing:
+                    current = {}
+                elif current is not None:
+                    yield current, currency
+                    current = None
+            elif closing:
+                continue
+            elif tag == "CURDEF":
+                currency = value
+            elif current is not None and value:
+                current[tag] = value
+        if not chunk:
+            break
+        buffer = buffer[cut:]
+
+
+def _ofx_to_transaction(fields, currency):
+    amount = parse_amount(fields["TRNAMT"])
+    name = fields.get("NAME", "")
+    return {
+        "reference": fields.get("FITID", ""),
+        "amount": abs(amount),
+        "is_expense": amount < 0,
+        "currency": fields.get("CURRENCY") or currency,
+        "description": fields.get("MEMO") or name,
+        "merchant": name,
+        "date": _parse_ofx_date(fields["DTPOSTED"]),
+    }
+
+
+def _iter_ofx_rows(text_stream, on_skip):
+    for fields, currency in iter_ofx_transactions(text_stream):
+        try:
+            yield _ofx_to_transaction(fields, currency)
+        except (KeyError, ValueError, AttributeError) as e:
+            on_skip(e)
+
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def _text(element, *paths):
+    for path in paths:
+        found = element.find(path)
+        if found is not None and found.text and found.text.strip():
+            return found.text.strip()
+    return ""
+
+
+def _camt_entry_to_transaction(element, currency):
+    """Map a namespace-stripped camt.053 Ntry element to a transaction"""
+    amount_element = element.find("Amt")
+    is_expense = _text(element, "CdtDbtInd") == "DBIT"
+    party = "Cdtr" if is_expense else "Dbtr"
+    details = " ".join(
+        (ustrd.text or "").strip()
+        for ustrd in element.iterfind("NtryDtls/TxDtls/RmtInf/Ustrd")
+    )
+    return {
+        "reference": _text(
+            element,
+            "AcctSvcrRef",
+            "NtryRef",
+            "NtryDtls/TxDtls/Refs/AcctSvcrRef",
+            "NtryDtls/TxDtls/Refs/EndToEndId",
+        ),
+        "amount": abs(parse_amount(amount_element.text)),
+        "is_expense": is_expense,
+        "currency": amount_element.get("Ccy") or currency,
+        "description": details or _text(element, "AddtlNtryInf"),
+        "merchant": _text(
+            element,
+            f"NtryDtls/TxDtls/RltdPties/{party}/Nm",
+            f"NtryDtls/TxDtls/RltdPties/{party}/Pty/Nm",
+        ),
+        "date": parse_date(
+            _text(element, "BookgDt/DtTm", "BookgDt/Dt", "ValDt/DtTm", "ValDt/Dt")
+        ),
+    }
+
+
+def iter_camt_transactions(binary_stream, on_skip):
+    """
+    Yield transactions from an ISO 20022 camt.053 statement
+
+    Entries (Ntry) are parsed as they complete and removed from the tree,
+    so memory does not grow with the statement length.
+
+    Args:
+        binary_stream (file): The XML file
+        on_skip (callable): Called with the error for each unreadable entry
+    """
+    statement = None
+    currency = None
+    for event, element in ET.iterparse(binary_stream, events=("start", "end")):
+        name = _local_name(element.tag)
+        if event == "start":
+            if name == "Stmt":
+                statement = element
+            continue
+
+        if name == "Ccy" and currency is None:
+            currency = (element.text or "").strip() or None
+        if name != "Ntry":
+            continue
+
+        for child in element.iter():
+            child.tag = _local_name(child.tag)
+
+        try:
+            transaction = _camt_entry_to_transaction(element, currency)
+        except (ValueError, AttributeError, TypeError) as e:
+            on_skip(e)
+        else:
+            yield transaction
+
+        if statement is not None:
+            statement.remove(element)
+        else:
+            element.clear()
+
+
+def _external_id(account_id, reference):
+    """
+    External id for an imported row that carries the bank's reference
+
+    Rows without a reference get no external id and are deduplicated by
+    their content fingerprint when ingested.
+    """
+    if not reference:
+        return None
+    external_id = f"import:{account_id}:{reference}"
+    if len(external_id) > 100:
+        digest = hashlib.sha1(reference.encode("utf-8")).hexdigest()
+        external_id = f"import:{account_id}:{digest}"
+    return external_id
+
+
+def iter_statement_transactions(account, stream, filename=None, stats=None):
+    """
+    Parse an uploaded statement into transaction dictionaries
+
+    Rows that cannot be parsed are skipped and counted in stats['skipped'].
+
+    Args:
+        account (BankAccount): Account the statement belongs to
+        stream (file): Binary file object
+        filename (str): Original file name, used to guess the format
+        stats (dict): Receives 'rows' and 'skipped' counts
+
+    Yields:
+        dict: Transactions as consumed by ingest_transactions
+    """
+    stats = stats if stats is not None else {}
+    stats.setdefault("rows", 0)
+    stats.setdefault("skipped", 0)
+
+    head = stream.read(SNIFF_BYTES)
+    statement_format = detect_format(filename, head)
+    binary = io.BufferedReader(_PrefixedStream(head, stream), READ_CHUNK_SIZE)
+
+    def on_skip(error):
+        stats["skipped"] += 1
+        logger.warning(f"Skipping statement row: {str(error)}")
+
+    if statement_format == "camt":
+        rows = iter_camt_transactions(binary, on_skip)
+    else:
+        encoding = _detect_encoding(head)
+        text = io.TextIOWrapper(binary, encoding=encoding, newline="")
+        if statement_format == "ofx":
+            rows = _iter_ofx_rows(text, on_skip)
+        else:
+            sample = head.decode(encoding, errors="ignore")
+            rows = iter_csv_transactions(text, sample, on_skip)
+
+    try:
+        for transaction in rows:
+            stats["rows"] += 1
+            transaction["external_id"] = _external_id(
+                account.id, transaction.pop("reference", "")
+            )
+            transaction["currency"] = (
+                transaction["currency"] or account.currency or "RUB"
+            )[:3]
+            transaction["description"] = transaction["description"][:255]
+            transaction["merchant"] = transaction["merchant"][:100]
+            yield transaction
+    except ET.ParseError as e:
+        raise StatementFormatError(f"Malformed XML: {str(e)}") from e
+    except UnicodeDecodeError as e:
+        raise StatementFormatError(f"Unsupported file encoding: {str(e)}") from e
+
+
+def import_statement(account, stream, filename=None, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Import a CSV, OFX or camt.053 statement into an account
+
+    The file is parsed as a stream and loaded in batches, so memory use
+    does not depend on the statement size. Transactions already imported
+    are skipped. The caller commits.
+
+    Args:
+        account (BankAccount): Account to import into
+        stream (file): Binary file object
+        filename (str): Original file name
+        batch_size (int): Rows categorized and loaded at once
+
+    Returns:
+        dict: 'rows' parsed, 'imported' new transactions, 'skipped' bad rows
+    """
+    stats = {}
+    transactions = iter_statement_transactions(account, stream, filename, stats)
+    batches = iter(lambda: list(islice(transactions, batch_size)), [])
+    stats["imported"] = ingest_transaction_batches(
+        account.id, batches, user_id=account.user_id
+    )
+    logger.info(
+        f"Imported {stats['imported']} of {stats['rows']} statement rows "
+        f"into account {account.id}"
+    )
+    return stats
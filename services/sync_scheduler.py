@@ -0,0 +1,332 @@
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from sqlalchemy import and_, exists, func, insert, or_
+from app import db
+from models import BankAccount, SyncJob
+from services.bank_tokens import token_manager as default_token_manager
+from services.partitions import maintain_partitions
+from services.job_queue import ACTIVE_STATUSES
+from services.transaction_archive import ARCHIVE_AFTER_MONTHS, users_to_archive
+
+logger = logging.getLogger(__name__)
+
+# Accounts not synced for this long are due for a sync
+SYNC_INTERVAL_MINUTES = int(os.environ.get("SYNC_INTERVAL_MINUTES", 60))
+# Scheduled jobs start at a random point within this many seconds
+SYNC_JITTER_SECONDS = float(os.environ.get("SYNC_JITTER_SECONDS", 30))
+# Default per-bank limit; BANK_SYNC_RATES overrides it, e.g. "tinkoff=300,sber=60"
+DEFAULT_SYNC_RATE_PER_MINUTE = float(os.environ.get("BANK_SYNC_RATE_PER_MINUTE", 120))
+SYNC_BURST = int(os.environ.get("BANK_SYNC_BURST", 10))
+SCHEDULER_TICK_SECONDS = 1.0
+# Most bank tokens renewed per tick
+TOKEN_REFRESH_BATCH = 20
+METRICS_PORT = int(os.environ.get("SCHEDULER_METRICS_PORT", 9102))
+# Seconds between transaction partition maintenance runs
+PARTITION_MAINTENANCE_SECONDS = 3600
+# Seconds between queueing transaction archive jobs
+ARCHIVE_SECONDS = 86400
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter
+
+    Tokens refill continuously at 'rate' per second up to 'capacity'; each
+    dispatched sync takes one. The clock is injectable for tests.
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = float(capacity)
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self):
+        """Whole tokens that can be taken right now"""
+        self._refill()
+        return int(self.tokens)
+
+    def take(self, count=1):
+        """Take up to count tokens, returning how many were taken"""
+        self._refill()
+        taken = min(count, int(self.tokens))
+        self.tokens -= taken
+        return taken
+
+
+def parse_bank_rates(value):
+    """Parse 'bank=rate_per_minute,...' into a dict"""
+    rates = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            bank_name, rate = item.split("=", 1)
+            rates[bank_name.strip().lower()] = float(rate)
+    return rates
+
+
+class SchedulerMetrics:
+    """Counters and gauges exported in the Prometheus text format"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.dispatched = {}
+        self.gauges = {}
+
+    def record_dispatch(self, bank_name, count):
+        with self.lock:
+            self.dispatched[bank_name] = self.dispatched.get(bank_name, 0) + count
+
+    def set_gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def render(self):
+        with self.lock:
+            lines = [
+                "# HELP finassistant_sync_jobs_dispatched_total Sync jobs queued by the scheduler",
+                "# TYPE finassistant_sync_jobs_dispatched_total counter",
+            ]
+            for bank_name, count in sorted(self.dispatched.items()):
+                lines.append(
+                    f'finassistant_sync_jobs_dispatched_total{{bank="{bank_name}"}} {count}'
+                )
+            for name, value in sorted(self.gauges.items()):
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class SyncScheduler:
+    """
+    Queues syncs for stale accounts, oldest last_sync first
+
+    Each tick asks every bank's bucket how many syncs it may start and
+    selects at most that many due accounts, so the work per tick is bounded
+    by the rate limits rather than by the number of accounts.
+    """
+
+    def __init__(
+        self,
+        interval_minutes=SYNC_INTERVAL_MINUTES,
+        jitter_seconds=SYNC_JITTER_SECONDS,
+        default_rate_per_minute=DEFAULT_SYNC_RATE_PER_MINUTE,
+        bank_rates=None,
+        burst=SYNC_BURST,
+        clock=time.monotonic,
+        token_manager=None,
+    ):
+        self.interval = timedelta(minutes=interval_minutes)
+        self.jitter_seconds = jitter_seconds
+        self.default_rate_per_minute = default_rate_per_minute
+        if bank_rates is None:
+            bank_rates = parse_bank_rates(os.environ.get("BANK_SYNC_RATES"))
+        self.bank_rates = bank_rates
+        self.burst = burst
+        self.clock = clock
+        self.buckets = {}
+        self.metrics = SchedulerMetrics()
+        self.token_manager = token_manager or default_token_manager
+
+    def get_bucket(self, bank_name):
+        key = bank_name.lower()
+        if key not in self.buckets:
+            rate = self.bank_rates.get(key, self.default_rate_per_minute) / 60.0
+            self.buckets[key] = TokenBucket(rate, self.burst, self.clock)
+        return self.buckets[key]
+
+    def due_accounts(self, bank_name, limit, now):
+        """
+        Accounts of a bank that need a sync, most stale first
+
+        Accounts with a queued or running job, or whose last job failed
+        within the sync interval, are skipped.
+        """
+        cutoff = now - self.interval
+        busy = exists().where(
+            SyncJob.account_id == BankAccount.id,
+            or_(
+                SyncJob.status.in_(("queued", "running")),
+                and_(SyncJob.status == "failed", SyncJob.finished_at > cutoff),
+            ),
+        )
+        return (
+            db.session.query(BankAccount.id, BankAccount.user_id)
+            .filter(
+                BankAccount.bank_name == bank_name,
+                or_(BankAccount.last_sync.is_(None), BankAccount.last_sync < cutoff),
+                ~busy,
+            )
+            .order_by(BankAccount.last_sync.asc().nullsfirst())
+            .limit(limit)
+            .all()
+        )
+
+    def tick(self):
+        """
+        Queue syncs for every bank as far as its rate limit allows
+
+        Returns:
+            int: Number of jobs queued
+        """
+        now = datetime.utcnow()
+        banks = [row[0] for row in db.session.query(BankAccount.bank_name).distinct()]
+
+        queued = 0
+        for bank_name in banks:
+            bucket = self.get_bucket(bank_name)
+            available = bucket.available()
+            if not available:
+                continue
+
+            accounts = self.due_accounts(bank_name, available, now)
+            if not accounts:
+                continue
+
+            rows = [
+                {
+                    "user_id": user_id,
+                    "kind": "sync",
+                    "bank_name": bank_name,
+                    "account_id": account_id,
+                    "status": "queued",
+                    "progress": 0,
+                    "transaction_count": 0,
+                    "attempts": 0,
+                    "created_at": now,
+                    "run_after": now
+                    + timedelta(seconds=random.uniform(0, self.jitter_seconds)),
+                }
+                for account_id, user_id in accounts
+            ]
+            db.session.execute(insert(SyncJob), rows)
+            bucket.take(len(rows))
+            self.metrics.record_dispatch(bank_name, len(rows))
+            queued += len(rows)
+
+        db.session.commit()
+        return queued
+
+    def queue_archive_jobs(self):
+        """
+        Queue an archive job for every user with transactions to archive
+
+        The worker runs them like syncs. Users whose archive job is still
+        queued or running are skipped.
+
+        Returns:
+            int: Number of jobs queued
+        """
+        now = datetime.utcnow()
+        busy = {
+            row[0]
+            for row in db.session.query(SyncJob.user_id).filter(
+                SyncJob.kind == "archive", SyncJob.status.in_(ACTIVE_STATUSES)
+            )
+        }
+        rows = [
+            {
+                "user_id": user_id,
+                "kind": "archive",
+                "bank_name": "",
+                "status": "queued",
+                "progress": 0,
+                "transaction_count": 0,
+                "attempts": 0,
+                "created_at": now,
+                "run_after": now,
+            }
+            for user_id in users_to_archive(ARCHIVE_AFTER_MONTHS)
+            if user_id not in busy
+        ]
+        if rows:
+            db.session.execute(insert(SyncJob), rows)
+        db.session.commit()
+        return len(rows)
+
+    def update_gauges(self):
+        """Refresh queue depth and lag gauges from the database"""
+        now = datetime.utcnow()
+        depth, oldest_job = (
+            db.session.query(func.count(SyncJob.id), func.min(SyncJob.created_at))
+            .filter(SyncJob.status == "queued")
+            .one()
+        )
+        oldest_sync = db.session.query(func.min(BankAccount.last_sync)).scalar()
+        db.session.rollback()
+
+        self.metrics.set_gauge("finassistant_sync_queue_depth", depth)
+        self.metrics.set_gauge(
+            "finassistant_sync_queue_lag_seconds",
+            (now - oldest_job).total_seconds() if oldest_job else 0,
+        )
+        self.metrics.set_gauge(
+            "finassistant_sync_oldest_account_age_seconds",
+            (now - oldest_sync).total_seconds() if oldest_sync else 0,
+        )
+
+    def run(self, tick_seconds=SCHEDULER_TICK_SECONDS):
+        """Queue syncs until interrupted"""
+        logger.info("Sync scheduler started")
+        maintained_at = None
+        archived_at = None
+        while True:
+            started = time.monotonic()
+            try:
+                self.tick()
+                # Renew expiring tokens here so sync jobs never wait on it
+                self.token_manager.refresh_expiring(limit=TOKEN_REFRESH_BATCH)
+                self.update_gauges()
+                if (
+                    maintained_at is None
+                    or started - maintained_at >= PARTITION_MAINTENANCE_SECONDS
+                ):
+                    # Rows of a month without a partition go to the default
+                    # one, so a failed run can wait for the next
+                    maintained_at = started
+                    maintain_partitions()
+                if ARCHIVE_AFTER_MONTHS and (
+                    archived_at is None or started - archived_at >= ARCHIVE_SECONDS
+                ):
+                    archived_at = started
+                    self.queue_archive_jobs()
+            except Exception as e:
+                logger.error(f"Sync scheduler tick failed: {str(e)}", exc_info=True)
+                db.session.rollback()
+            elapsed = time.monotonic() - started
+            self.metrics.set_gauge("finassistant_sync_scheduler_tick_seconds", elapsed)
+            time.sleep(max(0.0, tick_seconds - elapsed))
+
+
+def start_metrics_server(metrics, port=METRICS_PORT):
+    """Serve metrics.render() at /metrics from a daemon thread"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Scheduler metrics on port {port}")
+    return server
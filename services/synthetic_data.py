@@ -0,0 +1,400 @@
+import logging
+import os
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from app import db
+from models import BankAccount, Category, User
+from services.transaction_analyzer import INCOME_CATEGORY, OTHER_CATEGORY
+from services.transaction_ingest import insert_transaction_rows
+
+logger = logging.getLogger(__name__)
+
+# Named dataset sizes, so every benchmark can run on the same data
+DATASET_SIZES = {"1k": 1_000, "100k": 100_000, "10m": 10_000_000}
+
+DEFAULT_SEED = 42
+DEFAULT_START = datetime(2024, 1, 1)
+
+# Rows drawn from one RNG stream. Each chunk is seeded with (seed, chunk
+# index), so the data only depends on the seed and the dataset parameters.
+GENERATOR_CHUNK_ROWS = 100_000
+
+SYNTHETIC_BANK_NAME = "synthetic"
+
+# Share of rows that are income
+INCOME_SHARE = 0.08
+
+# merchant, category, description verb, median amount, log-normal sigma, weight
+MERCHANTS = [
+    ("Пятёрочка", "Продукты", "Покупка", 650, 0.6, 14),
+    ("Магнит", "Продукты", "Покупка", 600, 0.6, 12),
+    ("Перекрёсток", "Продукты", "Покупка", 1100, 0.6, 8),
+    ("Лента", "Продукты", "Покупка", 1900, 0.5, 4),
+    ("Ашан", "Продукты", "Покупка", 2300, 0.5, 3),
+    ("Dodo Пицца", "Рестораны", "Оплата", 900, 0.4, 4),
+    ("Starbucks", "Рестораны", "Оплата", 420, 0.3, 5),
+    ("KFC", "Рестораны", "Оплата", 550, 0.3, 4),
+    ("Кафе Шоколадница", "Рестораны", "Оплата", 1200, 0.4, 2),
+    ("Яндекс.Такси", "Транспорт", "Оплата", 450, 0.5, 9),
+    ("Метро", "Транспорт", "Оплата", 65, 0.1, 8),
+    ("Wildberries", "Шоппинг", "Покупка", 1800, 0.8, 7),
+    ("OZON", "Шоппинг", "Покупка", 2100, 0.8, 6),
+    ("Спортмастер", "Шоппинг", "Покупка", 3500, 0.6, 1),
+    ("Кино Каро", "Развлечения", "Оплата", 700, 0.3, 1),
+    ("Okko", "Развлечения", "Подписка", 399, 0.05, 1),
+    ("Аптека 36.6", "Здоровье", "Оплата", 850, 0.7, 3),
+    ("Клиника Медси", "Здоровье", "Оплата", 3500, 0.5, 1),
+    ("МТС", "Связь", "Платеж", 650, 0.2, 1),
+    ("Билайн", "Связь", "Платеж", 600, 0.2, 1),
+    ("ЖКХ Мосэнергосбыт", "Жильё", "Платеж", 6500, 0.3, 1),
+    ("DNS", "Техника", "Оплата", 7500, 1.0, 1),
+    ("М.Видео", "Техника", "Оплата", 9000, 1.0, 1),
+    ("АЗС Лукойл", "Топливо", "Оплата", 2600, 0.3, 4),
+    ("АЗС Газпром", "Топливо", "Оплата", 2500, 0.3, 3),
+    ("ИП Смирнов", OTHER_CATEGORY, "Перевод", 1500, 1.0, 2),
+]
+
+# description, median amount, log-normal sigma, weight
+INCOME_SOURCES = [
+    ("Зачисление зарплаты", 75_000, 0.4, 6),
+    ("Перевод от клиента", 6_000, 0.9, 3),
+    ("Зачисление средств", 12_000, 0.7, 2),
+]
+SALARY_DAYS = (5, 20)
+
+# Spending by month (January first; December peak) and weekday (Monday first)
+MONTH_FACTORS = [0.8, 0.85, 0.95, 1.0, 1.05, 1.0, 1.05, 1.05, 1.0, 1.0, 1.1, 1.45]
+WEEKDAY_FACTORS = [0.9, 0.9, 0.95, 1.0, 1.2, 1.35, 1.1]
+HOUR_WEIGHTS = [
+    1, 0.5, 0.3, 0.2, 0.2, 0.4, 1, 3, 5, 5, 5, 6,
+    8, 8, 6, 5, 5, 7, 9, 9, 7, 5, 3, 2,
+]  # fmt: skip
+
+
+def parse_dataset_size(value):
+    """
+    Turn a dataset size into a row count
+
+    Args:
+        value (str or int): A name from DATASET_SIZES or a number of rows
+
+    Returns:
+        int: Number of rows
+    """
+    text = str(value).strip().lower()
+    if text in DATASET_SIZES:
+        return DATASET_SIZES[text]
+    try:
+        rows = int(text.replace("_", ""))
+    except ValueError:
+        raise ValueError(
+            f"Unknown dataset size {value!r}, use a row count or one of "
+            f"{', '.join(DATASET_SIZES)}"
+        )
+    if rows < 0:
+        raise ValueError("Dataset size must not be negative")
+    return rows
+
+
+def _weights(values):
+    weights = np.asarray(values, dtype=np.float64)
+    return weights / weights.sum()
+
+
+def _day_weights(start, days):
+    """Relative spending per day: seasonal, weekly and payday patterns"""
+    dates = pd.date_range(start, periods=days, freq="D")
+    weights = np.take(MONTH_FACTORS, dates.month - 1) * np.take(
+        WEEKDAY_FACTORS, dates.weekday
+    )
+    weights *= np.where(np.isin(dates.day, SALARY_DAYS), 1.3, 1.0)
+    return weights / weights.sum(), np.flatnonzero(np.isin(dates.day, SALARY_DAYS))
+
+
+def generate_transactions(
+    rows,
+    seed=DEFAULT_SEED,
+    users=100,
+    accounts_per_user=2,
+    start=DEFAULT_START,
+    days=365,
+):
+    """
+    Generate realistic transactions as a stream of DataFrames
+
+    Everything is drawn with NumPy in chunks of GENERATOR_CHUNK_ROWS, so
+    millions of rows take seconds and little memory. Amounts are log-normal
+    per merchant, dates follow month, weekday and hour-of-day patterns,
+    salaries land on SALARY_DAYS and some accounts are much busier than
+    others. The same arguments always give the same data.
+
+    Args:
+        rows (int): Number of transactions
+        seed (int): Random seed
+        users (int): Number of users
+        accounts_per_user (int): Accounts per user
+        start (datetime): First day of the history
+        days (int): Length of the history in days
+
+    Yields:
+        pandas.DataFrame: Up to GENERATOR_CHUNK_ROWS transactions with the
+            columns user, account (0-based indexes), external_id,
+            transaction_date, amount, currency, description, merchant,
+            category and is_expense
+    """
+    accounts = users * accounts_per_user
+    if rows and accounts < 1:
+        raise ValueError("Need at least one user and one account per user")
+
+    # Account activity is heavy-tailed: a few accounts have most transactions
+    account_weights = _weights(
+        np.random.default_rng([seed, 0xACC]).gamma(0.8, size=accounts)
+    )
+    day_weights, salary_days = _day_weights(start, days)
+    if not len(salary_days):
+        salary_days = np.arange(days)
+    hour_weights = _weights(HOUR_WEIGHTS)
+    merchant_weights = _weights([m[5] for m in MERCHANTS])
+    income_weights = _weights([s[3] for s in INCOME_SOURCES])
+
+    merchant_names = np.array([m[0] for m in MERCHANTS], dtype=object)
+    merchant_categories = np.array([m[1] for m in MERCHANTS], dtype=object)
+    merchant_descriptions = np.array(
+        [f"{m[2]} {m[0]}" for m in MERCHANTS], dtype=object
+    )
+    merchant_medians = np.array([m[3] for m in MERCHANTS], dtype=np.float64)
+    merchant_sigmas = np.array([m[4] for m in MERCHANTS], dtype=np.float64)
+    income_descriptions = np.array([s[0] for s in INCOME_SOURCES], dtype=object)
+    income_medians = np.array([s[1] for s in INCOME_SOURCES], dtype=np.float64)
+    income_sigmas = np.array([s[2] for s in INCOME_SOURCES], dtype=np.float64)
+    origin = np.datetime64(start.replace(hour=0, minute=0, second=0), "s")
+
+    for chunk_index, first_row in enumerate(range(0, rows, GENERATOR_CHUNK_ROWS)):
+        size = min(GENERATOR_CHUNK_ROWS, rows - first_row)
+        rng = np.random.default_rng([seed, chunk_index])
+
+        account = rng.choice(accounts, size=size, p=account_weights)
+        is_income = rng.random(size) < INCOME_SHARE
+        merchant = rng.choice(len(MERCHANTS), size=size, p=merchant_weights)
+        source = rng.choice(len(INCOME_SOURCES), size=size, p=income_weights)
+
+        day = rng.choice(days, size=size, p=day_weights)
+        is_salary = is_income & (source == 0)
+        day[is_salary] = rng.choice(salary_days, size=int(is_salary.sum()))
+        seconds = rng.choice(24, size=size, p=hour_weights) * 3600 + rng.integers(
+            0, 3600, size=size
+        )
+
+        median = np.where(is_income, income_medians[source], merchant_medians[merchant])
+        sigma = np.where(is_income, income_sigmas[source], merchant_sigmas[merchant])
+        amount = np.round(median * np.exp(sigma * rng.standard_normal(size)), 2)
+        amount = np.maximum(amount, 1.0)
+
+        row = np.arange(first_row, first_row + size)
+        yield pd.DataFrame(
+            {
+                "user": account // accounts_per_user,
+                "account": account,
+                "external_id": pd.Series(row).map(f"synthetic:{seed}:{{}}".format),
+                "transaction_date": origin
+                + day.astype("timedelta64[D]")
+                + seconds.astype("timedelta64[s]"),
+                "amount": amount,
+                "currency": "RUB",
+                "description": np.where(
+                    is_income,
+                    income_descriptions[source],
+                    merchant_descriptions[merchant],
+                ),
+                "merchant": np.where(is_income, "", merchant_names[merchant]),
+                "category": np.where(
+                    is_income, INCOME_CATEGORY, merchant_categories[merchant]
+                ),
+                "is_expense": ~is_income,
+            }
+        )
+
+
+def write_csv(chunks, path):
+    """
+    Write generated chunks to one CSV file
+
+    Returns:
+        int: Number of rows written
+    """
+    total = 0
+    for index, chunk in enumerate(chunks):
+        chunk.to_csv(
+            path, mode="w" if index == 0 else "a", header=index == 0, index=False
+        )
+        total += len(chunk)
+    return total
+
+
+def write_parquet(chunks, path):
+    """
+    Write generated chunks to one Parquet file, one row group per chunk
+
+    Needs pyarrow, which is only required for this export.
+
+    Returns:
+        int: Number of rows written
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Writing Parquet needs pyarrow: pip install pyarrow")
+
+    total = 0
+    writer = None
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+            total += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return total
+
+
+def _ensure_accounts(seed, users, accounts_per_user):
+    """
+    Create (or find) the synthetic users and accounts of a dataset
+
+    Returns:
+        tuple: Arrays of account ids and their owners' user ids, indexed by
+            the generator's account number
+    """
+    prefix = f"synthetic-{seed}-"
+    existing_users = {
+        user.username: user.id
+        for user in User.query.filter(User.username.startswith(prefix))
+    }
+    new_users = [
+        User(
+            username=f"{prefix}{index}",
+            email=f"{prefix}{index}@example.com",
+            password_hash="-",
+        )
+        for index in range(users)
+        if f"{prefix}{index}" not in existing_users
+    ]
+    db.session.add_all(new_users)
+    db.session.flush()
+    existing_users.update((user.username, user.id) for user in new_users)
+    user_ids = [existing_users[f"{prefix}{index}"] for index in range(users)]
+
+    existing_accounts = dict(
+        db.session.execute(
+            select(BankAccount.account_number, BankAccount.id).where(
+                BankAccount.bank_name == SYNTHETIC_BANK_NAME,
+                BankAccount.account_number.startswith(prefix),
+            )
+        ).all()
+    )
+    new_accounts = []
+    for index in range(users * accounts_per_user):
+        number = f"{prefix}{index:08d}"
+        if number not in existing_accounts:
+            new_accounts.append(
+                BankAccount(
+                    user_id=user_ids[index // accounts_per_user],
+                    bank_name=SYNTHETIC_BANK_NAME,
+                    account_number=number,
+                    account_type="Дебетовая карта",
+                    currency="RUB",
+                )
+            )
+    db.session.add_all(new_accounts)
+    db.session.flush()
+    existing_accounts.update((a.account_number, a.id) for a in new_accounts)
+    account_ids = np.array(
+        [
+            existing_accounts[f"{prefix}{index:08d}"]
+            for index in range(users * accounts_per_user)
+        ]
+    )
+    return account_ids, np.repeat(user_ids, accounts_per_user)
+
+
+def load_into_database(chunks, seed=DEFAULT_SEED, users=100, accounts_per_user=2):
+    """
+    Insert generated chunks into the database
+
+    Creates the dataset's users and accounts (bank 'synthetic'), then bulk
+    inserts the transactions with their generated categories and rolls them
+    up, committing after each chunk. Loading the same dataset again inserts nothing.
+
+    Args:
+        chunks (iterable): DataFrames from generate_transactions
+        seed (int): Seed the chunks were generated with
+        users (int): Users the chunks were generated for
+        accounts_per_user (int): Accounts per user the chunks were generated for
+
+    Returns:
+        int: Number of rows processed
+    """
+    account_ids, account_user_ids = _ensure_accounts(seed, users, accounts_per_user)
+    category_ids = {
+        name: category_id
+        for category_id, name in db.session.execute(
+            select(Category.id, Category.name)
+        ).all()
+    }
+    db.session.commit()
+
+    total = 0
+    for chunk in chunks:
+        frame = pd.DataFrame(
+            {
+                "account_id": account_ids[chunk["account"].to_numpy()],
+                "user_id": account_user_ids[chunk["account"].to_numpy()],
+                "external_id": chunk["external_id"],
+                "amount": chunk["amount"],
+                "currency": chunk["currency"],
+                "description": chunk["description"],
+                "transaction_date": chunk["transaction_date"].dt.to_pydatetime(),
+                "merchant": chunk["merchant"],
+                "category_id": chunk["category"].map(category_ids),
+                "is_expense": chunk["is_expense"],
+            }
+        )
+        if frame["category_id"].isna().any():
+            raise RuntimeError("Categories are missing, run init_categories first")
+        records = frame.astype(
+            {"account_id": int, "user_id": int, "category_id": int}
+        ).to_dict("records")
+        insert_transaction_rows(records)
+        db.session.commit()
+        total += len(records)
+        logger.debug(f"Loaded {total} synthetic transactions")
+    return total
+
+
+def export_transactions(chunks, output, **dataset):
+    """
+    Send generated chunks to the database or a file
+
+    Args:
+        chunks (iterable): DataFrames from generate_transactions
+        output (str): 'db', or a path ending in .csv or .parquet
+        **dataset: seed, users and accounts_per_user, for loading into the
+            database
+
+    Returns:
+        int: Number of rows written
+    """
+    if output == "db":
+        return load_into_database(chunks, **dataset)
+    extension = os.path.splitext(output)[1].lower()
+    if extension == ".csv":
+        return write_csv(chunks, output)
+    if extension == ".parquet":
+        return write_parquet(chunks, output)
+    raise ValueError(f"Unsupported output {output!r}: use db, *.csv or *.parquet")
@@ -2,13 +2,23 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import logging
+import re
+import threading
 from app import db
-from models import Category
+from models import Category, Transaction
+from services.category_model import get_category_model, get_min_confidence
+from services.category_registry import get_category_ids, get_category_names
+from services.merchant_overrides import (
+    get_merchant_override,
+    get_user_overrides,
+    normalize_merchant,
+)
+from services.spending_rollup import expense_days, spending_charts, spending_summary
 
 logger = logging.getLogger(__name__)
 
-# Category mapping - for demo purposes
-# In a real app, this would be replaced with a proper ML model
+# Category mapping - used directly, and as the fallback when the optional
+# category model (services/category_model.py) is missing or not confident
 CATEGORY_KEYWORDS = {
     "Продукты": [
         "пятёрочка",
@@ -74,6 +84,11 @@ CATEGORY_KEYWORDS = {
     "Топливо": ["азс", "газпром", "лукойл", "роснефть", "бензин"],
 }
 
+# Keywords that mark a transaction as income; checked before CATEGORY_KEYWORDS
+INCOME_KEYWORDS = ["зачисление", "перевод от"]
+INCOME_CATEGORY = "Доход"
+OTHER_CATEGORY = "Другое"
+
 
 def init_categories():
     """Initialize categories in the database if they don't exist"""
@@ -91,8 +106,8 @@ def init_categories():
             default_categories[category_name] = icon
 
         # Add special categories
-        default_categories["Другое"] = "question-circle"
-        default_categories["Доход"] = "arrow-down"
+        default_categories[OTHER_CATEGORY] = "question-circle"
+        default_categories[INCOME_CATEGORY] = "arrow-down"
 
         if category_count == 0:
             # Create all categories if none exist
@@ -149,49 +164,192 @@ def get_category_icon(category_name):
     return category_icons.get(category_name, "tag")
 
 
-def categorize_transaction(description, merchant):
+def normalize_text(text):
+    """Lowercase text and fold "ё" into "е" so spelling variants match"""
+    return text.lower().replace("ё", "е")
+
+
+class KeywordCategorizer:
+    """
+    Keyword matcher compiled once per process.
+
+    All keywords are folded into a single alternation regex (longest keywords
+    first), so a description is scanned once instead of once per keyword.
+    When several categories match, the one listed first wins, with income
+    keywords taking precedence over CATEGORY_KEYWORDS. Category ids come from
+    the in-memory category registry.
+    """
+
+    def __init__(self, category_keywords, income_keywords=INCOME_KEYWORDS):
+        ordered = [(INCOME_CATEGORY, income_keywords)] + list(category_keywords.items())
+
+        self._keyword_category = {}
+        self._priority = {}
+        for priority, (category_name, keywords) in enumerate(ordered):
+            self._priority.setdefault(category_name, priority)
+            for keyword in keywords:
+                self._keyword_category.setdefault(
+                    normalize_text(keyword), category_name
+                )
+
+        alternation = "|".join(
+            re.escape(keyword)
+            for keyword in sorted(self._keyword_category, key=len, reverse=True)
+        )
+        self._pattern = re.compile(alternation)
+
+    def match(self, text):
+        """
+        Find the category name for a piece of text
+
+        Args:
+            text (str): Text to scan (description and merchant)
+
+        Returns:
+            str: Category name, or None if no keyword matches
+        """
+        best_name = None
+        best_priority = None
+        for keyword in self._pattern.findall(normalize_text(text)):
+            category_name = self._keyword_category[keyword]
+            priority = self._priority[category_name]
+            if best_priority is None or priority < best_priority:
+                best_name, best_priority = category_name, priority
+        return best_name
+
+    @property
+    def category_ids(self):
+        """Mapping of category name to id, served from the category registry"""
+        category_ids = get_category_ids()
+        if OTHER_CATEGORY not in category_ids:
+            # Fresh database: create the default categories first
+            init_categories()
+            category_ids = get_category_ids()
+        return category_ids
+
+
+_categorizer = None
+_categorizer_lock = threading.Lock()
+
+
+def get_categorizer():
+    """Return the process-wide KeywordCategorizer, building it on first use"""
+    global _categorizer
+    if _categorizer is None:
+        with _categorizer_lock:
+            if _categorizer is None:
+                _categorizer = KeywordCategorizer(CATEGORY_KEYWORDS)
+    return _categorizer
+
+
+def _category_ids_for_texts(texts):
+    """
+    Category IDs for combined description/merchant texts
+
+    Uses the category model where it is confident and keyword matching
+    everywhere else.
+
+    Args:
+        texts (sequence): "description merchant" strings
+
+    Returns:
+        numpy.ndarray: Category IDs (int64), -1 where nothing matched
+    """
+    categorizer = get_categorizer()
+    category_ids = categorizer.category_ids
+    fallback_id = category_ids.get(OTHER_CATEGORY, -1)
+
+    predicted = [None] * len(texts)
+    model = get_category_model()
+    if model is not None and len(texts):
+        names, confidences = model.predict([normalize_text(text) for text in texts])
+        min_confidence = get_min_confidence()
+        predicted = [
+            name if confidence >= min_confidence and name in category_ids else None
+            for name, confidence in zip(names, confidences)
+        ]
+
+    return np.fromiter(
+        (
+            category_ids.get(name or categorizer.match(text), fallback_id)
+            for name, text in zip(predicted, texts)
+        ),
+        dtype=np.int64,
+        count=len(texts),
+    )
+
+
+def categorize_transaction(description, merchant, user_id=None):
     """
     Categorize a transaction based on description and merchant
 
+    A category the user previously chose for the merchant takes precedence
+    over keyword matching.
+
     Args:
         description (str): Transaction description
         merchant (str): Merchant name
+        user_id (int): Owner of the transaction, enables merchant overrides
 
     Returns:
         int: Category ID
     """
     try:
-        # Initialize categories if they don't exist
-        init_categories()
-
-        # Get text to check (combine description and merchant)
-        text = f"{description} {merchant}".lower()
-
-        # Check if this is income
-        income_keywords = ["зачисление", "перевод от"]
-        if any(keyword in text for keyword in income_keywords):
-            income_category = Category.query.filter_by(name="Доход").first()
-            if income_category:
-                return income_category.id
-
-        # Match against category keywords
-        for category_name, keywords in CATEGORY_KEYWORDS.items():
-            if any(keyword.lower() in text for keyword in keywords):
-                category = Category.query.filter_by(name=category_name).first()
-                if category:
-                    return category.id
-
-        # If no match found, use "Other" category
-        other_category = Category.query.filter_by(name="Другое").first()
-        if other_category:
-            return other_category.id
+        if user_id is not None:
+            override_id = get_merchant_override(user_id, merchant)
+            if override_id is not None:
+                return override_id
 
-        return None
+        category_id = int(
+            _category_ids_for_texts([f"{description or ''} {merchant or ''}"])[0]
+        )
+        return category_id if category_id >= 0 else None
     except Exception as e:
         logger.error(f"Error categorizing transaction: {str(e)}")
         return None
 
 
+def categorize_many(rows, user_id=None):
+    """
+    Categorize a batch of transactions at once
+
+    Identical texts are matched only once, and no database queries are made
+    once the categorizer has loaded its category ids. User merchant overrides
+    cost at most one query per batch.
+
+    Args:
+        rows (iterable): (description, merchant) pairs
+        user_id (int): Owner of the transactions, enables merchant overrides
+
+    Returns:
+        numpy.ndarray: Category IDs (int64) in input order, -1 where no
+        category could be assigned
+    """
+    frame = pd.DataFrame(list(rows), columns=["description", "merchant"])
+    if frame.empty:
+        return np.empty(0, dtype=np.int64)
+
+    text = (
+        frame["description"].fillna("").astype(str)
+        + " "
+        + frame["merchant"].fillna("").astype(str)
+    )
+    codes, unique_texts = pd.factorize(text)
+
+    category_ids = _category_ids_for_texts(unique_texts)[codes]
+
+    if user_id is not None:
+        overrides = get_user_overrides(user_id)
+        if overrides:
+            override_ids = (
+                frame["merchant"].map(normalize_merchant).map(overrides).to_numpy()
+            )
+            has_override = ~pd.isna(override_ids)
+            category_ids[has_override] = override_ids[has_override].astype(np.int64)
+
+    return category_ids
+
+
 def analyze_transactions(transactions_df):
     """
     Analyze transactions to extract insights
@@ -211,7 +369,7 @@ def analyze_transactions(transactions_df):
             df["date"] = pd.to_datetime(df["date"])
 
         # Get categories
-        categories = {c.id: c.name for c in Category.query.all()}
+        categories = get_category_names()
 
         # Add category name to DataFrame
         df["category_name"] = df["category_id"].map(categories)
@@ -262,7 +420,7 @@ def analyze_transactions(transactions_df):
         top_categories = category_spending.head(5).to_dict("records")
 
         # Transactions by day of week
-        df["day_of_week"] = df["date"].dt.day_name()
+        expenses_df = expenses_df.assign(day_of_week=expenses_df["date"].dt.day_name())
         day_spending = expenses_df.groupby("day_of_week")["amount"].sum().reset_index()
 
         # Day of week order
@@ -342,3 +500,58 @@ def analyze_transactions(transactions_df):
             "daily_avg_spending": 0,
             "unusual_transactions": [],
         }
+
+
+def analyze_spending(user_id, today=None):
+    """
+    Analyze a user's spending from the monthly summary and daily rollup
+
+    Returns the same results as analyze_transactions without loading the
+    transaction history: totals, averages and the z-score threshold come
+    from summary rows, and only the last 30 days' expenses above that
+    threshold are read.
+
+    Args:
+        user_id (int): User ID
+        today (datetime): Reference time, now when None
+
+    Returns:
+        dict: Analysis results
+    """
+    today = today or datetime.now()
+    summary = spending_summary(user_id, today.date())
+    days = expense_days(user_id)
+
+    # Expenses more than two standard deviations above the mean
+    unusual_list = []
+    if summary["expense_std"] > 0:
+        threshold = summary["expense_mean"] + 2 * summary["expense_std"]
+        unusual = (
+            Transaction.query.filter_by(user_id=user_id)
+            .filter(Transaction.is_expense == True)
+            .filter(Transaction.transaction_date >= today - timedelta(days=30))
+            .filter(Transaction.amount > threshold)
+            .order_by(Transaction.amount.desc())
+            .limit(5)
+        )
+        unusual_list = [
+            {
+                "description": t.description,
+                "amount": t.amount,
+                "date": t.transaction_date,
+            }
+            for t in unusual
+        ]
+
+    results = {
+        "total_spent": float(summary["total_spent"]),
+        "total_income": float(summary["total_income"]),
+        "current_month_spent": float(summary["current_month_spent"]),
+        "prev_month_spent": float(summary["prev_month_spent"]),
+        "month_over_month_change": float(summary["month_over_month_change"]),
+        "avg_transaction_amount": float(summary["expense_mean"]),
+        "daily_avg_spending": float(summary["total_spent"] / days if days else 0),
+        "unusual_transactions": unusual_list,
+    }
+    results.update(spending_charts(user_id, today.date()))
+    return results
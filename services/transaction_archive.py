@@ -0,0 +1,547 @@
+import io
+import logging
+import os
+import re
+from datetime import datetime
+import pandas as pd
+from sqlalchemy import delete, extract, func, select, text
+from app import db
+from models import Transaction
+from services.partitions import add_months, detached_partitions, month_floor
+from services.spending_rollup import (
+    ROLLUP_SOURCE_COLUMNS,
+    apply_rollup_deltas,
+    rollup_deltas,
+)
+
+logger = logging.getLogger(__name__)
+
+# Transactions dated before the start of the month this many months ago
+# are moved to the archive; 0 turns archiving off
+ARCHIVE_AFTER_MONTHS = int(os.environ.get("TRANSACTION_ARCHIVE_AFTER_MONTHS", 0))
+ARCHIVE_DIR = os.environ.get("TRANSACTION_ARCHIVE_DIR", "instance/transaction_archive")
+# Rows deleted from the table per statement
+DELETE_CHUNK_SIZE = 500
+
+# Archive file columns and their Arrow types, in table order
+ARCHIVE_COLUMNS = [
+    ("id", "int64"),
+    ("account_id", "int64"),
+    ("user_id", "int64"),
+    ("external_id", "string"),
+    ("fingerprint", "string"),
+    ("amount", "float64"),
+    ("currency", "string"),
+    ("description", "string"),
+    ("transaction_date", "timestamp[us]"),
+    ("merchant", "string"),
+    ("category_id", "int64"),
+    ("is_expense", "bool"),
+    ("created_at", "timestamp[us]"),
+]
+# Columns of transaction_history, the input format of analyze_transactions
+HISTORY_COLUMNS = [
+    "id",
+    "account_id",
+    "date",
+    "amount",
+    "description",
+    "merchant",
+    "category_id",
+    "is_expense",
+]
+
+_ARCHIVE_KEY = re.compile(r"^transactions/user_id=(\d+)/year=(\d{4})\.parquet$")
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("The transaction archive needs pyarrow: pip install pyarrow")
+    return pa, pq
+
+
+def archive_available():
+    """Whether pyarrow is installed, so archive files can be read"""
+    try:
+        _pyarrow()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _schema(pa):
+    return pa.schema(
+        [(name, pa.type_for_alias(type_name)) for name, type_name in ARCHIVE_COLUMNS]
+    )
+
+
+class LocalArchiveStore:
+    """
+    Archive objects kept in a local directory
+
+    Keys are laid out like object-store keys
+    (transactions/user_id=42/year=2023.parquet), so a store backed by S3 or
+    another object store only has to provide the same three methods.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or ARCHIVE_DIR
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split("/"))
+
+    def keys(self, prefix=""):
+        """Keys starting with prefix, sorted"""
+        keys = []
+        for directory, _, files in os.walk(self.root):
+            relative = os.path.relpath(directory, self.root).replace(os.sep, "/")
+            for name in files:
+                key = name if relative == "." else f"{relative}/{name}"
+                if key.startswith(prefix) and not name.endswith(".tmp"):
+                    keys.append(key)
+        return sorted(keys)
+
+    def get(self, key):
+        """Object contents, or None when there is no such key"""
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, data):
+        """Store an object, replacing any previous one atomically"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(data)
+        os.replace(f"{path}.tmp", path)
+
+
+def archive_key(user_id, year):
+    """Key of the archive file holding a user's transactions of a year"""
+    return f"transactions/user_id={user_id}/year={year}.parquet"
+
+
+def archived_years(user_id, store=None):
+    """Years with archived transactions of a user, in order"""
+    store = store or LocalArchiveStore()
+    years = []
+    for key in store.keys(f"transactions/user_id={user_id}/"):
+        match = _ARCHIVE_KEY.match(key)
+        if match:
+            years.append(int(match.group(2)))
+    return years
+
+
+def archived_users(store=None):
+    """Ids of the users with archived transactions"""
+    store = store or LocalArchiveStore()
+    matches = (_ARCHIVE_KEY.match(key) for key in store.keys("transactions/"))
+    return sorted({int(match.group(1)) for match in matches if match})
+
+
+def _read_year(store, user_id, year, columns=None):
+    pa, pq = _pyarrow()
+    data = store.get(archive_key(user_id, year))
+    if data is None:
+        return None
+    return pq.read_table(pa.BufferReader(data), columns=columns)
+
+
+def _write_year(store, user_id, year, rows):
+    """Add rows to a year's archive file; rows archived before are replaced"""
+    pa, pq = _pyarrow()
+    schema = _schema(pa)
+    table = pa.Table.from_pylist(
+        [{name: row[name] for name, _ in ARCHIVE_COLUMNS} for row in rows],
+        schema=schema,
+    )
+    existing = _read_year(store, user_id, year)
+    if existing is not None:
+        frame = pa.concat_tables([existing.cast(schema), table]).to_pandas()
+        frame = frame.drop_duplicates("id", keep="last")
+        frame = frame.sort_values(["transaction_date", "id"])
+        table = pa.Table.from_pandas(frame, schema=schema, preserve_index=False)
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression="zstd")
+    store.put(archive_key(user_id, year), buffer.getvalue())
+
+
+def archive_cutoff(months=ARCHIVE_AFTER_MONTHS, today=None):
+    """First moment that is not archived: the month start `months` ago"""
+    month = add_months(month_floor(today or datetime.utcnow()), -months)
+    return datetime.combine(month, datetime.min.time())
+
+
+def _archive_rows(store, rows):
+    """Write rows to their user and year archive files"""
+    groups = {}
+    for row in rows:
+        key = (row["user_id"], row["transaction_date"].year)
+        groups.setdefault(key, []).append(row)
+    for (user_id, year), group in groups.items():
+        _write_year(store, user_id, year, group)
+
+
+def _archive_detached_partitions(store, user_id=None):
+    """
+    Archive and drop partition tables detached by the retention policy
+
+    With a user_id only that user's rows are archived and deleted; a
+    partition is dropped once no rows are left in it.
+    """
+    archived = 0
+    for name, _ in detached_partitions(db.session.connection()):
+        # Each partition commits, which releases the session's connection
+        connection = db.session.connection()
+        table = connection.dialect.identifier_preparer.quote(name)
+        condition, parameters = "", {}
+        if user_id is not None:
+            condition, parameters = " WHERE user_id = :user_id", {"user_id": user_id}
+        rows = (
+            connection.execute(text(f"SELECT * FROM {table}{condition}"), parameters)
+            .mappings()
+            .all()
+        )
+        _archive_rows(store, rows)
+        if user_id is not None:
+            connection.execute(text(f"DELETE FROM {table}{condition}"), parameters)
+        if (
+            user_id is None
+            or not connection.execute(text(f"SELECT 1 FROM {table} LIMIT 1")).first()
+        ):
+            connection.execute(text(f"DROP TABLE {table}"))
+        db.session.commit()
+        archived += len(rows)
+        logger.info(f"Archived detached partition {name} ({len(rows)} rows)")
+    return archived
+
+
+def users_to_archive(older_than_months=ARCHIVE_AFTER_MONTHS, today=None):
+    """
+    Users with transactions for archive_transactions to move
+
+    Args:
+        older_than_months (int): As for archive_transactions; 0 archives nothing
+        today (datetime): Reference time, now when None
+
+    Returns:
+        list: User IDs in ascending order
+    """
+    if not older_than_months:
+        return []
+    cutoff = archive_cutoff(older_than_months, today)
+    users = set(
+        db.session.execute(
+            select(Transaction.user_id)
+            .where(Transaction.transaction_date < cutoff)
+            .distinct()
+        ).scalars()
+    )
+    if db.session.get_bind().dialect.name == "postgresql":
+        connection = db.session.connection()
+        for name, _ in detached_partitions(connection):
+            table = connection.dialect.identifier_preparer.quote(name)
+            users.update(
+                connection.execute(
+                    text(f"SELECT DISTINCT user_id FROM {table}")
+                ).scalars()
+            )
+    return sorted(users)
+
+
+def archive_transactions(
+    older_than_months=ARCHIVE_AFTER_MONTHS, user_id=None, store=None, today=None
+):
+    """
+    Move old transactions from the table into per-user, per-year Parquet files
+
+    Each user's year is written to the archive before its rows are
+    deleted, and committed on its own. A run interrupted in between leaves
+    rows in both places; readers prefer the table and the next run deletes
+    them. The daily rollup and monthly summary are left as they are, so
+    totals and charts still cover the archived history. On PostgreSQL,
+    rows of partitions detached by the retention policy are archived as
+    well, and a partition is dropped once it is empty.
+
+    Args:
+        older_than_months (int): Archive transactions dated before the month
+            start this many months ago; 0 archives nothing
+        user_id (int): Only archive this user's transactions
+        store: Archive store, LocalArchiveStore when None
+        today (datetime): Reference time, now when None
+
+    Returns:
+        int: Number of transactions archived
+    """
+    if not older_than_months:
+        return 0
+    _pyarrow()
+    store = store or LocalArchiveStore()
+    cutoff = archive_cutoff(older_than_months, today)
+    table = Transaction.__table__
+    columns = [table.c[name] for name, _ in ARCHIVE_COLUMNS]
+
+    year = extract("year", table.c.transaction_date)
+    groups = select(table.c.user_id, year).where(table.c.transaction_date < cutoff)
+    if user_id is not None:
+        groups = groups.where(table.c.user_id == user_id)
+    groups = db.session.execute(groups.group_by(table.c.user_id, year)).all()
+
+    archived = 0
+    for group_user_id, group_year in groups:
+        start = datetime(int(group_year), 1, 1)
+        end = min(datetime(int(group_year) + 1, 1, 1), cutoff)
+        rows = (
+            db.session.execute(
+                select(*columns)
+                .where(table.c.user_id == group_user_id)
+                .where(table.c.transaction_date >= start)
+                .where(table.c.transaction_date < end)
+            )
+            .mappings()
+            .all()
+        )
+        if not rows:
+            continue
+        _write_year(store, group_user_id, int(group_year), rows)
+        # Table-level DELETE skips the ORM rollup listeners on purpose
+        ids = [row["id"] for row in rows]
+        for chunk_start in range(0, len(ids), DELETE_CHUNK_SIZE):
+            chunk = ids[chunk_start : chunk_start + DELETE_CHUNK_SIZE]
+            db.session.execute(delete(table).where(table.c.id.in_(chunk)))
+        db.session.commit()
+        archived += len(rows)
+        logger.info(
+            f"Archived {len(rows)} transactions of user {group_user_id} "
+            f"from {int(group_year)}"
+        )
+
+    if db.session.get_bind().dialect.name == "postgresql":
+        archived += _archive_detached_partitions(store, user_id)
+    return archived
+
+
+def archived_transactions(user_id, since=None, until=None, columns=None, store=None):
+    """
+    A user's archived transactions, oldest first
+
+    Only the archive files of years between since and until are read.
+    Rows that are still in the table, left by an interrupted archive run,
+    are skipped, so merging with a table query counts each row once.
+
+    Args:
+        user_id (int): User ID
+        since (datetime): Earliest transaction date, unbounded when None
+        until (datetime): Transactions before this date, unbounded when None
+        columns (list): Archive columns to read, all of them when None
+        store: Archive store, LocalArchiveStore when None
+
+    Returns:
+        DataFrame: One row per transaction with the ARCHIVE_COLUMNS
+    """
+    store = store or LocalArchiveStore()
+    names = [name for name, _ in ARCHIVE_COLUMNS]
+    columns = list(columns or names)
+    read_columns = list(dict.fromkeys(columns + ["id", "transaction_date"]))
+    years = [
+        year
+        for year in archived_years(user_id, store)
+        if (since is None or year >= since.year)
+        and (until is None or year <= until.year)
+    ]
+    tables = [_read_year(store, user_id, year, read_columns) for year in years]
+    frames = [table.to_pandas() for table in tables if table is not None]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+
+    frame = pd.concat(frames, ignore_index=True)
+    if since is not None:
+        frame = frame[frame["transaction_date"] >= since]
+    if until is not None:
+        frame = frame[frame["transaction_date"] < until]
+    if frame.empty:
+        return frame[columns].reset_index(drop=True)
+
+    still_stored = set(
+        db.session.execute(
+            select(Transaction.id)
+            .where(Transaction.user_id == user_id)
+            .where(Transaction.transaction_date >= frame["transaction_date"].min())
+            .where(Transaction.transaction_date <= frame["transaction_date"].max())
+        ).scalars()
+    )
+    if still_stored:
+        frame = frame[~frame["id"].isin(still_stored)]
+    frame = frame.sort_values(["transaction_date", "id"])
+    return frame[columns].reset_index(drop=True)
+
+
+def transaction_history(user_id, since=None, until=None, store=None):
+    """
+    A user's transactions from the table merged with the archive
+
+    Returns the DataFrame analyze_transactions takes. The archive is only
+    read for the years of the requested range that were archived, so
+    recent ranges cost a table query alone. Without pyarrow only the table
+    is read.
+
+    Args:
+        user_id (int): User ID
+        since (datetime): Earliest transaction date, the whole history when None
+        until (datetime): Transactions before this date, unbounded when None
+        store: Archive store, LocalArchiveStore when None
+
+    Returns:
+        DataFrame: HISTORY_COLUMNS, oldest first
+    """
+    columns = [
+        name if name != "date" else "transaction_date" for name in HISTORY_COLUMNS
+    ]
+    query = select(*(Transaction.__table__.c[name] for name in columns)).where(
+        Transaction.user_id == user_id
+    )
+    if since is not None:
+        query = query.where(Transaction.transaction_date >= since)
+    if until is not None:
+        query = query.where(Transaction.transaction_date < until)
+    stored = pd.DataFrame(db.session.execute(query).all(), columns=columns)
+    if archive_available():
+        archived = archived_transactions(user_id, since, until, columns, store)
+    else:
+        logger.warning(
+            "pyarrow is not installed, archived transactions are left out of "
+            f"the history of user {user_id}"
+        )
+        archived = pd.DataFrame(columns=columns)
+
+    frames = [frame for frame in (archived, stored) if not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=HISTORY_COLUMNS)
+    history = pd.concat(frames, ignore_index=True)
+    history["transaction_date"] = pd.to_datetime(history["transaction_date"])
+    history = history.rename(columns={"transaction_date": "date"})
+    return history.sort_values(["date", "id"]).reset_index(drop=True)
+
+
+def history_range(user_id, store=None):
+    """
+    Dates of a user's first and last transaction, archive included
+
+    Without pyarrow only the table is looked at.
+
+    Returns:
+        tuple: (first, last) datetimes, (None, None) without transactions
+    """
+    first, last = (
+        db.session.query(
+            func.min(Transaction.transaction_date),
+            func.max(Transaction.transaction_date),
+        )
+        .filter(Transaction.user_id == user_id)
+        .one()
+    )
+    years = archived_years(user_id, store)
+    if years and not archive_available():
+        logger.warning(
+            "pyarrow is not installed, archived transactions are left out of "
+            f"the history range of user {user_id}"
+        )
+        years = []
+    if years:
+        store = store or LocalArchiveStore()
+        for year in (years[0], years[-1]):
+            dates = _read_year(store, user_id, year, ["transaction_date"])
+            dates = dates.column("transaction_date").to_pandas()
+            if dates.empty:
+                continue
+            oldest, newest = dates.min().to_pydatetime(), dates.max().to_pydatetime()
+            first = oldest if first is None else min(first, oldest)
+            last = newest if last is None else max(last, newest)
+    return first, last
+
+
+def drop_archived(user_id, transactions, store=None):
+    """
+    Remove transactions that were already archived from an import
+
+    Archived rows are gone from the table, so its unique constraints no
+    longer catch them. Only rows dated in a year with an archive file are
+    looked up, by external id or fingerprint.
+
+    Args:
+        user_id (int): Owner of the transactions
+        transactions (list): Transaction dictionaries with fingerprints
+            assigned (see assign_fingerprints)
+        store: Archive store, LocalArchiveStore when None
+
+    Returns:
+        list: The transactions not found in the archive
+    """
+    years = set(archived_years(user_id, store))
+    if not years:
+        return transactions
+    old_years = {t["date"].year for t in transactions} & years
+    if not old_years:
+        return transactions
+
+    store = store or LocalArchiveStore()
+    external_ids = set()
+    fingerprints = set()
+    for year in old_years:
+        table = _read_year(store, user_id, year, ["external_id", "fingerprint"])
+        external_ids.update(table.column("external_id").to_pylist())
+        fingerprints.update(table.column("fingerprint").to_pylist())
+    external_ids.discard(None)
+    fingerprints.discard(None)
+
+    kept = [
+        t
+        for t in transactions
+        if t.get("external_id") not in external_ids
+        and t.get("fingerprint") not in fingerprints
+    ]
+    if len(kept) < len(transactions):
+        logger.debug(
+            f"Skipped {len(transactions) - len(kept)} archived transactions "
+            f"of user {user_id}"
+        )
+    return kept
+
+
+def add_archive_to_rollups(user_id=None, store=None):
+    """
+    Add archived transactions to a freshly rebuilt rollup and summary
+
+    rebuild_daily_rollup and rebuild_monthly_summary only see the table;
+    this puts the archived history back. The caller commits.
+
+    Returns:
+        int: Number of archived transactions added
+    """
+    store = store or LocalArchiveStore()
+    user_ids = [user_id] if user_id is not None else archived_users(store)
+    added = 0
+    for archived_user_id in user_ids:
+        frame = archived_transactions(
+            archived_user_id, columns=ROLLUP_SOURCE_COLUMNS, store=store
+        )
+        if frame.empty:
+            continue
+        rows = [
+            (
+                int(row.user_id),
+                row.transaction_date.to_pydatetime(),
+                None if pd.isna(row.category_id) else int(row.category_id),
+                bool(row.is_expense),
+                float(row.amount),
+            )
+            for row in frame.itertuples(index=False)
+        ]
+        apply_rollup_deltas(rollup_deltas(rows))
+        added += len(rows)
+    return added
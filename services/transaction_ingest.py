@@ -0,0 +1,481 @@
+import hashlib
+import io
+import logging
+from sqlalchemy import (
+    Column,
+    Date,
+    MetaData,
+    Table,
+    cast,
+    exists,
+    func,
+    insert,
+    select,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from models import (
+    BankAccount,
+    DailySpendingRollup,
+    MonthlySpendingSummary,
+    Transaction,
+)
+from services.db_engine import without_statement_timeout
+from services.spending_rollup import (
+    ROLLUP_SOURCE_COLUMNS,
+    UNCATEGORIZED,
+    apply_rollup_deltas,
+    month_start,
+    rollup_deltas,
+)
+from services.transaction_analyzer import categorize_many
+from services.transaction_archive import drop_archived
+
+logger = logging.getLogger(__name__)
+
+# Rows per INSERT statement and keys per IN (...) lookup. A lookup chunk
+# covers a whole statement import batch, so each batch is one probe.
+INSERT_CHUNK_SIZE = 1000
+LOOKUP_CHUNK_SIZE = 5000
+
+# Columns loaded by the bulk paths, in COPY order
+LOAD_COLUMNS = [
+    "account_id",
+    "user_id",
+    "external_id",
+    "fingerprint",
+    "amount",
+    "currency",
+    "description",
+    "transaction_date",
+    "merchant",
+    "category_id",
+    "is_expense",
+]
+
+
+def insert_ignoring_duplicates():
+    """INSERT for Transaction that silently skips duplicate ids and fingerprints"""
+    # Core INSERT on the table: the rows are plain dicts, so the ORM bulk
+    # layer would only add per-row overhead. ORM events do not fire, so rows
+    # must carry user_id themselves.
+    table = Transaction.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(table).on_conflict_do_nothing()
+    if dialect == "sqlite":
+        return sqlite.insert(table).on_conflict_do_nothing()
+    return insert(table)
+
+
+def insert_transaction_rows(rows):
+    """
+    Insert transaction rows, skipping duplicates, and roll them up
+
+    The daily rollup and the monthly summary are updated in the same
+    transaction from the rows the
+    database reports as inserted (INSERT ... RETURNING), so rows skipped as
+    duplicates by a concurrent sync are not counted twice. The caller
+    commits.
+
+    Args:
+        rows (list): Dictionaries with Transaction column values
+
+    Returns:
+        int: Number of rows inserted
+    """
+    table = Transaction.__table__
+    statement = insert_ignoring_duplicates()
+    returning = db.session.get_bind().dialect.insert_executemany_returning
+    if returning:
+        statement = statement.returning(
+            *(table.c[name] for name in ROLLUP_SOURCE_COLUMNS)
+        )
+
+    deltas = {}
+    inserted = 0
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        chunk = rows[start : start + INSERT_CHUNK_SIZE]
+        result = db.session.execute(statement, chunk)
+        # Without RETURNING the plain INSERT fails on duplicates instead
+        added = result.all() if returning else chunk
+        rollup_deltas(added, deltas=deltas)
+        inserted += len(added)
+    apply_rollup_deltas(deltas)
+    return inserted
+
+
+def _normalize(value):
+    return " ".join((value or "").lower().replace("ё", "е").split())
+
+
+def assign_fingerprints(account_id, transactions, occurrences=None):
+    """
+    Set a content fingerprint on transactions that have no external id
+
+    The fingerprint hashes the account, date, amount, direction, description
+    and merchant (case and whitespace normalized) plus how many identical
+    rows came before it. Re-importing the same rows therefore gives the same
+    fingerprints, while genuinely repeated purchases stay distinct.
+
+    Args:
+        account_id (int): Database ID of the account
+        transactions (list): Transaction dictionaries, updated in place
+        occurrences (dict): Identical-row counts; pass the same dict for all
+            batches of one import so ordinals continue across batches
+    """
+    occurrences = occurrences if occurrences is not None else {}
+    for transaction_data in transactions:
+        if transaction_data.get("external_id") is not None:
+            continue
+        key = "\x1f".join(
+            [
+                str(account_id),
+                transaction_data["date"].replace(microsecond=0).isoformat(),
+                f"{abs(float(transaction_data['amount'])):.2f}",
+                "-" if transaction_data.get("is_expense", True) else "+",
+                _normalize(transaction_data.get("description")),
+                _normalize(transaction_data.get("merchant")),
+            ]
+        )
+        ordinal = occurrences.get(key, 0)
+        occurrences[key] = ordinal + 1
+        transaction_data["fingerprint"] = hashlib.sha1(
+            f"{key}\x1f{ordinal}".encode("utf-8")
+        ).hexdigest()
+
+
+def _find_existing(column, keys):
+    keys = list(keys)
+    existing = set()
+    for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+        chunk = keys[start : start + LOOKUP_CHUNK_SIZE]
+        existing.update(
+            db.session.execute(select(column).where(column.in_(chunk))).scalars()
+        )
+    return existing
+
+
+def find_existing_external_ids(external_ids):
+    """
+    Return the subset of external ids that are already stored
+
+    Args:
+        external_ids (iterable): External transaction ids
+
+    Returns:
+        set: External ids present in the database
+    """
+    return _find_existing(Transaction.external_id, external_ids)
+
+
+def find_existing_fingerprints(fingerprints):
+    """
+    Return the subset of content fingerprints that are already stored
+
+    Args:
+        fingerprints (iterable): Fingerprints from assign_fingerprints
+
+    Returns:
+        set: Fingerprints present in the database
+    """
+    return _find_existing(Transaction.fingerprint, fingerprints)
+
+
+def ingest_transactions(account_id, transactions, user_id=None, occurrences=None):
+    """
+    Insert fetched transactions that are not stored yet
+
+    Transactions are matched on their external id, or on a content
+    fingerprint when they have none (see assign_fingerprints). Duplicates
+    are found with one IN lookup per LOOKUP_CHUNK_SIZE keys, the remaining
+    rows are categorized as one batch and written with Core bulk INSERTs. On
+    PostgreSQL and SQLite the INSERT also ignores conflicting keys, so
+    concurrent syncs of the same account cannot fail on the unique
+    constraints. The caller commits.
+
+    Args:
+        account_id (int): Database ID of the account
+        transactions (list): Transaction dictionaries from a bank adapter
+        user_id (int): Owner of the account, looked up when not given
+        occurrences (dict): Identical-row counts shared by the batches of
+            one import, see assign_fingerprints
+
+    Returns:
+        int: Number of new transactions
+    """
+    if not transactions:
+        return 0
+
+    assign_fingerprints(account_id, transactions, occurrences)
+
+    # Drop repeats inside the batch, then everything already stored
+    seen_ids = set()
+    seen_fingerprints = set()
+    candidates = []
+    for transaction_data in transactions:
+        external_id = transaction_data.get("external_id")
+        if external_id is not None:
+            if external_id in seen_ids:
+                continue
+            seen_ids.add(external_id)
+        else:
+            fingerprint = transaction_data["fingerprint"]
+            if fingerprint in seen_fingerprints:
+                continue
+            seen_fingerprints.add(fingerprint)
+        candidates.append(transaction_data)
+
+    existing_ids = find_existing_external_ids(seen_ids) if seen_ids else set()
+    existing_fingerprints = (
+        find_existing_fingerprints(seen_fingerprints) if seen_fingerprints else set()
+    )
+    new_transactions = [
+        t
+        for t in candidates
+        if t.get("external_id") not in existing_ids
+        and t.get("fingerprint") not in existing_fingerprints
+    ]
+    if not new_transactions:
+        return 0
+
+    if user_id is None:
+        user_id = db.session.get(BankAccount, account_id).user_id
+
+    new_transactions = drop_archived(user_id, new_transactions)
+    if not new_transactions:
+        return 0
+
+    category_ids = categorize_many(
+        ((t["description"], t.get("merchant", "")) for t in new_transactions),
+        user_id=user_id,
+    )
+
+    rows = []
+    for transaction_data, category_id in zip(new_transactions, category_ids):
+        if category_id < 0:
+            # If we somehow don't have an "Other" category, log error and skip
+            logger.error("Failed to find 'Other' category")
+            continue
+
+        rows.append(
+            {
+                "account_id": account_id,
+                "user_id": user_id,
+                "external_id": transaction_data.get("external_id"),
+                "fingerprint": transaction_data.get("fingerprint"),
+                "amount": transaction_data["amount"],
+                "currency": transaction_data.get("currency", "RUB"),
+                "description": transaction_data["description"],
+                "transaction_date": transaction_data["date"],
+                "merchant": transaction_data.get("merchant", ""),
+                "category_id": int(category_id),
+                "is_expense": transaction_data.get("is_expense", True),
+            }
+        )
+
+    inserted = insert_transaction_rows(rows)
+    logger.debug(f"Inserted {inserted} transactions for account {account_id}")
+    return inserted
+
+
+def _staging_table():
+    """Session-local copy of the transaction columns used as a COPY target"""
+    return Table(
+        "transaction_staging",
+        MetaData(),
+        *(Column(name, Transaction.__table__.c[name].type) for name in LOAD_COLUMNS),
+        prefixes=["TEMPORARY"],
+        postgresql_on_commit="DROP",
+    )
+
+
+def _copy_value(value):
+    """A field of COPY's text format; None becomes the \\N NULL marker"""
+    if value is None:
+        return "\\N"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _copy_transaction_batches(account_id, batches, user_id):
+    """
+    Load batches with COPY into a staging table, then merge once
+
+    The merge is a single INSERT ... SELECT that skips external ids and
+    fingerprints already stored (or repeated within the load) and adds
+    the inserted rows to the daily rollup and the monthly summary. External
+    ids are looked up whatever the transaction date, as ingest_transactions
+    does; the unique constraint only covers (external_id, transaction_date)
+    on the partitioned table.
+    """
+    connection = db.session.connection()
+    # A large statement import may outlast the web statement timeout
+    without_statement_timeout(connection)
+    staging = _staging_table()
+    staging.create(connection)
+    cursor = connection.connection.cursor()
+    occurrences = {}
+
+    try:
+        for batch in batches:
+            assign_fingerprints(account_id, batch, occurrences)
+            batch = drop_archived(user_id, batch)
+            category_ids = categorize_many(
+                ((t["description"], t.get("merchant", "")) for t in batch),
+                user_id=user_id,
+            )
+            buffer = io.StringIO()
+            for transaction_data, category_id in zip(batch, category_ids):
+                if category_id < 0:
+                    logger.error("Failed to find 'Other' category")
+                    continue
+                values = [
+                    account_id,
+                    user_id,
+                    transaction_data.get("external_id"),
+                    transaction_data.get("fingerprint"),
+                    transaction_data["amount"],
+                    transaction_data.get("currency", "RUB"),
+                    transaction_data["description"],
+                    transaction_data["date"].isoformat(),
+                    transaction_data.get("merchant", ""),
+                    int(category_id),
+                    "t" if transaction_data.get("is_expense", True) else "f",
+                ]
+                buffer.write("\t".join(_copy_value(value) for value in values))
+                buffer.write("\n")
+            buffer.seek(0)
+            # Text format with an explicit NULL marker: in CSV an empty
+            # merchant would load as NULL instead of ""
+            cursor.copy_expert(
+                f"COPY {staging.name} ({', '.join(LOAD_COLUMNS)}) "
+                "FROM STDIN WITH (FORMAT text, NULL '\\N')",
+                buffer,
+            )
+    finally:
+        cursor.close()
+
+    # One statement: the merge's RETURNING feeds the rollup upsert
+    table = Transaction.__table__
+    stored = table.alias("stored")
+    new_rows = (
+        select(*staging.c)
+        .distinct(staging.c.external_id, staging.c.fingerprint)
+        .where(~exists().where(stored.c.external_id == staging.c.external_id))
+        .where(~exists().where(stored.c.fingerprint == staging.c.fingerprint))
+    )
+    inserted = (
+        postgresql.insert(table)
+        .from_select(LOAD_COLUMNS, new_rows)
+        .on_conflict_do_nothing()
+        .returning(*(table.c[name] for name in ROLLUP_SOURCE_COLUMNS))
+        .cte("inserted")
+    )
+    rollup = DailySpendingRollup.__table__
+    day = cast(inserted.c.transaction_date, Date)
+    category_id = func.coalesce(inserted.c.category_id, UNCATEGORIZED)
+    rolled_up = postgresql.insert(rollup).from_select(
+        ["user_id", "day", "category_id", "is_expense", "total", "count"],
+        select(
+            inserted.c.user_id,
+            day,
+            category_id,
+            inserted.c.is_expense,
+            func.sum(inserted.c.amount),
+            func.count(),
+        ).group_by(inserted.c.user_id, day, category_id, inserted.c.is_expense),
+    )
+    rolled_up = rolled_up.on_conflict_do_update(
+        index_elements=["user_id", "day", "category_id", "is_expense"],
+        set_={
+            "total": rollup.c.total + rolled_up.excluded.total,
+            "count": rollup.c.count + rolled_up.excluded.count,
+        },
+    ).cte("rolled_up")
+
+    summary = MonthlySpendingSummary.__table__
+    amount = inserted.c.amount
+    month = month_start(inserted.c.transaction_date, "postgresql")
+    summarized = postgresql.insert(summary).from_select(
+        [
+            "user_id",
+            "month",
+            "category_id",
+            "is_expense",
+            "total",
+            "count",
+            "min_amount",
+            "max_amount",
+            "sum_squares",
+        ],
+        select(
+            inserted.c.user_id,
+            month,
+            category_id,
+            inserted.c.is_expense,
+            func.sum(amount),
+            func.count(),
+            func.min(amount),
+            func.max(amount),
+            func.sum(amount * amount),
+        ).group_by(inserted.c.user_id, month, category_id, inserted.c.is_expense),
+    )
+    summarized = summarized.on_conflict_do_update(
+        index_elements=["user_id", "month", "category_id", "is_expense"],
+        set_={
+            "total": summary.c.total + summarized.excluded.total,
+            "count": summary.c.count + summarized.excluded.count,
+            "min_amount": func.least(
+                summary.c.min_amount, summarized.excluded.min_amount
+            ),
+            "max_amount": func.greatest(
+                summary.c.max_amount, summarized.excluded.max_amount
+            ),
+            "sum_squares": summary.c.sum_squares + summarized.excluded.sum_squares,
+        },
+    ).cte("summarized")
+    count = connection.execute(
+        select(func.count())
+        .select_from(inserted)
+        .add_cte(rolled_up)
+        .add_cte(summarized)
+    ).scalar()
+    staging.drop(connection)
+    return count
+
+
+def ingest_transaction_batches(account_id, batches, user_id=None):
+    """
+    Insert a stream of transaction batches that are not stored yet
+
+    Used for large loads such as statement imports. On PostgreSQL the rows
+    are COPYed into a temporary staging table and merged with one INSERT
+    ... SELECT; elsewhere each batch goes through ingest_transactions
+    (chunked executemany). Only one batch is held in memory at a time. The
+    caller commits.
+
+    Args:
+        account_id (int): Database ID of the account
+        batches (iterable): Lists of transaction dictionaries
+        user_id (int): Owner of the account, looked up when not given
+
+    Returns:
+        int: Number of new transactions
+    """
+    if user_id is None:
+        user_id = db.session.get(BankAccount, account_id).user_id
+
+    if db.session.get_bind().dialect.name == "postgresql":
+        return _copy_transaction_batches(account_id, batches, user_id)
+
+    occurrences = {}
+    return sum(
+        ingest_transactions(account_id, batch, user_id=user_id, occurrences=occurrences)
+        for batch in batches
+    )
@@ -11,4 +11,5 @@ setup(
     packages=find_packages(),
     python_requires=">=3.11",
     install_requires=requirements,
+    extras_require={"archive": ["pyarrow>=17.0.0"]},
 )
@@ -2,6 +2,23 @@ import pytest
 from datetime import datetime
 from app import app, db
 from models import User, BankAccount, Category, Transaction, Recommendation, SavingsGoal
+from services.merchant_overrides import invalidate_user_overrides
+from services.category_registry import invalidate_categories
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--runslow", action="store_true", default=False, help="run slow tests"
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--runslow"):
+        return
+    skip_slow = pytest.mark.skip(reason="needs --runslow")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip_slow)
 
 
 @pytest.fixture(scope="function")
@@ -18,6 +35,8 @@ def app_context():
 
     db.session.remove()
     db.drop_all()
+    invalidate_user_overrides()
+    invalidate_categories()
     ctx.pop()
 
 
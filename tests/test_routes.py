@@ -1,7 +1,21 @@
+import io
 import pytest
 import datetime
 from flask import url_for
-from models import User, BankAccount, Category, Transaction, Recommendation, SavingsGoal
+from models import (
+    User,
+    BankAccount,
+    Category,
+    Transaction,
+    Recommendation,
+    SavingsGoal,
+    MerchantCategoryOverride,
+    SyncJob,
+)
+from sqlalchemy import create_engine, event
+from services.db_engine import LAST_WRITE_KEY, REPLICA_BIND_KEY
+from services.job_queue import run_next_job
+from services.transaction_analyzer import init_categories
 from app import db
 
 pytestmark = pytest.mark.routes
@@ -164,6 +178,243 @@ def test_dashboard_with_data(authenticated_client, test_user, test_category):
     assert b"Restaurant" in response.data
 
 
+def test_transactions_list_pages_through_full_history(
+    authenticated_client, test_bank_account, monkeypatch
+):
+    """The list covers all history page by page and shows the period"""
+    from routers import transactions as transactions_router
+
+    monkeypatch.setattr(transactions_router, "TRANSACTIONS_PER_PAGE", 1)
+    now = datetime.datetime.utcnow()
+    for description, when in (
+        ("Recent purchase", now),
+        ("Old purchase", now - datetime.timedelta(days=400)),
+    ):
+        db.session.add(
+            Transaction(
+                account_id=test_bank_account.id,
+                amount=10.0,
+                description=description,
+                transaction_date=when,
+            )
+        )
+    db.session.commit()
+
+    response = authenticated_client.get("/transactions")
+    assert b"Recent purchase" in response.data
+    assert b"Old purchase" not in response.data
+    assert "Показаны транзакции".encode() in response.data
+    assert b"page=2" in response.data
+
+    response = authenticated_client.get("/transactions?page=2")
+    assert b"Old purchase" in response.data
+    assert b"Recent purchase" not in response.data
+
+    # A date filter narrows the period and offers to widen it again
+    recent = (now - datetime.timedelta(days=30)).strftime("%Y-%m-%d")
+    response = authenticated_client.get(f"/transactions?date_from={recent}")
+    assert b"Recent purchase" in response.data
+    assert b"page=2" not in response.data
+    assert "Показать за всё время".encode() in response.data
+
+
+def test_read_pages_use_replica_until_own_write(
+    authenticated_client, test_transaction, tmp_path
+):
+    """Read-only pages come from the replica, except right after a write"""
+    # A replica lagging behind: everything but the transaction
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    db.metadata.create_all(replica)
+    with replica.begin() as connection:
+        for table in (User.__table__, BankAccount.__table__, Category.__table__):
+            rows = db.session.execute(table.select()).mappings().all()
+            connection.execute(table.insert(), [dict(row) for row in rows])
+    statements = []
+    event.listen(
+        replica, "before_cursor_execute", lambda *args: statements.append(args[2])
+    )
+    db.engines[REPLICA_BIND_KEY] = replica
+    try:
+        with authenticated_client.session_transaction() as session:
+            session.pop(LAST_WRITE_KEY, None)
+
+        response = authenticated_client.get("/transactions")
+        assert response.status_code == 200
+        assert b"Grocery shopping" not in response.data
+        assert statements
+
+        # Writes go to the primary and pin the user's reads to it
+        statements.clear()
+        other = Category(name="Other", icon="tag")
+        db.session.add(other)
+        db.session.commit()
+        authenticated_client.post(
+            f"/transactions/{test_transaction.id}/update_category",
+            data={"category_id": other.id},
+        )
+        response = authenticated_client.get("/transactions")
+        assert b"Grocery shopping" in response.data
+        assert statements == []
+    finally:
+        del db.engines[REPLICA_BIND_KEY]
+        replica.dispose()
+
+
+def test_transaction_analysis_counts_archived_history(
+    authenticated_client, test_bank_account, monkeypatch
+):
+    """Analysis is offered while the monthly summary holds archived rows"""
+    from routers import transactions as transactions_router
+
+    monkeypatch.setattr(
+        transactions_router, "render_template", lambda template, **context: template
+    )
+    response = authenticated_client.get("/transactions/analysis")
+    assert response.status_code == 302
+
+    db.session.add(
+        Transaction(
+            account_id=test_bank_account.id,
+            amount=10.0,
+            description="Archived purchase",
+            transaction_date=datetime.datetime(2022, 3, 5),
+        )
+    )
+    db.session.commit()
+    # Archiving deletes from the table and leaves the summary as it is
+    db.session.execute(Transaction.__table__.delete())
+    db.session.commit()
+
+    response = authenticated_client.get("/transactions/analysis")
+    assert response.status_code == 200
+    assert response.data == b"transaction_analysis.html"
+
+
+def test_long_range_views_read_the_archive(
+    authenticated_client, test_bank_account, tmp_path, monkeypatch
+):
+    """Full-history analysis and recommendations include archived rows"""
+    pytest.importorskip("pyarrow")
+    from routers import transactions as transactions_router
+    from services.spending_rollup import rebuild_daily_rollup, rebuild_monthly_summary
+    from services.transaction_archive import archive_transactions
+
+    monkeypatch.setattr("services.transaction_archive.ARCHIVE_DIR", str(tmp_path))
+    monkeypatch.delenv("DEEPSEEK_API_KEY", raising=False)
+    now = datetime.datetime.utcnow()
+    for when in (datetime.datetime(2022, 1, 10), datetime.datetime(2022, 2, 10), now):
+        db.session.add(
+            Transaction(
+                account_id=test_bank_account.id,
+                amount=299.0,
+                description="Подписка",
+                merchant="Кинопоиск",
+                is_expense=True,
+                transaction_date=when,
+            )
+        )
+    db.session.commit()
+    assert archive_transactions(older_than_months=3) == 2
+    # Summaries rebuilt from the table alone no longer hold the archived months
+    rebuild_daily_rollup()
+    rebuild_monthly_summary()
+    db.session.commit()
+
+    rendered = {}
+    monkeypatch.setattr(
+        transactions_router,
+        "render_template",
+        lambda template, **context: rendered.update(context) or template,
+    )
+    authenticated_client.get("/transactions/analysis")
+    assert rendered["full_history"] is False
+    assert rendered["results"]["total_spent"] == pytest.approx(299.0)
+    authenticated_client.get("/transactions/analysis?history=full")
+    assert rendered["full_history"] is True
+    assert rendered["results"]["total_spent"] == pytest.approx(897.0)
+
+    # The archived months make the charge a monthly subscription
+    title = "Проверьте свои регулярные подписки"
+    authenticated_client.post("/recommendations/generate")
+    assert not Recommendation.query.filter_by(title=title).count()
+    authenticated_client.post(
+        "/recommendations/generate", data={"include_archive": "1"}
+    )
+    assert Recommendation.query.filter_by(title=title).count() == 1
+
+
+def test_update_category_records_override(
+    authenticated_client, test_user, test_transaction
+):
+    """Test manual recategorization is remembered for the merchant"""
+    other = Category(name="Other", icon="tag")
+    db.session.add(other)
+    db.session.commit()
+
+    response = authenticated_client.post(
+        f"/transactions/{test_transaction.id}/update_category",
+        data={"category_id": other.id},
+    )
+    assert response.status_code == 302
+
+    override = MerchantCategoryOverride.query.filter_by(user_id=test_user.id).one()
+    assert override.merchant_key == "supermarket"
+    assert override.category_id == other.id
+
+
+def test_connect_bank_enqueues_sync_job(authenticated_client, test_user):
+    """Test connecting a bank returns at once and the worker does the import"""
+    init_categories()
+    response = authenticated_client.post(
+        "/banks/connect",
+        data={"bank_name": "vtb", "username": "user", "password": "secret"},
+    )
+    assert response.status_code == 302
+    assert Transaction.query.count() == 0
+
+    job = SyncJob.query.filter_by(user_id=test_user.id).one()
+    status = authenticated_client.get(f"/banks/jobs/{job.id}").get_json()
+    assert status["status"] == "queued"
+
+    assert run_next_job("test-worker").id == job.id
+    assert run_next_job("test-worker") is None
+
+    status = authenticated_client.get(f"/banks/jobs/{job.id}").get_json()
+    assert status["status"] == "succeeded"
+    assert status["progress"] == 100
+    assert status["transaction_count"] == Transaction.query.count() > 0
+    assert BankAccount.query.filter_by(user_id=test_user.id).count() == 2
+    assert db.session.get(SyncJob, job.id).access_token is None
+
+    # Syncing an account queues a job instead of calling the bank
+    account = BankAccount.query.filter_by(user_id=test_user.id).first()
+    response = authenticated_client.get(f"/banks/{account.id}/sync")
+    assert response.status_code == 302
+    assert SyncJob.query.filter_by(account_id=account.id, status="queued").count() == 1
+
+
+def test_import_statement_creates_account(authenticated_client, test_user):
+    """Test uploading a statement into a new manual account"""
+    init_categories()
+    statement = (
+        "Дата;Сумма;Описание\n01.03.2024;-500,00;Такси\n02.03.2024;-120,00;Кофе\n"
+    ).encode("utf-8")
+    response = authenticated_client.post(
+        "/banks/import",
+        data={
+            "bank_name": "Райффайзенбанк",
+            "account_number": "40817810000000000001",
+            "statement": (io.BytesIO(statement), "statement.csv"),
+        },
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 302
+
+    account = BankAccount.query.filter_by(user_id=test_user.id).one()
+    assert account.bank_name == "Райффайзенбанк"
+    assert Transaction.query.filter_by(account_id=account.id).count() == 2
+
+
 def test_savings_goals_route(authenticated_client):
     """Test savings goals page with no goals"""
     response = authenticated_client.get("/savings_goals")
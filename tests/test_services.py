@@ -1,15 +1,95 @@
+import io
+import json
+import os
+import threading
+import time
 import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import patch, MagicMock
-from datetime import datetime
+from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
 from models import Category
+from sqlalchemy import create_engine, event, func, inspect, text
 from services.transaction_analyzer import (
     init_categories,
     categorize_transaction,
+    categorize_many,
     analyze_transactions,
+    analyze_spending,
 )
+from services.category_registry import (
+    get_categories,
+    get_category,
+    get_category_names,
+    invalidate_categories,
+)
+from services.merchant_overrides import get_user_overrides, record_merchant_override
+from services.category_model import CategoryModel, train_category_model
+from services.db_engine import (
+    SQLITE_BUSY_TIMEOUT_MS,
+    apply_engine_profile,
+    engine_options,
+    pool_limits,
+)
+from services.transaction_ingest import (
+    ingest_transaction_batches,
+    ingest_transactions,
+)
+from models import (
+    BankAccount,
+    DailySpendingRollup,
+    MonthlySpendingSummary,
+    SyncJob,
+    Transaction,
+)
+from mock_bank_server import MockBank, make_server
+from services import bank_adapters
+from services.bank_adapters import BankAdapter, HttpBankAdapter, get_adapter
+from services.bank_client import BankAPIError, BankUnavailableError, run_sync
+from services.bank_tokens import TokenManager, TTLCache, invalidate_accounts
+from services.job_queue import run_next_job
+from services.statement_import import (
+    StatementFormatError,
+    import_statement,
+    parse_amount,
+)
+from services.sync_scheduler import SyncScheduler, TokenBucket
+from services.synthetic_data import (
+    DEFAULT_START,
+    generate_transactions,
+    load_into_database,
+)
+from services.migrations import current_version, upgrade
+from services.partitions import (
+    add_months,
+    maintain_partitions,
+    month_floor,
+    partition_name,
+)
+from services.spending_rollup import (
+    category_spending,
+    daily_spending,
+    rebuild_daily_rollup,
+    rebuild_monthly_summary,
+    recent_activity_start,
+    spending_summary,
+)
+from services.transaction_archive import (
+    LocalArchiveStore,
+    add_archive_to_rollups,
+    archive_transactions,
+    archived_years,
+    history_range,
+    transaction_history,
+)
+from services.recommendation_engine import cash_withdrawn, merchant_monthly_spending
+from services import bank_api
 from services.bank_api import get_supported_banks, generate_sample_transactions
-from services.ai_recommendation import get_rule_based_recommendations
+from services.ai_recommendation import (
+    generate_ai_recommendations,
+    get_rule_based_recommendations,
+)
 from app import db
 
 pytestmark = pytest.mark.services
@@ -53,6 +133,145 @@ def test_categorize_transaction(app_context):
     assert transport_category.name == "Транспорт"
 
 
+def test_categorizer_runs_without_queries(app_context):
+    """Test compiled categorizer precedence and that it avoids DB round trips"""
+    init_categories()
+    invalidate_categories()
+    categorize_transaction("warm up", "")
+
+    statements = []
+
+    def count_statement(*args):
+        statements.append(args)
+
+    event.listen(db.engine, "before_cursor_execute", count_statement)
+    try:
+        income_id = categorize_transaction("Перевод от клиента", "Магнит")
+        other_id = categorize_transaction("Неизвестный платёж", "")
+        fuel_id = categorize_transaction("Оплата", "АЗС Газпром")
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count_statement)
+
+    assert statements == []
+    assert db.session.get(Category, income_id).name == "Доход"
+    assert db.session.get(Category, other_id).name == "Другое"
+    assert db.session.get(Category, fuel_id).name == "Топливо"
+
+
+def test_category_registry_invalidated_on_change(app_context):
+    """Test the registry serves from memory and reloads after a change"""
+    init_categories()
+    invalidate_categories()
+    names = get_category_names()
+
+    statements = []
+
+    def count_statement(*args):
+        statements.append(args)
+
+    event.listen(db.engine, "before_cursor_execute", count_statement)
+    try:
+        assert get_category_names() == names
+        food = next(c for c in get_categories() if c.name == "Продукты")
+        assert get_category(food.id).icon == "cart"
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count_statement)
+    assert statements == []
+
+    category = db.session.get(Category, food.id)
+    category.icon = "basket"
+    db.session.add(Category(name="Путешествия", icon="plane"))
+    db.session.commit()
+
+    assert get_category(food.id).icon == "basket"
+    assert "Путешествия" in get_category_names().values()
+
+
+def test_categorize_many_matches_single_calls(app_context):
+    """Test batch categorization agrees with per-row categorization"""
+    init_categories()
+    rows = [
+        ("Покупка", "Пятёрочка"),
+        ("Зачисление средств", ""),
+        ("Оплата", "Яндекс.Такси"),
+        ("Покупка", "Пятёрочка"),
+        (None, None),
+    ]
+
+    category_ids = categorize_many(rows)
+
+    assert category_ids.shape == (len(rows),)
+    assert list(category_ids) == [categorize_transaction(d, m) for d, m in rows]
+    assert categorize_many([]).shape == (0,)
+
+
+def test_merchant_override_beats_keywords(app_context, test_user):
+    """Test a recorded merchant override is used before keyword matching"""
+    init_categories()
+    health = Category.query.filter_by(name="Здоровье").first()
+    assert record_merchant_override(test_user.id, "Магнит ", health.id)
+    db.session.commit()
+
+    assert categorize_transaction("Покупка", "магнит", user_id=test_user.id) == (
+        health.id
+    )
+    # Other users and anonymous calls still use keywords
+    food_id = categorize_transaction("Покупка", "Магнит")
+    assert food_id != health.id
+    assert categorize_transaction("Покупка", "Магнит", user_id=999) == food_id
+
+    category_ids = categorize_many(
+        [("Покупка", "Магнит"), ("Покупка", "Лента")], user_id=test_user.id
+    )
+    assert list(category_ids) == [health.id, food_id]
+
+
+def test_merchant_override_cache_invalidated_after_commit(app_context, test_user):
+    """Test the override cache is only dropped once the change is committed"""
+    init_categories()
+    health = Category.query.filter_by(name="Здоровье").first()
+    assert get_user_overrides(test_user.id) == {}
+
+    record_merchant_override(test_user.id, "Аптека 36.6", health.id)
+    # Until the commit, lookups keep serving the committed map
+    assert get_user_overrides(test_user.id) == {}
+    db.session.commit()
+    assert get_user_overrides(test_user.id) == {"аптека 36.6": health.id}
+
+    record_merchant_override(test_user.id, "Аптека 36.6", None)
+    record_merchant_override(test_user.id, "Лента", health.id)
+    db.session.rollback()
+    assert get_user_overrides(test_user.id) == {"аптека 36.6": health.id}
+
+
+def test_category_model_memory_mapped_with_fallback(app_context, tmp_path, monkeypatch):
+    """Test the trained model is memory-mapped and keywords cover low confidence"""
+    init_categories()
+    texts = ["оплата кофейня зерно", "покупка кофейня зерно"] * 50 + [
+        "оплата бутик одежда",
+        "покупка бутик одежда",
+    ] * 50
+    labels = ["Рестораны"] * 100 + ["Шоппинг"] * 100
+    model = train_category_model(texts, labels, epochs=5, hash_bits=12)
+    path = str(tmp_path / "category_model.npy")
+    model.save(path)
+
+    loaded = CategoryModel.load(path)
+    assert isinstance(loaded.weights, np.memmap)
+    names, confidences = loaded.predict(["кофейня зерно", "бутик одежда"])
+    assert list(names) == ["Рестораны", "Шоппинг"]
+    assert (confidences > 0.6).all()
+
+    monkeypatch.setenv("CATEGORY_MODEL_PATH", path)
+    restaurants = Category.query.filter_by(name="Рестораны").first()
+    assert categorize_transaction("Оплата", "Кофейня Зерно") == restaurants.id
+
+    # An unconfident prediction falls back to the keyword matcher
+    monkeypatch.setenv("CATEGORY_MODEL_MIN_CONFIDENCE", "1.01")
+    other_id = categorize_transaction("Оплата", "Кофейня Зерно")
+    assert db.session.get(Category, other_id).name == "Другое"
+
+
 def test_analyze_transactions(app_context):
     """Test transaction analysis"""
     # Create test transactions dataframe
@@ -95,6 +314,618 @@ def test_analyze_transactions(app_context):
     assert category_spending["Развлечения"] == 500.0
 
 
+def test_ingest_transactions_bulk_dedup(app_context, test_bank_account):
+    """Test ingestion dedups with set lookups and inserts in bulk"""
+    init_categories()
+    now = datetime.utcnow()
+    transactions = [
+        {
+            "external_id": f"tx_{i}",
+            "amount": 100.0 + i,
+            "currency": "RUB",
+            "description": "Покупка",
+            "date": now,
+            "merchant": "Магнит",
+            "is_expense": True,
+        }
+        for i in range(2500)
+    ]
+    assert ingest_transactions(test_bank_account.id, transactions[:10]) == 10
+    db.session.commit()
+
+    statements = []
+
+    def count_statement(*args):
+        statements.append(args)
+
+    event.listen(db.engine, "before_cursor_execute", count_statement)
+    try:
+        # Overlaps the first import and repeats a row inside the batch
+        count = ingest_transactions(
+            test_bank_account.id, transactions + transactions[-5:]
+        )
+        db.session.commit()
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count_statement)
+
+    assert count == 2490
+    assert Transaction.query.count() == 2500
+    assert len(statements) < 10
+
+
+def test_ingest_dedups_rows_without_external_id(app_context, test_bank_account):
+    """Test rows without bank ids are matched by content fingerprint"""
+    init_categories()
+    day = datetime(2024, 3, 1, 12, 30)
+    rows = [
+        {
+            "amount": 300.0 + i % 50,
+            "description": f"Покупка  {i % 50}",
+            "date": day + timedelta(minutes=i % 50),
+            "merchant": "Магнит",
+            "is_expense": True,
+        }
+        for i in range(150)
+    ]
+
+    # Every row repeats three times; ordinals keep the repeats apart even
+    # when they fall into different batches
+    batches = [rows[:70], rows[70:]]
+    assert ingest_transaction_batches(test_bank_account.id, batches) == 150
+    db.session.commit()
+
+    statements = []
+
+    def count_statement(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append(statement)
+
+    # An overlapping re-import with different case and spacing adds only the
+    # genuinely new fourth repeat of each row, with one probe per batch
+    overlap = [
+        dict(row, description=row["description"].upper().replace("  ", " "))
+        for row in rows + rows[:50]
+    ]
+    event.listen(db.engine, "before_cursor_execute", count_statement)
+    try:
+        count = ingest_transaction_batches(
+            test_bank_account.id, [overlap[:100], overlap[100:]]
+        )
+        db.session.commit()
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count_statement)
+
+    assert count == 50
+    assert Transaction.query.count() == 200
+    assert Transaction.query.filter(Transaction.fingerprint.is_(None)).count() == 0
+    assert len([s for s in statements if "fingerprint IN" in s]) == 2
+
+
+def test_sync_cursor_resumes_and_fetches_only_new(
+    app_context, test_bank_account, monkeypatch
+):
+    """Test the backfill advances the cursor page by page and can resume"""
+    init_categories()
+    windows = []
+
+    async def fake_pages(bank_name, access_token, account_number, since, until):
+        windows.append((since, until))
+        if len(windows) == 3:
+            raise ConnectionError("bank went away")
+        yield [
+            {
+                "external_id": f"tx_{since.timestamp()}",
+                "amount": 100.0,
+                "currency": "RUB",
+                "description": "Покупка",
+                "date": since,
+                "merchant": "Магнит",
+                "is_expense": True,
+            }
+        ]
+
+    monkeypatch.setattr(bank_api, "iter_transaction_pages", fake_pages)
+
+    with pytest.raises(ConnectionError):
+        bank_api.sync_account_transactions("vtb", "token", test_bank_account, days=30)
+    db.session.rollback()
+
+    # Two pages were committed before the failure
+    assert Transaction.query.count() == 2
+    assert test_bank_account.sync_cursor_date == windows[1][1]
+    assert test_bank_account.sync_cursor == f"tx_{windows[1][0].timestamp()}"
+
+    # Resuming starts just before the cursor and finishes the backfill
+    overlap = timedelta(days=bank_api.SYNC_OVERLAP_DAYS)
+    count = bank_api.sync_account_transactions("vtb", "token", test_bank_account)
+    assert windows[3][0] == windows[1][1] - overlap
+    assert count == len(windows) - 3
+    assert Transaction.query.count() == len(windows) - 1
+
+    # A follow-up sync only asks for the time since the last one, plus the
+    # overlap for transactions posted late
+    cursor = test_bank_account.sync_cursor_date
+    windows.clear()
+    bank_api.sync_account_transactions("vtb", "token", test_bank_account)
+    assert len(windows) == 1
+    assert windows[0][0] == cursor - overlap
+    assert (windows[0][1] - cursor).total_seconds() < 60
+
+
+def test_accounts_are_fetched_concurrently(app_context, test_user, monkeypatch):
+    """Test N accounts cost about one round trip against a slow bank API"""
+    init_categories()
+    delay = 0.3
+    now = datetime.utcnow()
+    accounts = [
+        BankAccount(
+            user_id=test_user.id,
+            bank_name="tinkoff",
+            account_number=f"4000{i:04d}",
+            account_type="Checking",
+            sync_cursor_date=now - timedelta(days=1),
+        )
+        for i in range(5)
+    ]
+    db.session.add_all(accounts)
+    db.session.commit()
+
+    class SlowBankHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            account_number = self.path.split("/")[2]
+            body = json.dumps(
+                {
+                    "transactions": [
+                        {
+                            "id": f"{account_number}-1",
+                            "amount": -250.5,
+                            "currency": "RUB",
+                            "description": "Покупка",
+                            "date": "2025-01-15T12:00:00",
+                            "merchant": {"name": "Пятерочка"},
+                        }
+                    ]
+                }
+            ).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowBankHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    adapter = get_adapter("tinkoff")
+    monkeypatch.setattr(adapter, "live", True)
+    monkeypatch.setattr(adapter, "base_url", f"http://127.0.0.1:{server.server_port}")
+
+    try:
+        start = time.perf_counter()
+        count = bank_api.sync_accounts_transactions("tinkoff", "token", accounts)
+        elapsed = time.perf_counter() - start
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert count == 5
+    transaction = Transaction.query.filter_by(external_id="40000000-1").one()
+    assert transaction.amount == 250.5
+    assert transaction.is_expense is True
+    assert transaction.merchant == "Пятерочка"
+    assert all(
+        account.sync_cursor == f"{account.account_number}-1" for account in accounts
+    )
+    assert elapsed < delay * 2
+
+
+def _rss_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+@pytest.mark.slow
+@pytest.mark.skipif(not os.path.exists("/proc/self/statm"), reason="Linux only")
+def test_streaming_sync_memory_stays_flat(app_context, test_user, monkeypatch):
+    """Test a 1M transaction backfill runs within a fixed RSS budget"""
+    init_categories()
+    page_size = 1000
+    pages_per_window = 10
+    windows = 100
+
+    class SyntheticBank(BankAdapter):
+        bank_id = "synthetic"
+
+        async def iter_transaction_pages(
+            self, access_token, account_number, since, until
+        ):
+            step = (until - since) / (page_size * pages_per_window)
+            for p in range(pages_per_window):
+                yield [
+                    {
+                        "external_id": f"syn-{since.timestamp()}-{p}-{i}",
+                        "amount": 100.0 + i,
+                        "currency": "RUB",
+                        "description": "Покупка",
+                        "date": since + step * (p * page_size + i),
+                        "merchant": "Магнит" if i % 2 else "OZON",
+                        "is_expense": True,
+                    }
+                    for i in range(page_size)
+                ]
+
+    monkeypatch.setitem(bank_adapters._adapters, "synthetic", SyntheticBank())
+    account = BankAccount(
+        user_id=test_user.id,
+        bank_name="synthetic",
+        account_number="1",
+        account_type="Business",
+    )
+    db.session.add(account)
+    db.session.commit()
+
+    samples = []
+    count = bank_api.sync_accounts_transactions(
+        "synthetic",
+        "token",
+        [account],
+        days=bank_api.SYNC_PAGE_DAYS * windows,
+        on_progress=lambda fraction: samples.append(_rss_bytes()),
+    )
+
+    assert count == windows * pages_per_window * page_size
+    # Allow for warm-up, then memory must not grow with the history
+    baseline = samples[5]
+    assert max(samples) - baseline < 64 * 1024 * 1024
+
+
+def test_adapter_follows_mock_bank_pagination(monkeypatch):
+    """Test the live adapter reads every page served by the mock bank"""
+    mock = MockBank(latency_ms=0, page_size=7, transactions_per_day=3)
+    server = make_server(mock, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    adapter = get_adapter("sber")
+    monkeypatch.setattr(adapter, "live", True)
+    monkeypatch.setattr(
+        adapter, "base_url", f"http://127.0.0.1:{server.server_port}/sber"
+    )
+
+    try:
+        token = bank_api.connect_to_bank("sber", {"username": "demo"})
+        accounts = bank_api.fetch_account_data("sber", token.access_token)
+        account_number = accounts[0]["account_number"]
+        since = mock.now - timedelta(days=10)
+
+        transactions = bank_api.fetch_transactions(
+            "sber", token.access_token, account_number, since=since, until=mock.now
+        )
+        again = bank_api.fetch_transactions(
+            "sber", token.access_token, account_number, since=since, until=mock.now
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert token.access_token == "mock-sber-demo"
+    assert token.refresh_token == "refresh-sber-demo"
+    assert token.expires_at > datetime.utcnow()
+    assert len(accounts) == 2
+    assert 27 <= len(transactions) <= 33
+    assert len({t["external_id"] for t in transactions}) == len(transactions)
+    assert all(since <= t["date"] < mock.now for t in transactions)
+    # History is deterministic, so repeated syncs deduplicate
+    assert [t["external_id"] for t in again] == [t["external_id"] for t in transactions]
+    # auth + accounts + two fetches of ceil(n / 7) pages
+    assert mock.requests == 2 + 2 * -(-len(transactions) // 7)
+
+
+def test_ttl_cache_expires_and_evicts():
+    now = [0.0]
+    cache = TTLCache(ttl=10, maxsize=2, clock=lambda: now[0])
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("c", 3)
+    assert cache.get("a") is None  # evicted, oldest first
+    assert cache.get("b") == 2
+    now[0] = 10
+    assert cache.get("b") is None and cache.get("c") is None
+
+
+def test_token_refreshed_ahead_of_expiry(app_context, test_user, monkeypatch):
+    """Test expiring tokens are renewed in the background for all accounts"""
+    mock = MockBank(latency_ms=0, token_ttl=3600)
+    server = make_server(mock, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    adapter = get_adapter("tinkoff")
+    monkeypatch.setattr(adapter, "live", True)
+    monkeypatch.setattr(
+        adapter, "base_url", f"http://127.0.0.1:{server.server_port}/tinkoff"
+    )
+    invalidate_accounts()
+
+    try:
+        token = bank_api.connect_to_bank("tinkoff", {"username": "anna"})
+        accounts = bank_api.save_bank_accounts(
+            test_user.id,
+            "tinkoff",
+            token,
+            bank_api.fetch_account_data("tinkoff", token.access_token),
+        )
+        # The account list is reused while the token is the same
+        for account in accounts:
+            bank_api.fetch_account_data("tinkoff", account.access_token)
+        assert mock.requests == 2
+
+        # 55 minutes later the hour-long token is within the 10 minute margin
+        offset = [timedelta(minutes=55)]
+        manager = TokenManager(
+            refresh_margin=timedelta(minutes=10),
+            clock=lambda: datetime.utcnow() + offset[0],
+        )
+        assert manager.refresh_expiring() == 1
+        assert mock.requests == 3
+        offset[0] = timedelta(0)
+        assert manager.refresh_expiring() == 0
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    for account in accounts:
+        db.session.refresh(account)
+        assert account.refresh_token == "refresh-tinkoff-anna"
+        assert account.token_expires_at > datetime.utcnow() + timedelta(minutes=59)
+    # Without a refresh token an expired token cannot be renewed
+    accounts[0].refresh_token = None
+    accounts[0].token_expires_at = datetime.utcnow()
+    with pytest.raises(ValueError):
+        manager.get_access_token(accounts[0])
+
+
+def test_adapter_retries_then_circuit_opens():
+    """Test transient errors are retried and a broken bank fails fast"""
+    statuses = [503, 503, 200]
+    hits = []
+
+    class FlakyBankHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            hits.append(self.path)
+            status = statuses.pop(0) if statuses else 503
+            body = json.dumps({"accounts": []}).encode()
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyBankHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    adapter = HttpBankAdapter(
+        "flaky",
+        "Flaky",
+        "",
+        f"http://127.0.0.1:{server.server_port}",
+        max_retries=2,
+        backoff_base=0.01,
+        live=True,
+    )
+
+    try:
+        # Two 503s are retried before the success
+        assert run_sync(adapter.fetch_accounts("token")) == []
+        assert len(hits) == 3
+
+        # Persistent failures open the circuit after five attempts...
+        with pytest.raises(BankAPIError):
+            run_sync(adapter.fetch_accounts("token"))
+        with pytest.raises(BankUnavailableError):
+            run_sync(adapter.fetch_accounts("token"))
+        assert len(hits) == 8
+        assert adapter.breaker.state == "open"
+
+        # ...after which calls fail without reaching the bank
+        with pytest.raises(BankUnavailableError):
+            run_sync(adapter.fetch_accounts("token"))
+        assert len(hits) == 8
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_cancelled_trial_does_not_lock_circuit():
+    """Test a half-open trial that is cancelled lets the next call through"""
+    release = threading.Event()
+
+    class HangingBankHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            release.wait(5)
+            body = json.dumps({"accounts": []}).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), HangingBankHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    adapter = HttpBankAdapter(
+        "hanging",
+        "Hanging",
+        "",
+        f"http://127.0.0.1:{server.server_port}",
+        max_retries=0,
+        live=True,
+    )
+    adapter.breaker.opened_at = time.monotonic() - adapter.breaker.reset_seconds
+
+    try:
+        assert adapter.breaker.state == "half_open"
+        with pytest.raises(TimeoutError):
+            run_sync(adapter.fetch_accounts("token"), timeout=0.2)
+        # The cancellation reaches the coroutine on the loop thread
+        for _ in range(50):
+            if not adapter.breaker.trial_running:
+                break
+            time.sleep(0.01)
+        assert not adapter.breaker.trial_running
+
+        release.set()
+        assert run_sync(adapter.fetch_accounts("token"), timeout=5) == []
+        assert adapter.breaker.state == "closed"
+    finally:
+        release.set()
+        server.shutdown()
+        server.server_close()
+
+
+def test_token_bucket_refills_up_to_capacity():
+    """Test the bucket allows a burst, then refills at its rate"""
+    now = [0.0]
+    bucket = TokenBucket(rate=2.0, capacity=5, clock=lambda: now[0])
+
+    assert bucket.take(10) == 5
+    assert bucket.available() == 0
+    now[0] = 1.0
+    assert bucket.take(10) == 2
+    now[0] = 100.0
+    assert bucket.available() == 5
+
+
+def test_scheduler_dispatches_stale_accounts_within_rate_limit(app_context, test_user):
+    """Test the scheduler queues the most stale accounts first, once each"""
+    now = datetime.utcnow()
+    for i, hours in enumerate([None, 5, 3, 2, 0]):
+        db.session.add(
+            BankAccount(
+                user_id=test_user.id,
+                bank_name="vtb",
+                account_number=f"acc{i}",
+                account_type="Checking",
+                last_sync=now - timedelta(hours=hours) if hours is not None else None,
+            )
+        )
+    db.session.commit()
+
+    clock = [0.0]
+    scheduler = SyncScheduler(
+        interval_minutes=60, default_rate_per_minute=60, burst=2, clock=lambda: clock[0]
+    )
+
+    assert scheduler.tick() == 2
+    queued = [
+        db.session.get(BankAccount, job.account_id).account_number
+        for job in SyncJob.query.order_by(SyncJob.id)
+    ]
+    assert queued == ["acc0", "acc1"]
+
+    # Bucket is empty until it refills
+    assert scheduler.tick() == 0
+    clock[0] = 60.0
+    assert scheduler.tick() == 2
+    # acc4 was synced recently; everything else already has a job
+    assert scheduler.tick() == 0
+    assert SyncJob.query.count() == 4
+
+    scheduler.update_gauges()
+    metrics = scheduler.metrics.render()
+    assert 'finassistant_sync_jobs_dispatched_total{bank="vtb"} 4' in metrics
+    assert "finassistant_sync_queue_depth 4" in metrics
+
+
+CSV_STATEMENT = (
+    "Дата операции;Сумма;Валюта;Описание;Контрагент\n"
+    "01.03.2024;-1 250,50;RUB;Покупка продуктов;Пятёрочка\n"
+    "01.03.2024;-1 250,50;RUB;Покупка продуктов;Пятёрочка\n"
+    "02.03.2024;45 000,00;RUB;Зачисление зарплаты;\n"
+    "не дата;-10,00;RUB;Битая строка;\n"
+)
+
+OFX_STATEMENT = """OFXHEADER:100
+DATA:OFXSGML
+
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><CURDEF>USD
+<BANKTRANLIST>
+<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20240305120000<TRNAMT>-42.10<FITID>A1<NAME>Starbucks<MEMO>Coffee
+</STMTTRN>
+<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20240306<TRNAMT>1000.00<FITID>A2<NAME>Salary
+</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+
+CAMT_STATEMENT = """<?xml version="1.0" encoding="UTF-8"?>
+<Document xmlns="urn:iso:std:iso:20022:tech:xsd:camt.053.001.02">
+<BkToCstmrStmt><Stmt><Acct><Ccy>EUR</Ccy></Acct>
+<Ntry><Amt Ccy="EUR">12.50</Amt><CdtDbtInd>DBIT</CdtDbtInd>
+<BookgDt><Dt>2024-03-07</Dt></BookgDt><AcctSvcrRef>REF-1</AcctSvcrRef>
+<NtryDtls><TxDtls><RltdPties><Cdtr><Nm>Lidl</Nm></Cdtr></RltdPties>
+<RmtInf><Ustrd>Groceries</Ustrd></RmtInf></TxDtls></NtryDtls></Ntry>
+</Stmt></BkToCstmrStmt></Document>
+"""
+
+
+def test_parse_amount_separators():
+    """Test the last of ',' and '.' is taken as the decimal point"""
+    assert parse_amount("-1 250,50") == -1250.5
+    assert parse_amount("1\xa0234,5") == 1234.5
+    assert parse_amount("1,234.56") == 1234.56
+    assert parse_amount("1.234,56") == 1234.56
+    assert parse_amount("-1.234.567,89") == -1234567.89
+    assert parse_amount("1234.56") == 1234.56
+
+
+def test_import_csv_statement_is_idempotent(app_context, test_bank_account):
+    init_categories()
+    data = CSV_STATEMENT.encode("cp1251")
+
+    stats = import_statement(test_bank_account, io.BytesIO(data), "statement.csv")
+    db.session.commit()
+
+    # Identical rows are separate purchases; the bad row is skipped
+    assert stats == {"rows": 3, "skipped": 1, "imported": 3}
+    stored = Transaction.query.order_by(Transaction.transaction_date).all()
+    assert [t.amount for t in stored] == [1250.5, 1250.5, 45000.0]
+    assert stored[0].merchant == "Пятёрочка" and stored[0].is_expense
+    assert not stored[2].is_expense
+
+    # Re-importing the same file adds nothing
+    stats = import_statement(test_bank_account, io.BytesIO(data), "statement.csv")
+    db.session.commit()
+    assert stats["imported"] == 0
+    assert Transaction.query.count() == 3
+
+
+def test_import_ofx_and_camt_statements(app_context, test_bank_account):
+    init_categories()
+
+    stats = import_statement(
+        test_bank_account, io.BytesIO(OFX_STATEMENT.encode()), "statement.ofx"
+    )
+    assert stats["imported"] == 2
+    stats = import_statement(
+        test_bank_account, io.BytesIO(CAMT_STATEMENT.encode()), "statement.xml"
+    )
+    assert stats["imported"] == 1
+    db.session.commit()
+
+    coffee = Transaction.query.filter_by(merchant="Starbucks").one()
+    assert coffee.amount == 42.10 and coffee.is_expense
+    assert coffee.currency == "USD"
+    lidl = Transaction.query.filter_by(merchant="Lidl").one()
+    assert lidl.amount == 12.5 and lidl.currency == "EUR"
+    assert lidl.description == "Groceries"
+
+    with pytest.raises(StatementFormatError):
+        import_statement(
+            test_bank_account, io.BytesIO(b"<Document><Stmt>"), "broken.xml"
+        )
+
+
 def test_get_supported_banks():
     """Test getting supported banks"""
     banks = get_supported_banks()
@@ -107,6 +938,504 @@ def test_get_supported_banks():
     assert "Сбербанк" in bank_names
 
 
+def test_synthetic_dataset_is_reproducible(app_context):
+    """Same seed gives the same rows; loading a dataset twice adds nothing"""
+    init_categories()
+    first = pd.concat(generate_transactions(1500, seed=7, users=5, days=60))
+    again = pd.concat(generate_transactions(1500, seed=7, users=5, days=60))
+    other = pd.concat(generate_transactions(1500, seed=8, users=5, days=60))
+
+    pd.testing.assert_frame_equal(first, again)
+    assert not first["amount"].equals(other["amount"])
+    assert len(first) == 1500 and first["external_id"].is_unique
+    assert first["account"].between(0, 9).all()
+    assert (first["amount"] > 0).all()
+    assert (first.loc[~first["is_expense"], "category"] == "Доход").all()
+    assert first["transaction_date"].min() >= pd.Timestamp(DEFAULT_START)
+
+    dataset = {"seed": 7, "users": 5, "accounts_per_user": 2}
+    rows = generate_transactions(1500, seed=7, users=5, days=60)
+    assert load_into_database(rows, **dataset) == 1500
+    rows = generate_transactions(1500, seed=7, users=5, days=60)
+    load_into_database(rows, **dataset)
+    assert Transaction.query.count() == 1500
+    assert BankAccount.query.filter_by(bank_name="synthetic").count() == 10
+
+
+def test_migrations_upgrade_pre_migration_database(tmp_path):
+    """An old create_all() schema is brought up to date, once"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE user (id INTEGER PRIMARY KEY)"))
+        connection.execute(
+            text(
+                "CREATE TABLE bank_account (id INTEGER PRIMARY KEY, "
+                "user_id INTEGER NOT NULL, bank_name VARCHAR(100) NOT NULL, "
+                "account_number VARCHAR(100) NOT NULL, "
+                "account_type VARCHAR(50) NOT NULL, access_token VARCHAR(1000), "
+                "balance FLOAT, currency VARCHAR(3), last_sync DATETIME, "
+                "created_at DATETIME)"
+            )
+        )
+        connection.execute(
+            text(
+                'CREATE TABLE "transaction" (id INTEGER PRIMARY KEY, '
+                "account_id INTEGER NOT NULL, external_id VARCHAR(100) UNIQUE, "
+                "amount FLOAT NOT NULL, currency VARCHAR(3), "
+                "description VARCHAR(255), transaction_date DATETIME NOT NULL, "
+                "merchant VARCHAR(100), category_id INTEGER, is_expense BOOLEAN, "
+                "created_at DATETIME)"
+            )
+        )
+        connection.execute(text("INSERT INTO user (id) VALUES (7)"))
+        connection.execute(
+            text(
+                "INSERT INTO bank_account (id, user_id, bank_name, account_number, "
+                "account_type) VALUES (3, 7, 'Сбербанк', '40817', 'card')"
+            )
+        )
+        connection.execute(
+            text(
+                'INSERT INTO "transaction" (account_id, amount, transaction_date) '
+                "VALUES (3, 100.0, '2024-05-01 10:00:00')"
+            )
+        )
+
+    assert current_version(engine) == 0
+    assert upgrade(engine) == [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+    assert upgrade(engine) == []
+    assert current_version(engine) == 10
+
+    inspector = inspect(engine)
+    assert {"sync_job", "merchant_category_override"} <= set(
+        inspector.get_table_names()
+    )
+    account_columns = {c["name"] for c in inspector.get_columns("bank_account")}
+    assert {"sync_cursor", "refresh_token", "token_expires_at"} <= account_columns
+    indexes = {i["name"]: i for i in inspector.get_indexes("transaction")}
+    assert indexes["ix_transaction_fingerprint"]["unique"]
+    assert {
+        "ix_transaction_user_date",
+        "ix_transaction_account_date",
+        "ix_transaction_user_category_date",
+        "ix_transaction_expense_user_date",
+    } <= set(indexes)
+    assert "ix_transaction_expense_account_date" not in indexes
+    with engine.connect() as connection:
+        user_ids = connection.execute(text('SELECT user_id FROM "transaction"'))
+        assert user_ids.scalars().all() == [7]
+        rollup = connection.execute(
+            text("SELECT user_id, day, total, count FROM daily_spending_rollup")
+        )
+        assert rollup.all() == [(7, "2024-05-01", 100.0, 1)]
+        summary = connection.execute(
+            text(
+                "SELECT user_id, month, count, min_amount, max_amount, sum_squares "
+                "FROM monthly_spending_summary"
+            )
+        )
+        assert summary.all() == [(7, "2024-05-01", 1, 100.0, 100.0, 10000.0)]
+    engine.dispose()
+
+
+def test_transaction_user_id_follows_account(app_context, test_bank_account):
+    """ORM inserts and bulk ingestion both fill the owner's user_id"""
+    init_categories()
+    db.session.add(
+        Transaction(
+            account_id=test_bank_account.id,
+            amount=10.0,
+            description="Кофе",
+            transaction_date=datetime(2024, 5, 1),
+        )
+    )
+    ingest_transactions(
+        test_bank_account.id,
+        [
+            {
+                "external_id": "user-id-1",
+                "amount": 20.0,
+                "description": "Такси",
+                "date": datetime(2024, 5, 2),
+            }
+        ],
+    )
+    db.session.commit()
+
+    user_ids = {t.user_id for t in Transaction.query.all()}
+    assert user_ids == {test_bank_account.user_id}
+
+
+def test_daily_rollup_follows_ingest_and_edits(app_context, test_bank_account):
+    """Incremental rollup updates match a rebuild from the transactions"""
+    init_categories()
+
+    def snapshot():
+        return sorted(
+            (r.user_id, r.day, r.category_id, r.is_expense, round(r.total, 2), r.count)
+            for r in DailySpendingRollup.query.all()
+        )
+
+    batch = [
+        {
+            "external_id": "rollup-1",
+            "amount": 300.0,
+            "description": "Продукты Пятерочка",
+            "merchant": "Пятерочка",
+            "date": datetime(2024, 5, 1, 9),
+        },
+        {
+            "external_id": "rollup-2",
+            "amount": 200.0,
+            "description": "Продукты Пятерочка",
+            "merchant": "Пятерочка",
+            "date": datetime(2024, 5, 1, 19),
+        },
+        {
+            "external_id": "rollup-3",
+            "amount": 5000.0,
+            "description": "Зарплата",
+            "date": datetime(2024, 5, 2),
+            "is_expense": False,
+        },
+    ]
+    assert ingest_transactions(test_bank_account.id, [dict(t) for t in batch]) == 3
+    assert ingest_transactions(test_bank_account.id, [dict(t) for t in batch]) == 0
+    db.session.commit()
+
+    user_id = test_bank_account.user_id
+    assert daily_spending(user_id, datetime(2024, 5, 1).date()) == [
+        (datetime(2024, 5, 1).date(), 500.0)
+    ]
+    assert category_spending(user_id, datetime(2024, 5, 1).date()) == [
+        ("Продукты", 500.0)
+    ]
+
+    # Recategorize one purchase, delete another, add one through the ORM
+    moved = Transaction.query.filter_by(external_id="rollup-1").one()
+    moved.category_id = Category.query.filter_by(name="Рестораны").one().id
+    db.session.delete(Transaction.query.filter_by(external_id="rollup-2").one())
+    db.session.add(
+        Transaction(
+            account_id=test_bank_account.id,
+            amount=70.0,
+            description="Кофе",
+            transaction_date=datetime(2024, 5, 3),
+        )
+    )
+    db.session.commit()
+
+    incremental = snapshot()
+    rebuild_daily_rollup()
+    db.session.commit()
+    assert incremental == snapshot()
+    assert category_spending(user_id, datetime(2024, 5, 1).date()) == [
+        ("Рестораны", 300.0)
+    ]
+
+
+def test_monthly_summary_drives_analysis(app_context, test_bank_account):
+    """Analysis statistics come from the monthly summary, kept exact on edits"""
+    init_categories()
+
+    def snapshot():
+        return sorted(
+            (
+                r.month,
+                r.category_id,
+                r.is_expense,
+                round(r.total, 2),
+                r.count,
+                r.min_amount,
+                r.max_amount,
+                round(r.sum_squares, 2),
+            )
+            for r in MonthlySpendingSummary.query.all()
+        )
+
+    may = [100.0, 120.0, 110.0, 105.0, 95.0]
+    june = [90.0, 130.0, 115.0, 5000.0]
+    batch = [
+        {
+            "external_id": f"summary-{month}-{day}",
+            "amount": amount,
+            "description": "Продукты Пятерочка",
+            "date": datetime(2024, month, day + 1, 12),
+        }
+        for month, amounts in ((5, may), (6, june))
+        for day, amount in enumerate(amounts)
+    ]
+    batch.append(
+        {
+            "external_id": "summary-salary",
+            "amount": 50000.0,
+            "description": "Зарплата",
+            "date": datetime(2024, 5, 25),
+            "is_expense": False,
+        }
+    )
+    ingest_transactions(test_bank_account.id, batch)
+    db.session.commit()
+
+    user_id = test_bank_account.user_id
+    summary = spending_summary(user_id, datetime(2024, 6, 20).date())
+    expenses = may + june
+    assert summary["transactions_count"] == 10
+    assert summary["total_spent"] == pytest.approx(sum(expenses))
+    assert summary["total_income"] == 50000.0
+    assert summary["prev_month_spent"] == pytest.approx(sum(may))
+    assert summary["current_month_spent"] == pytest.approx(sum(june))
+    assert summary["month_over_month_change"] == pytest.approx(
+        (sum(june) - sum(may)) / sum(may) * 100
+    )
+    assert summary["expense_mean"] == pytest.approx(np.mean(expenses))
+    assert summary["expense_std"] == pytest.approx(np.std(expenses, ddof=1))
+
+    results = analyze_spending(user_id, datetime(2024, 6, 20))
+    assert [t["amount"] for t in results["unusual_transactions"]] == [5000.0]
+    assert results["avg_transaction_amount"] == pytest.approx(np.mean(expenses))
+    assert results["top_spending_categories"][0]["name"] == "Продукты"
+
+    # Deleting June's smallest expense moves the month's minimum
+    db.session.delete(Transaction.query.filter_by(external_id="summary-6-0").one())
+    db.session.commit()
+    june_row = MonthlySpendingSummary.query.filter_by(
+        month=datetime(2024, 6, 1).date(), is_expense=True
+    ).one()
+    assert (june_row.count, june_row.min_amount) == (3, 115.0)
+
+    incremental = snapshot()
+    rebuild_monthly_summary()
+    db.session.commit()
+    assert incremental == snapshot()
+
+
+def test_partition_months(app_context):
+    """Partition naming and month arithmetic; SQLite stays unpartitioned"""
+    may = month_floor(datetime(2024, 5, 31, 23, 59))
+    assert partition_name(may) == "transaction_y2024m05"
+    assert add_months(may, 8) == datetime(2025, 1, 1).date()
+    assert add_months(may, -5) == datetime(2023, 12, 1).date()
+    assert maintain_partitions() == ([], [])
+
+
+def test_recent_activity_bounds_latest_transactions(app_context, test_bank_account):
+    """The rollup's recent days hold the requested number of transactions"""
+    for day, count in ((1, 3), (2, 1), (5, 2)):
+        for _ in range(count):
+            db.session.add(
+                Transaction(
+                    account_id=test_bank_account.id,
+                    amount=10.0,
+                    description="Кофе",
+                    transaction_date=datetime(2024, 5, day, 12),
+                )
+            )
+    db.session.commit()
+
+    user_id = test_bank_account.user_id
+    assert recent_activity_start(user_id, 2) == datetime(2024, 5, 5).date()
+    assert recent_activity_start(user_id, 3) == datetime(2024, 5, 2).date()
+    assert recent_activity_start(user_id, 10) == datetime(2024, 5, 1).date()
+    assert recent_activity_start(user_id + 1, 5) is None
+
+
+def test_archive_moves_old_transactions_to_parquet(
+    app_context, test_bank_account, tmp_path, monkeypatch
+):
+    """Archived transactions leave the table but stay in totals and history"""
+    pytest.importorskip("pyarrow")
+    monkeypatch.setattr("services.transaction_archive.ARCHIVE_DIR", str(tmp_path))
+    init_categories()
+    account_id = test_bank_account.id
+    user_id = test_bank_account.user_id
+    rows = [
+        ("old-1", datetime(2022, 3, 5), 300.0, "Снятие наличных", ""),
+        ("old-2", datetime(2022, 11, 20), 450.0, "Покупка", "Пятерочка"),
+        ("old-3", datetime(2023, 12, 31, 23), 500.0, "Покупка", "Пятерочка"),
+        ("new-1", datetime(2024, 6, 1), 700.0, "Покупка", "Пятерочка"),
+    ]
+    ingest_transactions(
+        account_id,
+        [
+            {
+                "external_id": external_id,
+                "date": date,
+                "amount": amount,
+                "description": description,
+                "merchant": merchant,
+            }
+            for external_id, date, amount, description, merchant in rows
+        ],
+    )
+    db.session.commit()
+
+    archived = archive_transactions(older_than_months=3, today=datetime(2024, 6, 15))
+    assert archived == 3
+    assert [t.external_id for t in Transaction.query] == ["new-1"]
+    assert archived_years(user_id, LocalArchiveStore()) == [2022, 2023]
+    assert spending_summary(user_id)["transactions_count"] == 4
+
+    history = transaction_history(user_id)
+    assert history["amount"].tolist() == [300.0, 450.0, 500.0, 700.0]
+    assert len(transaction_history(user_id, since=datetime(2023, 1, 1))) == 2
+    assert analyze_transactions(history)["total_spent"] == pytest.approx(1950.0)
+    assert history_range(user_id) == (datetime(2022, 3, 5), datetime(2024, 6, 1))
+    assert merchant_monthly_spending(user_id)["Пятерочка"] == [700.0]
+    assert sorted(
+        merchant_monthly_spending(user_id, include_archive=True)["Пятерочка"]
+    ) == [
+        450.0,
+        500.0,
+        700.0,
+    ]
+    assert cash_withdrawn(user_id) == 0
+    assert cash_withdrawn(user_id, include_archive=True) == pytest.approx(300.0)
+    # Without pyarrow the reports fall back to the table
+    with monkeypatch.context() as patch:
+        patch.setattr("services.recommendation_engine.archive_available", lambda: False)
+        patch.setattr("services.transaction_archive.archive_available", lambda: False)
+        assert cash_withdrawn(user_id, include_archive=True) == 0
+        assert history_range(user_id) == (datetime(2024, 6, 1), datetime(2024, 6, 1))
+
+    # Importing the archived rows again adds nothing
+    again = [{"external_id": "old-2", "date": datetime(2022, 11, 20), "amount": 1.0}]
+    again[0]["description"] = "Покупка"
+    assert ingest_transactions(account_id, again) == 0
+
+    # Removing a late import from an archived month keeps the archived rows
+    late = [{"external_id": "late-1", "date": datetime(2023, 12, 15), "amount": 9.0}]
+    late[0]["description"] = "Покупка"
+    assert ingest_transactions(account_id, late) == 1
+    db.session.commit()
+    db.session.delete(Transaction.query.filter_by(external_id="late-1").one())
+    db.session.commit()
+    december = MonthlySpendingSummary.query.filter_by(
+        user_id=user_id, month=datetime(2023, 12, 1).date()
+    ).one()
+    assert (december.count, december.total) == (1, 500.0)
+
+    # A rebuild from the table puts the archived history back
+    rebuild_daily_rollup()
+    rebuild_monthly_summary()
+    assert add_archive_to_rollups() == 3
+    db.session.commit()
+    assert spending_summary(user_id)["transactions_count"] == 4
+
+
+def test_ai_recommendations_without_stored_rows(
+    app_context, test_bank_account, monkeypatch
+):
+    """Counts left only in the summary give an N/A date range, not a fallback"""
+    ingest_transactions(
+        test_bank_account.id,
+        [
+            {
+                "external_id": "gone-1",
+                "date": datetime(2022, 3, 5),
+                "amount": 100.0,
+                "description": "Покупка",
+            }
+        ],
+    )
+    db.session.commit()
+    # Rows left in a detached partition are in neither the table nor the archive
+    db.session.execute(Transaction.__table__.delete())
+    db.session.commit()
+
+    sent = []
+    monkeypatch.setattr("services.ai_recommendation.ai_api_active", False)
+    monkeypatch.setattr(
+        "services.ai_recommendation.get_rule_based_recommendations",
+        lambda data: sent.append(data) or [],
+    )
+    assert generate_ai_recommendations(test_bank_account.user_id) == (0, False)
+    assert sent[0]["date_range"] == {"start": "N/A", "end": "N/A"}
+
+
+def test_scheduler_queues_archive_jobs_for_the_worker(
+    app_context, test_bank_account, tmp_path, monkeypatch
+):
+    """The scheduler only queues archive jobs; the worker runs them"""
+    pytest.importorskip("pyarrow")
+    monkeypatch.setattr("services.transaction_archive.ARCHIVE_DIR", str(tmp_path))
+    monkeypatch.setattr("services.transaction_archive.ARCHIVE_AFTER_MONTHS", 3)
+    monkeypatch.setattr("services.sync_scheduler.ARCHIVE_AFTER_MONTHS", 3)
+    user_id = test_bank_account.user_id
+    rows = [("old-1", datetime(2020, 5, 1)), ("new-1", datetime.utcnow())]
+    ingest_transactions(
+        test_bank_account.id,
+        [
+            {
+                "external_id": external_id,
+                "date": date,
+                "amount": 100.0,
+                "description": "Покупка",
+            }
+            for external_id, date in rows
+        ],
+    )
+    db.session.commit()
+
+    scheduler = SyncScheduler()
+    assert scheduler.queue_archive_jobs() == 1
+    # The user's job is still queued
+    assert scheduler.queue_archive_jobs() == 0
+    assert Transaction.query.count() == 2
+
+    job = run_next_job("test-worker")
+    assert (job.kind, job.status, job.transaction_count) == ("archive", "succeeded", 1)
+    assert [t.external_id for t in Transaction.query] == ["new-1"]
+    assert archived_years(user_id, LocalArchiveStore()) == [2020]
+    assert scheduler.queue_archive_jobs() == 0
+
+
+def test_engine_profiles(tmp_path):
+    """Engine options and per-connection settings follow DATABASE_URL"""
+    # Four workers with two threads and two background processes share 90
+    assert pool_limits(4, 2, 2, 90) == (3, 3)
+    assert pool_limits(40, 1, 2, 90) == (2, 0)
+
+    options = engine_options("postgresql://user@db/finance")
+    assert (options["pool_size"], options["max_overflow"]) == pool_limits()
+    assert "statement_timeout=" in options["connect_args"]["options"]
+    assert engine_options(f"sqlite:///{tmp_path / 'app.db'}") == {}
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    apply_engine_profile(engine)
+    with engine.connect() as connection:
+        pragmas = {
+            name: connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+            for name in ("journal_mode", "synchronous", "busy_timeout")
+        }
+    engine.dispose()
+    # synchronous NORMAL is 1
+    assert pragmas == {
+        "journal_mode": "wal",
+        "synchronous": 1,
+        "busy_timeout": SQLITE_BUSY_TIMEOUT_MS,
+    }
+
+
+def test_dashboard_expense_totals_use_partial_index(app_context):
+    """The category totals query is answered from the expense index"""
+    query = (
+        db.session.query(Category.name, func.sum(Transaction.amount))
+        .join(Transaction, Transaction.category_id == Category.id)
+        .filter(Transaction.user_id == 1)
+        .filter(Transaction.is_expense == True)
+        .filter(Transaction.transaction_date >= datetime(2024, 1, 1))
+        .group_by(Category.name)
+    )
+    sql = query.statement.compile(
+        dialect=db.engine.dialect, compile_kwargs={"literal_binds": True}
+    )
+    plan = " ".join(
+        row[3] for row in db.session.execute(text(f"EXPLAIN QUERY PLAN {sql}"))
+    )
+    assert "COVERING INDEX ix_transaction_expense_user_date" in plan
+
+
 def test_generate_sample_transactions():
     """Test generating sample transactions"""
     transactions = generate_sample_transactions("Тинькофф", "12345678", days=10)
@@ -0,0 +1,19 @@
+import argparse
+from app import app
+from services.job_queue import POLL_INTERVAL, run_worker
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run queued bank sync jobs")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL)
+    parser.add_argument(
+        "--once", action="store_true", help="Exit when the queue is empty"
+    )
+    args = parser.parse_args()
+
+    with app.app_context():
+        run_worker(poll_interval=args.poll_interval, once=args.once)
+
+
+if __name__ == "__main__":
+    main()